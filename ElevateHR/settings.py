@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'ElevateHRApp',
+    'USSD',
 ]
 
 MIDDLEWARE = [
@@ -89,6 +90,61 @@ DATABASES = {
 }
 
 
+# Caches
+# 'ussd' holds USSD session state between hops and 'dashboard' the employee dashboards,
+# create their tables with `python manage.py createcachetable`
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ussd': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ussd_session_cache',
+        'TIMEOUT': 180,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    # Shared by all workers so a signal in one drops the dashboard for every one
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'dashboard_cache',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+
+# Pending registrations awaiting OTP verification
+# BACKEND can be ElevateHRApp.otp_store.SQLiteOTPStore (add 'PATH') to keep them out of the main database
+
+OTP_STORE = {
+    'BACKEND': 'ElevateHRApp.otp_store.DatabaseOTPStore',
+    'TTL': 300,
+    'MAX_ENTRIES': 10000,
+    'MAX_ATTEMPTS': 5,
+}
+
+
+# Africa's Talking SMS delivery report callback, sms/delivery-reports/
+# Reports are answered straight away and held in the worker's memory until they are written, in batches of
+# BUFFER_SIZE or every FLUSH_SECONDS. A clean exit writes what is left. A worker that is killed or crashes
+# loses what it holds, at most BUFFER_SIZE reports received in the last FLUSH_SECONDS, and the provider does
+# not send them again.
+# Callbacks must carry ?token=CALLBACK_TOKEN in the URL registered with Africa's Talking and, when ALLOWED_IPS
+# is set, come from one of those addresses. With no token configured every callback is refused.
+
+SMS_DELIVERY_REPORTS = {
+    'BUFFER_SIZE': 200,
+    'FLUSH_SECONDS': 2,
+    'CALLBACK_TOKEN': os.getenv("AT_CALLBACK_TOKEN", ""),
+    'ALLOWED_IPS': [],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,13 +1,213 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Max
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.views.decorators.http import require_POST
+import os
 from .models import *
+from .bulk_sms import queue_sms_campaign
+from .disbursements import apply_results, bank_totals, fill_batch, issue_bank_file, streaming_bank_file
+from .exports import parse_period, streaming_export
+from .employee_import import IMPORT_COLUMNS, REQUIRED_COLUMNS, import_employees
+from .payroll import claimable_runs, run_payroll
+from .payslip_documents import render_payslips, streaming_documents
+from .reconciliation import reconcile_statement
+from .search import search_filter
+
+
+IMPORT_ERRORS_DIR = 'employee_imports'
+RECONCILIATION_REPORTS_DIR = 'reconciliation_reports'
+# Below this many rows an exact COUNT(*) is cheap enough to keep
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_row_count(model):
+    """
+    The database's own idea of the table size, None when it has none.
+    SQLite keeps no statistics by default, its MAX(rowid) is an index seek and
+    close enough for integer primary keys that are rarely deleted.
+    """
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+    elif connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+            row = cursor.fetchone()
+    elif connection.vendor == 'sqlite' and model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        row = (model._default_manager.aggregate(last=Max('pk'))['last'],)
+    else:
+        return None
+    # Postgres reports -1 for a table that was never analysed
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists page through an estimate instead of running
+    COUNT(*) over the whole table on every request; once a filter or search
+    narrows the queryset the exact count is back
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate >= EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class EmployeeAutocompleteFilter(admin.FieldListFilter):
+    """
+    Filter on an employee foreign key picked through the admin autocomplete
+    view, where the stock related filter lists every employee in the sidebar
+    """
+    template = 'admin/ElevateHRApp/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.attname}__exact"
+        # The select submits an empty value when cleared
+        if params.get(self.lookup_kwarg) in ([''], ''):
+            params.pop(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.lookup_val = self.used_parameters.get(self.lookup_kwarg)
+        if isinstance(self.lookup_val, list):
+            self.lookup_val = self.lookup_val[-1]
+
+        self.widget = AutocompleteSelect(field, model_admin.admin_site, attrs={
+            'class': 'form-control', 'style': 'width: 100%', 'data-placeholder': self.title,
+        })
+        self.widget.choices = forms.ModelChoiceField(field.remote_field.model._default_manager.all()).choices
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def rendered_widget(self):
+        return self.widget.render(self.lookup_kwarg, self.lookup_val, attrs={'id': f"filter_{self.lookup_kwarg}"})
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': "All",
+        }
+
+
+class ChangelistPerformanceMixin:
+    """
+    Shared changelist settings for the large HR tables: no second COUNT(*) for
+    the "of N" total, estimated counts and the autocomplete filter's scripts
+    """
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
+
+
+def export_action(name, export_format, compress=False):
+    """
+    Admin action streaming the selected rows, or everything the changelist filters match
+    """
+    label = f"{export_format.upper()}{' (gzip)' if compress else ''}"
+
+    @admin.action(description=f"Export selected as {label}")
+    def export(modeladmin, request, queryset):
+        return streaming_export(name, export_format, compress=compress, queryset=queryset)
+
+    export.__name__ = f"export_{export_format}{'_gzip' if compress else ''}"
+    return export
+
+
+def export_actions(name):
+    return [export_action(name, 'csv'), export_action(name, 'csv', compress=True), export_action(name, 'ndjson')]
 
 
 # Register your models here.
 @admin.register(Employee)
-class EmployeeAdmin(admin.ModelAdmin):
+class EmployeeAdmin(ChangelistPerformanceMixin, admin.ModelAdmin):
     list_display = ('fname', 'sname', 'employee_ID', 'job_title', 'date_joined')
-    search_fields = ('fname', 'job_title', 'employment_status')
-    list_filter = ('job_title', 'employee_profession', 'gender', 'nationality')
+    search_fields = ('fname', 'lname', 'email', 'job_title')
+    # Only filters with a fixed set of values, job_title is free text and searchable instead
+    list_filter = ('employment_status', 'department', 'employee_profession', 'gender', 'nationality')
+    date_hierarchy = 'date_joined'
+    actions = export_actions('employees')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served from the full-text index instead of a LIKE per search field
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(search_filter(search_term)), False
+
+    # Bulk import from CSV or XLSX
+
+    change_list_template = 'admin/ElevateHRApp/employee/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='ElevateHRApp_employee_import'),
+            path('import/errors/<str:name>/', self.admin_site.admin_view(self.import_errors_view),
+                 name='ElevateHRApp_employee_import_errors'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Import employees",
+            'columns': IMPORT_COLUMNS,
+            'required': REQUIRED_COLUMNS,
+        }
+        if request.method == 'POST' and request.FILES.get('file'):
+            upload = request.FILES['file']
+            try:
+                result = import_employees(upload, upload.name, dry_run=bool(request.POST.get('dry_run')))
+            except ValueError as e:
+                messages.error(request, str(e))
+            else:
+                if result['error_report']:
+                    name = default_storage.save(
+                        f"{IMPORT_ERRORS_DIR}/errors-{timezone.now():%Y%m%d-%H%M%S}.csv",
+                        ContentFile(result['error_report'].encode()),
+                    )
+                    context['error_report_url'] = reverse(
+                        'admin:ElevateHRApp_employee_import_errors', args=[os.path.basename(name)]
+                    )
+                context['result'] = result
+                context['dry_run'] = bool(request.POST.get('dry_run'))
+        return TemplateResponse(request, 'admin/ElevateHRApp/employee/import.html', context)
+
+    def import_errors_view(self, request, name):
+        report = f"{IMPORT_ERRORS_DIR}/{os.path.basename(name)}"
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if not default_storage.exists(report):
+            raise Http404("No such error report")
+        return FileResponse(default_storage.open(report, 'rb'), as_attachment=True, filename=os.path.basename(name))
 
 
 @admin.register(Department)
@@ -25,32 +225,42 @@ class JobPostingAdmin(admin.ModelAdmin):
 
 
 @admin.register(Attendance)
-class AttendanceAdmin(admin.ModelAdmin):
+class AttendanceAdmin(ChangelistPerformanceMixin, admin.ModelAdmin):
     list_display = ('attendance_employee', 'attendance_date', 'attendance_status')
-    search_fields = ('attendance_employee', 'attendance_date', 'attendance_status')
-    list_filter = ('attendance_employee', 'attendance_date', 'attendance_status')
+    list_select_related = ('attendance_employee',)
+    search_fields = ('attendance_employee__fname', 'attendance_employee__lname', 'attendance_status')
+    list_filter = (('attendance_employee', EmployeeAutocompleteFilter), 'attendance_status')
+    date_hierarchy = 'attendance_date'
+    actions = export_actions('attendance')
 
 
 
 @admin.register(LeaveRequest)
-class LeaveRequestAdmin(admin.ModelAdmin):
+class LeaveRequestAdmin(ChangelistPerformanceMixin, admin.ModelAdmin):
     list_display = ('leave_employee', 'leave_type', 'leave_status')
-    search_fields = ('leave_employee', 'leave_type', 'leave_status')
-    list_filter = ('leave_employee', 'leave_type', 'leave_status')
+    list_select_related = ('leave_employee',)
+    search_fields = ('leave_employee__fname', 'leave_employee__lname', 'leave_type', 'leave_status')
+    list_filter = (('leave_employee', EmployeeAutocompleteFilter), 'leave_type', 'leave_status')
+    date_hierarchy = 'leave_start_date'
 
 
 @admin.register(PerformanceReview)
-class PerformanceReviewAdmin(admin.ModelAdmin):
+class PerformanceReviewAdmin(ChangelistPerformanceMixin, admin.ModelAdmin):
     list_display = ('performance_employee', 'performance_reviewer', 'performance_rating')
-    search_fields = ('performance_employee', 'performance_reviewer', 'performance_rating')
-    list_filter = ('performance_employee', 'performance_reviewer', 'performance_rating')
+    list_select_related = ('performance_employee',)
+    search_fields = ('performance_employee__fname', 'performance_employee__lname', 'performance_reviewer')
+    list_filter = (('performance_employee', EmployeeAutocompleteFilter), 'performance_rating')
+    date_hierarchy = 'performance_review_date'
 
 
 @admin.register(Payslip)
-class PayslipAdmin(admin.ModelAdmin):
+class PayslipAdmin(ChangelistPerformanceMixin, admin.ModelAdmin):
     list_display = ('employee', 'pay_period_start', 'pay_period_end', 'status', 'net_salary')
+    list_select_related = ('employee',)
     search_fields = ('employee__fname', 'employee__lname', 'status')
-    list_filter = ('status', 'pay_period_start', 'pay_period_end')
+    list_filter = (('employee', EmployeeAutocompleteFilter), 'status')
+    date_hierarchy = 'pay_period_end'
+    actions = export_actions('payslips') + ['download_documents']
     readonly_fields = ('generated_on', 'gross_salary', 'total_deductions', 'net_salary')
     fieldsets = (
         ('Core Information', {
@@ -67,13 +277,210 @@ class PayslipAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.action(description="Download selected as PDFs (ZIP)")
+    def download_documents(self, request, queryset):
+        return streaming_documents(queryset, "payslips.zip")
+
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ('pay_period_start', 'pay_period_end', 'department', 'status', 'payslips_created',
+                    'payslips_skipped', 'total_net', 'duration_seconds', 'payslips_per_second')
+    list_filter = ('status', 'department')
+    list_select_related = ('department',)
+    date_hierarchy = 'pay_period_end'
+    readonly_fields = ('status', 'created_at', 'started_at', 'completed_at', 'employees_considered',
+                       'payslips_created', 'payslips_skipped', 'total_gross', 'total_deductions', 'total_net',
+                       'duration_seconds', 'error')
+    actions = ['run', 'render_documents']
+
+    @admin.action(description="Run selected payroll runs")
+    def run(self, request, queryset):
+        # Running ones are skipped unless their worker died (claimable_runs)
+        for payroll_run in queryset.filter(claimable_runs()):
+            try:
+                payroll_run = run_payroll(payroll_run)
+            except ValueError as e:
+                messages.warning(request, f"{payroll_run}: {e}")
+                continue
+            if payroll_run.status == 'Failed':
+                messages.error(request, f"{payroll_run}: {payroll_run.error}")
+            else:
+                messages.success(request, (
+                    f"{payroll_run}: {payroll_run.payslips_created} payslips, "
+                    f"{payroll_run.payslips_skipped} already paid, in {payroll_run.duration_seconds:.1f}s"
+                ))
+
+    @admin.action(description="Render payslip PDFs for selected payroll runs")
+    def render_documents(self, request, queryset):
+        result = render_payslips(Payslip.objects.filter(payroll_run__in=queryset))
+        messages.success(request, (
+            f"Rendered {result['rendered']} payslips ({result['changed']} new or changed) in {result['seconds']:.1f}s"
+        ))
+
+
+@admin.register(PayrollLedgerEntry)
+class PayrollLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('pay_period_start', 'pay_period_end', 'department', 'component', 'amount', 'payslips', 'updated_at')
+    list_filter = ('component', 'department')
+    list_select_related = ('department',)
+    date_hierarchy = 'pay_period_end'
+
+    # Posted from the payslips, rebuild_payroll_ledger puts it right
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DisbursementBatch)
+class DisbursementBatchAdmin(admin.ModelAdmin):
+    list_display = ('pay_period_start', 'pay_period_end', 'department', 'status', 'payments', 'total_amount',
+                    'successful', 'failed')
+    list_filter = ('status', 'department')
+    list_select_related = ('department',)
+    date_hierarchy = 'pay_period_end'
+    readonly_fields = ('status', 'created_at', 'sent_at', 'completed_at', 'payments', 'total_amount',
+                       'successful', 'failed')
+    change_form_template = 'admin/ElevateHRApp/disbursementbatch/change_form.html'
+
+    def get_readonly_fields(self, request, obj=None):
+        # The period and department are fixed once the disbursements exist
+        if obj is not None:
+            return ('pay_period_start', 'pay_period_end', 'department') + self.readonly_fields
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            result = fill_batch(obj)
+            messages.success(request, (
+                f"{result['created']} disbursements created and {result['retried']} failed ones queued again"
+            ))
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        batch = self.get_object(request, object_id)
+        if batch is not None:
+            extra_context = {
+                **(extra_context or {}),
+                'bank_totals': bank_totals(batch),
+                'bank_files': range(1, batch.bank_files + 1),
+            }
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    def get_urls(self):
+        return [
+            # POST only, issuing a bank file moves the payments to Processing
+            path('<path:object_id>/bank-file/', self.admin_site.admin_view(require_POST(self.bank_file_view)),
+                 name='ElevateHRApp_disbursementbatch_bank_file'),
+            path('<path:object_id>/bank-file/<int:number>/reissue/',
+                 self.admin_site.admin_view(require_POST(self.reissue_bank_file_view)),
+                 name='ElevateHRApp_disbursementbatch_reissue_bank_file'),
+            path('<path:object_id>/results/', self.admin_site.admin_view(self.results_view),
+                 name='ElevateHRApp_disbursementbatch_results'),
+        ] + super().get_urls()
+
+    def _batch(self, request, object_id):
+        batch = self.get_object(request, object_id)
+        if batch is None:
+            raise Http404("No such disbursement batch")
+        if not self.has_change_permission(request, batch):
+            raise PermissionDenied
+        return batch
+
+    def bank_file_view(self, request, object_id):
+        batch = self._batch(request, object_id)
+        number = issue_bank_file(batch)
+        if number is None:
+            messages.warning(request, "No Pending payments left to send, re-issue an earlier bank file instead")
+            return redirect('admin:ElevateHRApp_disbursementbatch_change', batch.pk)
+        return streaming_bank_file(batch, number)
+
+    def reissue_bank_file_view(self, request, object_id, number):
+        batch = self._batch(request, object_id)
+        if not 1 <= number <= batch.bank_files:
+            raise Http404("No such bank file")
+        return streaming_bank_file(batch, number, reissue=True)
+
+    def results_view(self, request, object_id):
+        batch = self._batch(request, object_id)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': batch,
+            'title': f"Bank results for {batch}",
+        }
+        if request.method == 'POST' and request.FILES.get('file'):
+            try:
+                context['result'] = apply_results(batch, request.FILES['file'])
+            except (ValueError, UnicodeDecodeError) as e:
+                messages.error(request, str(e))
+        return TemplateResponse(request, 'admin/ElevateHRApp/disbursementbatch/results.html', context)
+
+
 @admin.register(Disbursement)
-class DisbursementAdmin(admin.ModelAdmin):
+class DisbursementAdmin(ChangelistPerformanceMixin, admin.ModelAdmin):
     list_display = ('payslip', 'status', 'disbursement_date', 'amount', 'transaction_id')
+    list_select_related = ('payslip__employee',)
     search_fields = ('payslip__employee__fname', 'payslip__employee__lname', 'status', 'transaction_id')
-    list_filter = ('status', 'disbursement_date')
+    list_filter = ('status',)
+    date_hierarchy = 'disbursement_date'
     readonly_fields = ('disbursement_date',)
 
+    # Bank statement reconciliation
+
+    change_list_template = 'admin/ElevateHRApp/disbursement/change_list.html'
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'can_reconcile': self.has_change_permission(request)}
+        return super().changelist_view(request, extra_context)
+
+    def get_urls(self):
+        return [
+            path('reconcile/', self.admin_site.admin_view(self.reconcile_view), name='ElevateHRApp_disbursement_reconcile'),
+            path('reconcile/exceptions/<str:name>/', self.admin_site.admin_view(self.exceptions_view),
+                 name='ElevateHRApp_disbursement_reconcile_exceptions'),
+        ] + super().get_urls()
+
+    def reconcile_view(self, request):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Reconcile a bank statement",
+        }
+        if request.method == 'POST' and request.FILES.get('file'):
+            try:
+                start, end = parse_period(request.POST.get('start'), request.POST.get('end'))
+                if not start or not end:
+                    raise ValueError("The pay period start and end are required")
+                result = reconcile_statement(request.FILES['file'], start, end)
+            except (ValueError, UnicodeDecodeError) as e:
+                messages.error(request, str(e))
+            else:
+                if result['exceptions_report']:
+                    name = default_storage.save(
+                        f"{RECONCILIATION_REPORTS_DIR}/exceptions-{timezone.now():%Y%m%d-%H%M%S}.csv",
+                        ContentFile(result['exceptions_report'].encode()),
+                    )
+                    context['exceptions_report_url'] = reverse(
+                        'admin:ElevateHRApp_disbursement_reconcile_exceptions', args=[os.path.basename(name)]
+                    )
+                context['result'] = result
+        return TemplateResponse(request, 'admin/ElevateHRApp/disbursement/reconcile.html', context)
+
+    def exceptions_view(self, request, name):
+        report = f"{RECONCILIATION_REPORTS_DIR}/{os.path.basename(name)}"
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        if not default_storage.exists(report):
+            raise Http404("No such exceptions report")
+        return FileResponse(default_storage.open(report, 'rb'), as_attachment=True, filename=os.path.basename(name))
+
 
 @admin.register(Training)
 class TrainingAdmin(admin.ModelAdmin):
@@ -81,3 +488,60 @@ class TrainingAdmin(admin.ModelAdmin):
     search_fields = ('training_title', 'training_trainer', 'training_date')
     list_filter = ('training_title', 'training_trainer', 'training_date')
 
+
+
+@admin.register(PosterJob)
+class PosterJobAdmin(admin.ModelAdmin):
+    list_display = ('job_title', 'status', 'variants_completed', 'variants_requested', 'created_at')
+    search_fields = ('job_title',)
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('job_id', 'created_at', 'updated_at')
+
+
+@admin.register(PendingRegistration)
+class PendingRegistrationAdmin(admin.ModelAdmin):
+    list_display = ('phone', 'first_name', 'email', 'attempts', 'expires_at')
+    search_fields = ('phone', 'email')
+    exclude = ('otp_hash', 'password')
+
+
+@admin.register(OutboundSms)
+class OutboundSmsAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'kind', 'status', 'attempts', 'created_at', 'sent_at')
+    search_fields = ('recipient', 'provider_message_id')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('created_at', 'sent_at', 'claimed_at', 'provider_message_id', 'provider_status', 'last_error')
+    actions = ['requeue']
+
+    @admin.action(description="Requeue selected messages")
+    def requeue(self, request, queryset):
+        queryset.exclude(status='Sent').update(status='Queued', attempts=0, next_attempt_at=timezone.now())
+
+
+@admin.register(SmsCampaign)
+class SmsCampaignAdmin(admin.ModelAdmin):
+    list_display = ('name', 'department', 'employment_status', 'status', 'total_recipients', 'sent_count', 'failed_count', 'created_at')
+    search_fields = ('name',)
+    list_filter = ('status', 'department')
+    readonly_fields = ('status', 'total_recipients', 'sent_count', 'failed_count', 'created_at', 'completed_at')
+    actions = ['send_campaigns']
+
+    @admin.action(description="Send selected campaigns")
+    def send_campaigns(self, request, queryset):
+        for campaign in queryset.filter(status='Draft'):
+            queue_sms_campaign(campaign.pk)
+
+
+@admin.register(SmsMessageLog)
+class SmsMessageLogAdmin(admin.ModelAdmin):
+    list_display = ('provider_message_id', 'phone_number', 'source', 'status', 'sent_at', 'latency_seconds')
+    search_fields = ('provider_message_id', 'phone_number')
+    list_filter = ('status', 'source')
+    date_hierarchy = 'sent_at'
+
+
+@admin.register(SmsDeliveryStats)
+class SmsDeliveryStatsAdmin(admin.ModelAdmin):
+    list_display = ('day', 'reports', 'delivered', 'failed', 'unmatched', 'failure_rate', 'average_latency_seconds',
+                    'max_latency_seconds')
+    date_hierarchy = 'day'
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from itertools import islice
+import os
+import threading
+import time
+
+from .delivery_reports import log_sent_messages
+from .models import Employee, SmsCampaign, SmsCampaignRecipient
+from .phone import normalise_phone
+from .sms_outbox import get_sms_service, provider_message_id, SMS_SENDER
+
+
+# Recipients per provider request, concurrent requests, and the provider rate limit
+SMS_BATCH_SIZE = int(os.getenv("SMS_BATCH_SIZE", 100))
+SMS_BATCH_WORKERS = int(os.getenv("SMS_BATCH_WORKERS", 4))
+SMS_REQUESTS_PER_SECOND = float(os.getenv("SMS_REQUESTS_PER_SECOND", 5))
+RECIPIENT_INSERT_BATCH = 1000
+
+_campaign_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sms-campaign")
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the batch senders, refilled at `rate` requests per second
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def target_recipients(department=None, employment_status=None):
+    """
+    (employee_ID, normalised phone) for every matching employee, one entry per phone number
+    """
+    employees = Employee.objects.exclude(phone_number='')
+    if department is not None:
+        employees = employees.filter(department=department)
+    if employment_status:
+        employees = employees.filter(employment_status=employment_status)
+
+    seen = set()
+    for employee_id, phone_number in employees.values_list('employee_ID', 'phone_number').iterator(chunk_size=2000):
+        phone = normalise_phone(phone_number)
+        if phone and phone not in seen:
+            seen.add(phone)
+            yield employee_id, phone
+
+
+def send_batch(campaign_id, message, batch, limiter):
+    limiter.acquire()
+    try:
+        response = get_sms_service().send(message, [phone for _, phone in batch], SMS_SENDER)
+        results = {r.get('number'): r for r in response['SMSMessageData']['Recipients']}
+        error = None
+    except Exception as e:
+        results = {}
+        error = str(e)
+
+    rows = []
+    for employee_id, phone in batch:
+        result = results.get(phone, {})
+        sent = result.get('status') == 'Success'
+        rows.append(SmsCampaignRecipient(
+            campaign_id=campaign_id,
+            employee_id=employee_id,
+            phone_number=phone,
+            status='Sent' if sent else 'Failed',
+            provider_message_id=provider_message_id(result),
+            provider_status=result.get('status'),
+            cost=result.get('cost'),
+            error=None if sent else (error or result.get('status') or 'No result from provider'),
+        ))
+    return rows
+
+
+def send_sms_campaign(campaign_id):
+    """
+    Sends the campaign in provider-sized batches, concurrently within the rate limit,
+    and records per-recipient results with bulk inserts
+    """
+    campaign = SmsCampaign.objects.get(pk=campaign_id)
+    recipients = list(target_recipients(campaign.department_id, campaign.employment_status))
+    SmsCampaign.objects.filter(pk=campaign_id).update(status='Sending', total_recipients=len(recipients))
+
+    limiter = RateLimiter(SMS_REQUESTS_PER_SECOND, burst=SMS_BATCH_WORKERS)
+    sent = failed = 0
+
+    with ThreadPoolExecutor(max_workers=SMS_BATCH_WORKERS, thread_name_prefix="sms-batch") as pool:
+        futures = [
+            pool.submit(send_batch, campaign.pk, campaign.message, batch, limiter)
+            for batch in chunked(recipients, SMS_BATCH_SIZE)
+        ]
+        for future in as_completed(futures):
+            rows = future.result()
+            SmsCampaignRecipient.objects.bulk_create(rows, batch_size=RECIPIENT_INSERT_BATCH)
+            log_sent_messages(((row.provider_message_id, row.phone_number) for row in rows), 'Campaign')
+            batch_sent = sum(row.status == 'Sent' for row in rows)
+            sent += batch_sent
+            failed += len(rows) - batch_sent
+            SmsCampaign.objects.filter(pk=campaign_id).update(sent_count=sent, failed_count=failed)
+
+    SmsCampaign.objects.filter(pk=campaign_id).update(
+        status='Completed' if sent or not recipients else 'Failed',
+        completed_at=timezone.now(),
+    )
+    return sent, failed
+
+
+def _run_campaign(campaign_id):
+    close_old_connections()
+    try:
+        send_sms_campaign(campaign_id)
+    except Exception as e:
+        print(f'SMS campaign {campaign_id} failed: {e}')
+        SmsCampaign.objects.filter(pk=campaign_id).update(status='Failed', completed_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def start_sms_campaign(name, message, department=None, employment_status=''):
+    campaign = SmsCampaign.objects.create(
+        name=name, message=message, department=department, employment_status=employment_status or ''
+    )
+    queue_sms_campaign(campaign.pk)
+    return campaign
+
+
+def queue_sms_campaign(campaign_id):
+    transaction.on_commit(lambda: _campaign_pool.submit(_run_campaign, campaign_id))
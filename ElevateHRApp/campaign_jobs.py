@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+import mimetypes
+import os
+
+from .models import PosterJob
+from .image_generation import generate_image_bytes, submit_poster_variants, VARIANT_DIR
+
+
+POSTER_JOB_WORKERS = int(os.getenv("POSTER_JOB_WORKERS", 2))
+POSTER_VARIANT_WORKERS = int(os.getenv("POSTER_GENERATION_WORKERS", 4))
+MAX_POSTER_VARIANTS = 4
+# A job not updated for this long lost its worker, the web process died or restarted
+# mid-job. Running jobs are updated after every variant.
+STALE_JOB_AFTER = timedelta(minutes=15)
+
+# Appended to the campaign prompt so concurrent variants don't all come back alike
+POSTER_STYLES = [
+    "",
+    "Use a bold, modern corporate style with strong typography.",
+    "Use a clean, minimalist layout with plenty of white space.",
+    "Use a vibrant, colourful style suited to social media.",
+]
+
+# Jobs and the generation calls they fan out to run on separate pools,
+# so a job waiting on its variants can never starve them of a worker
+_job_pool = ThreadPoolExecutor(max_workers=POSTER_JOB_WORKERS, thread_name_prefix="poster-job")
+_generation_pool = ThreadPoolExecutor(max_workers=POSTER_VARIANT_WORKERS, thread_name_prefix="poster-gen")
+
+
+def enqueue_poster_job(job_title, prompt, variants=1):
+    variants = max(1, min(int(variants), MAX_POSTER_VARIANTS))
+    job = PosterJob.objects.create(job_title=job_title or "", prompt=prompt, variants_requested=variants)
+
+    # Only hand the job to a worker once the row is visible to it
+    transaction.on_commit(lambda: _job_pool.submit(run_poster_job, job.pk))
+    return job
+
+
+def run_poster_job(job_id):
+    close_old_connections()
+    try:
+        job = PosterJob.objects.get(pk=job_id)
+        PosterJob.objects.filter(pk=job_id).update(status='Running', updated_at=timezone.now())
+
+        futures = [
+            _generation_pool.submit(generate_image_bytes, f"{job.prompt}\n{POSTER_STYLES[index % len(POSTER_STYLES)]}")
+            for index in range(job.variants_requested)
+        ]
+
+        posters = []
+        for future in as_completed(futures):
+            try:
+                image_data, mime_type = future.result()
+            except Exception as e:
+                print(f'Poster variant failed for job {job_id}: {e}')
+                image_data = None
+
+            if image_data is not None:
+                extension = mimetypes.guess_extension(mime_type) or ".png"
+                path = default_storage.save(
+                    f"{VARIANT_DIR}/{job_id}/poster-{len(posters) + 1}{extension}", ContentFile(image_data)
+                )
+                posters.append(path)
+                submit_poster_variants(image_data, os.path.join(settings.MEDIA_ROOT, VARIANT_DIR, str(job_id)))
+
+            PosterJob.objects.filter(pk=job_id).update(
+                variants_completed=F('variants_completed') + 1,
+                posters=posters,
+                updated_at=timezone.now(),
+            )
+
+        PosterJob.objects.filter(pk=job_id).update(
+            status='Completed' if posters else 'Failed',
+            error=None if posters else "The model did not return any image",
+            updated_at=timezone.now(),
+        )
+
+    except Exception as e:
+        PosterJob.objects.filter(pk=job_id).update(status='Failed', error=str(e), updated_at=timezone.now())
+
+    finally:
+        close_old_connections()
+
+
+def fail_stale_job(job):
+    """
+    Marks a Queued or Running job nobody has updated for STALE_JOB_AFTER as
+    Failed, so the page polling it stops waiting. Returns the job as it now is.
+    """
+    now = timezone.now()
+    stale = PosterJob.objects.filter(
+        pk=job.pk, status__in=('Queued', 'Running'), updated_at__lt=now - STALE_JOB_AFTER,
+    ).update(status='Failed', error="The poster job stopped before it finished, please try again", updated_at=now)
+    if stale:
+        job.refresh_from_db()
+    return job
+
+
+def poster_job_status(job):
+    return {
+        'job_id': str(job.job_id),
+        'status': job.status,
+        'progress': job.progress,
+        'variants_requested': job.variants_requested,
+        'variants_completed': job.variants_completed,
+        'posters': [default_storage.url(path) for path in job.posters],
+        'error': job.error,
+    }
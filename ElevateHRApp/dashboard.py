@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Prefetch, Q, Sum
+from django.utils import timezone
+
+from .models import Attendance, Employee, LeaveRequest, Payslip, PerformanceReview, Training
+
+
+DASHBOARD_CACHE = 'dashboard'
+DASHBOARD_CACHE_SECONDS = 60 * 60
+RECENT_PAYSLIPS = 6
+RECENT_LEAVES = 5
+RECENT_REVIEWS = 3
+RECENT_TRAININGS = 5
+
+
+def dashboard_key(employee_id):
+    return f"employee-dashboard:{employee_id}"
+
+
+def _hours(check_in, check_out):
+    if not check_in or not check_out:
+        return 0.0
+    start = datetime.combine(datetime.min, check_in)
+    end = datetime.combine(datetime.min, check_out)
+    return max((end - start).total_seconds() / 3600, 0.0)
+
+
+def _attendance_summary(employee_id, today):
+    month_start = today.replace(day=1)
+    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+    week_start = today - timedelta(days=today.weekday())
+
+    # At most two months of rows, the hours are summed here rather than with backend specific time arithmetic
+    rows = Attendance.objects.filter(
+        attendance_employee_id=employee_id, attendance_date__gte=last_month_start, attendance_date__lte=today,
+    ).values_list('attendance_date', 'attendance_status', 'attendance_check_in', 'attendance_check_out')
+
+    summary = {
+        'hours_this_month': 0.0, 'hours_last_month': 0.0, 'hours_this_week': 0.0,
+        'days_this_month': 0, 'present_this_month': 0, 'checked_in_today': False,
+    }
+    for day, status, check_in, check_out in rows:
+        hours = _hours(check_in, check_out)
+        if day >= month_start:
+            summary['hours_this_month'] += hours
+            summary['days_this_month'] += 1
+            summary['present_this_month'] += status == 'Present'
+        else:
+            summary['hours_last_month'] += hours
+        if day >= week_start:
+            summary['hours_this_week'] += hours
+        if day == today and check_in:
+            summary['checked_in_today'] = True
+
+    days = summary['days_this_month']
+    summary['attendance_rate'] = round(100 * summary['present_this_month'] / days) if days else None
+    summary['average_daily_hours'] = summary['hours_this_month'] / summary['present_this_month'] \
+        if summary['present_this_month'] else 0.0
+    last = summary['hours_last_month']
+    summary['change_from_last_month'] = round(100 * (summary['hours_this_month'] - last) / last, 1) if last else None
+    return summary
+
+
+def _leave_summary(employee_id, today):
+    annual_this_year = Q(leave_type='Annual', leave_status='Approved', leave_start_date__year=today.year)
+    totals = LeaveRequest.objects.filter(leave_employee_id=employee_id).aggregate(
+        pending=Count('id', filter=Q(leave_status='Pending')),
+        approved=Count('id', filter=Q(leave_status='Approved')),
+        annual_requests=Count('id', filter=annual_this_year),
+        annual_span=Sum(
+            ExpressionWrapper(F('leave_end_date') - F('leave_start_date'), output_field=DurationField()),
+            filter=annual_this_year,
+        ),
+    )
+    # Inclusive of both ends, so one day per request on top of the span
+    taken = totals['annual_requests'] + (totals['annual_span'].days if totals['annual_span'] else 0)
+    return {
+        'pending': totals['pending'],
+        'approved': totals['approved'],
+        'annual_taken': taken,
+        'annual_balance': LeaveRequest.ANNUAL_LEAVE_DAYS - taken,
+    }
+
+
+def build_dashboard(employee_id):
+    """
+    Everything employee_dashboard shows in a fixed handful of queries, whatever the history size
+    """
+    employee = Employee.objects.select_related('department', 'supervisor').prefetch_related(
+        Prefetch('payslips', queryset=Payslip.objects.order_by('-pay_period_end', '-id')[:RECENT_PAYSLIPS],
+                 to_attr='recent_payslips'),
+        Prefetch('leaverequest_set', queryset=LeaveRequest.objects.order_by('-leave_start_date', '-id')[:RECENT_LEAVES],
+                 to_attr='recent_leaves'),
+        Prefetch('performancereview_set',
+                 queryset=PerformanceReview.objects.order_by('-performance_review_date', '-id')[:RECENT_REVIEWS],
+                 to_attr='recent_reviews'),
+        Prefetch('training_set', queryset=Training.objects.order_by('-training_date', '-id')[:RECENT_TRAININGS],
+                 to_attr='recent_trainings'),
+    ).filter(employee_ID=employee_id).first()
+    if employee is None:
+        return None
+
+    today = timezone.localdate()
+    performance = PerformanceReview.objects.filter(performance_employee_id=employee_id).aggregate(
+        reviews=Count('id'),
+        average_rating=Avg('performance_rating'),
+        best_rating=Max('performance_rating'),
+        this_year=Count('id', filter=Q(performance_review_date__year=today.year)),
+    )
+    latest_payslip = employee.recent_payslips[0] if employee.recent_payslips else None
+
+    return {
+        'employee': employee,
+        'attendance': _attendance_summary(employee_id, today),
+        'leave': _leave_summary(employee_id, today),
+        'performance': performance,
+        'latest_payslip': latest_payslip,
+        'payslips': employee.recent_payslips,
+        'leaves': employee.recent_leaves,
+        'reviews': employee.recent_reviews,
+        'trainings': employee.recent_trainings,
+        'built_on': today,
+    }
+
+
+def _seconds_until_midnight():
+    now = timezone.localtime()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def get_dashboard(employee_id):
+    """
+    The cached read model, rebuilt on a miss. Signals drop it whenever the
+    underlying records change; it also expires at midnight since "this week"
+    and "this month" move on their own.
+    """
+    cache = caches[DASHBOARD_CACHE]
+    key = dashboard_key(employee_id)
+    dashboard = cache.get(key)
+    if dashboard is None or dashboard['built_on'] != timezone.localdate():
+        dashboard = build_dashboard(employee_id)
+        if dashboard is not None:
+            cache.set(key, dashboard, min(DASHBOARD_CACHE_SECONDS, _seconds_until_midnight()))
+    return dashboard
+
+
+def invalidate_dashboards(employee_ids):
+    """
+    Drops the cached dashboards once the change commits, so a request in between
+    cannot cache the old rows again. Call it after bulk writes that skip signals.
+    """
+    keys = [dashboard_key(employee_id) for employee_id in set(employee_ids) if employee_id is not None]
+    if keys:
+        transaction.on_commit(lambda: caches[DASHBOARD_CACHE].delete_many(keys))
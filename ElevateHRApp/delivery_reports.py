@@ -0,0 +1,119 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import OutboundSms, SmsCampaignRecipient, SmsDeliveryStats, SmsMessageLog
+from .write_behind import WriteBehindBuffer
+
+
+DELIVERED_STATUSES = {'Success'}
+FAILED_STATUSES = {'Failed', 'Rejected'}
+FINAL_STATUSES = DELIVERED_STATUSES | FAILED_STATUSES
+
+REPORT_BUFFER_SIZE = settings.SMS_DELIVERY_REPORTS['BUFFER_SIZE']
+REPORT_FLUSH_SECONDS = settings.SMS_DELIVERY_REPORTS['FLUSH_SECONDS']
+WRITE_BATCH_SIZE = 500
+
+
+def log_sent_messages(messages, source):
+    """
+    Records provider message ids at send time, messages is an iterable of (message_id, phone_number)
+    """
+    now = timezone.now()
+    rows = [
+        SmsMessageLog(provider_message_id=message_id, phone_number=phone_number, source=source, sent_at=now)
+        for message_id, phone_number in messages if message_id
+    ]
+    SmsMessageLog.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+
+
+def write_reports(reports):
+    """
+    Applies a batch of delivery reports with a handful of queries, whatever the batch size.
+    Reports for message ids that were never sent are only counted, as unmatched.
+    """
+    latest = {}
+    for report in reports:
+        if report.get('id'):
+            latest[report['id']] = report
+    if not latest:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        logs = SmsMessageLog.objects.in_bulk(list(latest), field_name='provider_message_id')
+        unmatched = [message_id for message_id in latest if message_id not in logs]
+        for message_id in unmatched:
+            del latest[message_id]
+        if unmatched:
+            today = timezone.localdate(now)
+            SmsDeliveryStats.objects.get_or_create(day=today)
+            SmsDeliveryStats.objects.filter(day=today).update(unmatched=F('unmatched') + len(unmatched))
+
+        stats = defaultdict(lambda: {'reports': 0, 'delivered': 0, 'failed': 0, 'latency': 0.0, 'max_latency': 0.0})
+        by_status = defaultdict(list)
+
+        for message_id, report in latest.items():
+            log = logs[message_id]
+            status = report.get('status') or log.status
+            day = stats[timezone.localdate(log.sent_at)]
+            day['reports'] += 1
+
+            # Count latency and outcome once, on the first final report
+            if status in FINAL_STATUSES and log.status not in FINAL_STATUSES:
+                log.latency_seconds = max(0.0, (now - log.sent_at).total_seconds())
+                day['delivered' if status in DELIVERED_STATUSES else 'failed'] += 1
+                day['latency'] += log.latency_seconds
+                day['max_latency'] = max(day['max_latency'], log.latency_seconds)
+
+            log.status = status
+            log.failure_reason = report.get('failureReason') or log.failure_reason
+            log.network_code = report.get('networkCode') or log.network_code
+            log.reported_at = now
+            by_status[status].append(message_id)
+
+        SmsMessageLog.objects.bulk_update(
+            list(logs.values()), ['status', 'failure_reason', 'network_code', 'reported_at', 'latency_seconds'],
+            batch_size=WRITE_BATCH_SIZE,
+        )
+
+        for status, message_ids in by_status.items():
+            OutboundSms.objects.filter(provider_message_id__in=message_ids).update(provider_status=status)
+            SmsCampaignRecipient.objects.filter(provider_message_id__in=message_ids).update(provider_status=status)
+
+        for day, values in stats.items():
+            SmsDeliveryStats.objects.get_or_create(day=day)
+            SmsDeliveryStats.objects.filter(day=day).update(
+                reports=F('reports') + values['reports'],
+                delivered=F('delivered') + values['delivered'],
+                failed=F('failed') + values['failed'],
+                total_latency_seconds=F('total_latency_seconds') + values['latency'],
+                max_latency_seconds=Greatest(F('max_latency_seconds'), values['max_latency']),
+            )
+
+    return len(latest)
+
+
+# Callback payloads are answered straight away and written in batches, see settings.SMS_DELIVERY_REPORTS
+report_buffer = WriteBehindBuffer(
+    write_reports, "delivery reports", size=REPORT_BUFFER_SIZE, interval=REPORT_FLUSH_SECONDS,
+)
+
+
+def delivery_stats(days=7):
+    return [
+        {
+            'day': stats.day.isoformat(),
+            'reports': stats.reports,
+            'delivered': stats.delivered,
+            'failed': stats.failed,
+            'unmatched': stats.unmatched,
+            'failure_rate': round(stats.failure_rate, 4),
+            'average_latency_seconds': round(stats.average_latency_seconds, 2),
+            'max_latency_seconds': round(stats.max_latency_seconds, 2),
+        }
+        for stats in SmsDeliveryStats.objects.all()[:days]
+    ]
@@ -0,0 +1,118 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.db.models import Count, Q
+
+from .models import Employee
+from .search import ranked_search, search_terms
+
+
+DIRECTORY_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# The only columns the directory cards show, the documents and address never leave the database
+DIRECTORY_FIELDS = (
+    'employee_ID',
+    'fname',
+    'lname',
+    'email',
+    'employee_profession',
+    'job_title',
+    'department__dpt_name',
+    'employment_status',
+    'date_joined',
+    'salary',
+    'created_at',
+)
+
+
+def encode_cursor(*values):
+    return urlsafe_b64encode("|".join(str(value) for value in values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return urlsafe_b64decode(cursor.encode()).decode().split("|")
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def filter_employees(queryset, department=None, status=None, profession=None):
+    if department:
+        queryset = queryset.filter(department_id=department)
+    if status:
+        queryset = queryset.filter(employment_status=status)
+    if profession:
+        queryset = queryset.filter(employee_profession=profession)
+    return queryset
+
+
+def _project(queryset):
+    rows = list(queryset.values(*DIRECTORY_FIELDS))
+    for row in rows:
+        row['department'] = row.pop('department__dpt_name')
+    return rows
+
+
+def employee_page(cursor=None, limit=DIRECTORY_PAGE_SIZE, q=None, **filters):
+    """
+    One page of the directory, returns {'results': [...], 'next_cursor': ...}.
+    Browsing reads newest first like Employee.Meta.ordering, the cursor is the
+    (created_at, employee_ID) of the last row shown so every page is an index
+    range scan however deep the reader scrolls. A search reads in rank order
+    instead and the cursor is the (rank, employee_ID) of the last match shown.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if q and search_terms(q):
+        return _search_page(q, cursor, limit, filters)
+
+    queryset = filter_employees(Employee.objects.all(), **filters)
+    if cursor:
+        try:
+            created_at, employee_id = decode_cursor(cursor)
+            created_at, employee_id = datetime.fromisoformat(created_at), int(employee_id)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, employee_ID__lt=employee_id)
+        )
+
+    rows = _project(queryset.order_by('-created_at', '-employee_ID')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'].isoformat(), rows[-1]['employee_ID'])
+    for row in rows:
+        del row['created_at']
+    return {'results': rows, 'next_cursor': next_cursor}
+
+
+def _search_page(q, cursor, limit, filters):
+    after = None
+    if cursor:
+        try:
+            rank, employee_id = decode_cursor(cursor)
+            after = (float(rank), int(employee_id))
+        except ValueError:
+            raise ValueError("Invalid cursor")
+    within = filter_employees(Employee.objects.all(), **filters) if filters and any(filters.values()) else None
+
+    ranked = ranked_search(q, limit + 1, after=after, within=within)
+    page = ranked[:limit]
+    position = {employee_id: index for index, (_, employee_id) in enumerate(page)}
+    rows = sorted(_project(Employee.objects.filter(employee_ID__in=position)), key=lambda row: position[row['employee_ID']])
+    for row in rows:
+        del row['created_at']
+    next_cursor = encode_cursor(*page[-1]) if len(ranked) > limit else None
+    return {'results': rows, 'next_cursor': next_cursor}
+
+
+def directory_counts():
+    """
+    Headline numbers for the stat cards in one aggregate query
+    """
+    return Employee.objects.aggregate(
+        total=Count('employee_ID'),
+        active=Count('employee_ID', filter=Q(employment_status='Active')),
+        on_leave=Count('employee_ID', filter=Q(employment_status='On Leave')),
+        inactive=Count('employee_ID', filter=~Q(employment_status__in=['Active', 'On Leave'])),
+    )
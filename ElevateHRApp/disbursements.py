@@ -0,0 +1,294 @@
+import codecs
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .dashboard import invalidate_dashboards
+from .exports import buffered, csv_lines
+from .models import Disbursement, DisbursementBatch, Payslip
+
+
+DISBURSEMENT_BATCH_SIZE = 2000
+RESULTS_CHUNK_SIZE = 2000
+
+BANK_FILE_COLUMNS = ['reference', 'bank_name', 'account_number', 'account_name', 'amount', 'narration']
+# What banks write in the status column of a results file
+RESULT_STATUSES = {
+    'successful': 'Successful', 'success': 'Successful', 'paid': 'Successful', 'completed': 'Successful',
+    'failed': 'Failed', 'failure': 'Failed', 'rejected': 'Failed', 'returned': 'Failed',
+}
+
+
+def batch_payslips(batch):
+    """
+    The payslips a batch pays: Generated, with something to pay, ending in its period
+    """
+    payslips = Payslip.objects.filter(
+        status='Generated', net_salary__gt=0, pay_period_end__range=(batch.pay_period_start, batch.pay_period_end),
+    )
+    if batch.department_id:
+        payslips = payslips.filter(employee__department_id=batch.department_id)
+    return payslips
+
+
+def fill_batch(batch):
+    """
+    Creates a Pending disbursement for every payslip of the batch that has
+    none yet and takes over the Failed ones for another attempt. The rows are
+    locked with SKIP LOCKED, so a batch being filled at the same time gets the
+    other payslips instead of waiting, and the one disbursement per payslip
+    rule backs that up. (SQLite has no row locks, its writers queue instead.)
+    """
+    started = time.perf_counter()
+    payslips = batch_payslips(batch)
+    with transaction.atomic():
+        unpaid = payslips.filter(~Exists(Disbursement.objects.filter(payslip=OuterRef('pk'))))
+        # Instances rather than values(), which would drop the OF and lock the employees joined in too
+        rows = list(unpaid.select_for_update(skip_locked=True, of=('self',)).only('id', 'net_salary'))
+        Disbursement.objects.bulk_create(
+            (Disbursement(payslip_id=payslip.id, amount=payslip.net_salary, batch=batch) for payslip in rows),
+            batch_size=DISBURSEMENT_BATCH_SIZE,
+        )
+
+        retry = dict(Disbursement.objects.select_for_update(skip_locked=True).filter(
+            status='Failed', payslip__in=payslips.values('pk'),
+        ).values_list('id', 'batch_id'))
+        Disbursement.objects.filter(id__in=retry).update(
+            batch=batch, status='Pending', transaction_id=None, failure_reason=None, bank_file=None,
+        )
+        update_batch_totals(batch)
+        # The batches the failed payments were taken from no longer count them
+        for earlier in DisbursementBatch.objects.filter(id__in=set(retry.values())).exclude(pk=batch.pk):
+            update_batch_totals(earlier)
+    return {'created': len(rows), 'retried': len(retry), 'seconds': time.perf_counter() - started}
+
+
+def create_batch(start, end, department=None):
+    """
+    Creates and fills a DisbursementBatch for the payslips ending between start and end
+    """
+    if start > end:
+        raise ValueError("The pay period starts after it ends")
+    batch = DisbursementBatch.objects.create(pay_period_start=start, pay_period_end=end, department=department)
+    return batch, fill_batch(batch)
+
+
+def update_batch_totals(batch):
+    totals = batch.disbursements.aggregate(
+        payments=Count('id'),
+        total_amount=Sum('amount'),
+        successful=Count('id', filter=Q(status='Successful')),
+        failed=Count('id', filter=Q(status='Failed')),
+    )
+    batch.payments = totals['payments']
+    batch.total_amount = totals['total_amount'] or 0
+    batch.successful = totals['successful']
+    batch.failed = totals['failed']
+    if batch.payments and batch.successful + batch.failed == batch.payments:
+        batch.status, batch.completed_at = 'Completed', batch.completed_at or timezone.now()
+    batch.save()
+
+
+# Bank file
+
+def bank_totals(batch):
+    """
+    {bank_name: (payments, amount)} for what is still to be paid
+    """
+    return {
+        row['payslip__employee__bank_name']: (row['payments'], row['amount'])
+        for row in batch.disbursements.filter(status__in=('Pending', 'Processing')).values(
+            'payslip__employee__bank_name'
+        ).annotate(payments=Count('id'), amount=Sum('amount')).order_by('payslip__employee__bank_name')
+    }
+
+
+def bank_file_rows(batch, number):
+    """
+    Payment instructions for the disbursements that went out in one of the
+    batch's bank files and are still to be paid, grouped by the employee's
+    bank. The reference is the disbursement id, which the bank hands back in
+    its results file.
+    """
+    narration = f"Salary {batch.pay_period_end:%b %Y}"
+    rows = batch.disbursements.filter(bank_file=number, status='Processing').order_by(
+        'payslip__employee__bank_name', 'payslip__employee__lname', 'id',
+    ).values_list(
+        'id', 'payslip__employee__bank_name', 'payslip__employee__bank_account_number',
+        'payslip__employee__fname', 'payslip__employee__lname', 'amount',
+    ).iterator(chunk_size=DISBURSEMENT_BATCH_SIZE)
+    for reference, bank_name, account_number, fname, lname, amount in rows:
+        yield reference, bank_name, account_number, f"{fname} {lname}", amount, narration
+
+
+def issue_bank_file(batch):
+    """
+    Moves the batch's Pending disbursements to Processing under the next bank
+    file number and returns it, or None when nothing is Pending. The batch row
+    is locked, so two requests never put the same payment in two files.
+    """
+    with transaction.atomic():
+        locked = DisbursementBatch.objects.select_for_update().get(pk=batch.pk)
+        number = locked.bank_files + 1
+        if not batch.disbursements.filter(status='Pending').update(status='Processing', bank_file=number):
+            return None
+        batch.bank_files, batch.status, batch.sent_at = number, locked.status, locked.sent_at
+        if batch.status == 'Open':
+            batch.status, batch.sent_at = 'Sent', timezone.now()
+        batch.save(update_fields=['bank_files', 'status', 'sent_at'])
+    return number
+
+
+def streaming_bank_file(batch, number, reissue=False):
+    """
+    Streams bank file number of the batch, what issue_bank_file moved to
+    Processing under it and has no result yet. A re-issue says so in its name,
+    the bank must not pay it on top of the original.
+    """
+    filename = f"bank-file-{batch.pk}-{number}{'-reissue' if reissue else ''}.csv"
+    response = StreamingHttpResponse(
+        buffered(csv_lines(BANK_FILE_COLUMNS, bank_file_rows(batch, number))), content_type='text/csv',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Results file
+
+def _result_rows(upload):
+    reader = csv.reader(codecs.iterdecode(upload, 'utf-8-sig'))
+    columns = [column.strip().lower().replace(' ', '_') for column in next(reader, [])]
+    missing = [column for column in ('reference', 'status') if column not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    for values in reader:
+        if any(value.strip() for value in values):
+            yield reader.line_num, dict(zip(columns, (value.strip() for value in values)))
+
+
+def update_statuses(rows):
+    """
+    Raw executemany of (status, transaction_id, failure_reason, id), a
+    results file sets a different transaction id on every row and
+    bulk_update's CASE per row is the slow part at that size
+    """
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        f"{quote(Disbursement._meta.get_field(name).column)} = %s"
+        for name in ('status', 'transaction_id', 'failure_reason')
+    )
+    sql = f"UPDATE {quote(Disbursement._meta.db_table)} SET {columns} WHERE {quote(Disbursement._meta.pk.column)} = %s"
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+class ResultsFile:
+    """
+    Applies a bank results file to a batch a chunk at a time: each chunk's
+    disbursements are locked, updated with one executemany and the paid
+    payslips marked Paid with one UPDATE. Only payments that went out in a
+    bank file and are Processing take a result, the same result again for a
+    settled one is counted as unchanged.
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.errors = []
+        self.rows = self.successful = self.failed = self.unchanged = 0
+
+    def run(self, upload):
+        started = time.perf_counter()
+        chunk = []
+        for line, values in _result_rows(upload):
+            self.rows += 1
+            result = self.clean(line, values)
+            if result is not None:
+                chunk.append(result)
+                if len(chunk) >= RESULTS_CHUNK_SIZE:
+                    self.apply(chunk)
+                    chunk = []
+        self.apply(chunk)
+        update_batch_totals(self.batch)
+        return {
+            'rows': self.rows,
+            'successful': self.successful,
+            'failed': self.failed,
+            'unchanged': self.unchanged,
+            'errors': sorted(self.errors),
+            'seconds': time.perf_counter() - started,
+        }
+
+    def clean(self, line, values):
+        reference = values.get('reference', '')
+        status = RESULT_STATUSES.get(values.get('status', '').lower())
+        if not reference.isdigit():
+            self.errors.append((line, f"reference {reference!r} is not a disbursement reference"))
+        elif status is None:
+            self.errors.append((line, f"unknown status {values.get('status')!r}"))
+        else:
+            amount = values.get('amount')
+            try:
+                amount = Decimal(amount.replace(',', '')) if amount else None
+            except InvalidOperation:
+                self.errors.append((line, f"amount {amount!r} is not a number"))
+                return None
+            return line, int(reference), status, values.get('transaction_id') or None, \
+                values.get('failure_reason') or None, amount
+        return None
+
+    def apply(self, chunk):
+        if not chunk:
+            return
+        with transaction.atomic():
+            current = {
+                # Locks the payslips joined in too, they are updated below
+                row[0]: row[1:] for row in Disbursement.objects.select_for_update().filter(
+                    batch=self.batch, id__in=[result[1] for result in chunk],
+                ).values_list('id', 'status', 'bank_file', 'amount', 'payslip_id', 'payslip__employee_id')
+            }
+            updates, paid_payslips, employees = [], [], set()
+            for line, reference, status, transaction_id, failure_reason, amount in chunk:
+                if reference not in current:
+                    self.errors.append((line, f"disbursement {reference} is not in this batch"))
+                    continue
+                current_status, bank_file, expected, payslip_id, employee_id = current[reference]
+                if amount is not None and amount != expected:
+                    self.errors.append((line, f"amount {amount} does not match the {expected} sent"))
+                elif current_status == status:
+                    self.unchanged += 1
+                elif current_status == 'Successful':
+                    self.errors.append((line, f"disbursement {reference} was already paid"))
+                elif current_status != 'Processing' or bank_file is None:
+                    # Pending was never sent, Failed may already be retried in another batch
+                    self.errors.append(
+                        (line, f"disbursement {reference} is {current_status}, not waiting for a result"),
+                    )
+                else:
+                    if status == 'Successful':
+                        self.successful += 1
+                        paid_payslips.append(payslip_id)
+                        failure_reason = None
+                    else:
+                        self.failed += 1
+                    updates.append((status, transaction_id, failure_reason, reference))
+                    employees.add(employee_id)
+                    # A reference repeated later in the file sees this result
+                    current[reference] = (status, bank_file, expected, payslip_id, employee_id)
+
+            update_statuses(updates)
+            Payslip.objects.filter(id__in=paid_payslips).update(status='Paid')
+        # Both updates skip the signals, the dashboards show payslip statuses
+        invalidate_dashboards(employees)
+
+
+def apply_results(batch, upload):
+    """
+    Updates a batch's disbursements from a bank results file (CSV with
+    reference, status and optionally transaction_id, failure_reason and
+    amount columns). Returns the counts and the rows that were rejected.
+    """
+    return ResultsFile(batch).run(upload)
@@ -0,0 +1,282 @@
+import codecs
+import csv
+import io
+import time
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from USSD.summaries import rebuild_summaries
+from .models import Department, Employee
+from . import org_chart, search
+
+
+IMPORT_BATCH_SIZE = 1000
+
+# Columns copied into the Employee field of the same name
+FIELD_COLUMNS = (
+    'fname', 'lname', 'sname', 'email', 'phone_number', 'gender', 'marital_status', 'nationality',
+    'address', 'city', 'state', 'postal_code', 'country',
+    'job_title', 'employee_profession', 'employment_type', 'employment_status', 'date_joined', 'probation_end_date',
+    'salary', 'pay_grade', 'bank_name', 'bank_account_number', 'tax_id_number', 'nhif_number', 'nssf_number',
+    'emergency_contact_name', 'emergency_contact_relation', 'emergency_contact_phone', 'id_number', 'passport_number',
+)
+# Columns resolved to a foreign key: a Department code and the supervisor's email
+LOOKUP_COLUMNS = ('department', 'supervisor')
+IMPORT_COLUMNS = FIELD_COLUMNS + LOOKUP_COLUMNS
+REQUIRED_COLUMNS = tuple(
+    name for name in FIELD_COLUMNS
+    if not Employee._meta.get_field(name).blank and not Employee._meta.get_field(name).has_default()
+)
+
+
+def _header(values):
+    return [str(value or '').strip().lower().replace(' ', '_') for value in values]
+
+
+def _csv_rows(upload):
+    reader = csv.reader(codecs.iterdecode(upload, 'utf-8-sig'))
+    columns = _header(next(reader, []))
+
+    def rows():
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield reader.line_num, values
+    return columns, rows()
+
+
+def _xlsx_rows(upload):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Reading .xlsx files needs openpyxl, install it or upload a CSV")
+
+    # read_only streams the sheet instead of building every cell in memory
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    sheet_rows = workbook.active.iter_rows(values_only=True)
+    columns = _header(next(sheet_rows, ()))
+
+    def rows():
+        try:
+            for line, values in enumerate(sheet_rows, start=2):
+                if any(value not in (None, '') for value in values):
+                    yield line, values
+        finally:
+            workbook.close()
+    return columns, rows()
+
+
+def open_rows(upload, filename=None):
+    """
+    (columns, iterator of (line number, values)) for a CSV or XLSX file, read as it goes
+    """
+    name = (filename or getattr(upload, 'name', None) or '').lower()
+    columns, rows = _xlsx_rows(upload) if name.endswith(('.xlsx', '.xlsm')) else _csv_rows(upload)
+
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return columns, rows
+
+
+class EmployeeImport:
+    """
+    Validates rows against the model fields and in-memory lookup maps, then
+    writes them with bulk_create one batch per transaction. Signals don't fire
+    for bulk_create, so the search index, USSD summaries and org chart are
+    updated here for each batch.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.fields = {name: Employee._meta.get_field(name) for name in FIELD_COLUMNS}
+        self.departments = {code.lower(): pk for code, pk in Department.objects.values_list('code', 'id')}
+        # Existing and already imported employees, by email
+        self.emails = {email.lower(): pk for email, pk in Employee.objects.values_list('email', 'employee_ID')}
+        self.file_emails = {}  # email -> line it was first seen on in this file
+        self.pending_supervisors = []  # (employee, supervisor email, line, values) for supervisors further down
+        self.supervisors = {}  # created employee_ID -> supervisor employee_ID
+        self.batch = []
+        self.errors = []
+        self.rows = self.created = 0
+
+    def run(self, upload, filename=None):
+        started = time.perf_counter()
+        self.columns, rows = open_rows(upload, filename)
+        for line, values in rows:
+            self.rows += 1
+            values = dict(zip(self.columns, values))
+            employee = self.clean(line, values)
+            if employee is not None:
+                self.batch.append((employee, line, values))
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+        self.flush()
+        self.link_supervisors()
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': sum(not imported for _, _, _, imported in self.errors),
+            'errors': self.errors,
+            'seconds': time.perf_counter() - started,
+        }
+
+    def error(self, line, values, messages, imported=False):
+        self.errors.append((line, values, messages, imported))
+
+    # Validation
+
+    def clean(self, line, values):
+        data, messages = {}, []
+        for name, field in self.fields.items():
+            raw = values.get(name)
+            if isinstance(raw, str):
+                raw = raw.strip()
+            if raw in (None, ''):
+                if field.has_default():
+                    data[name] = field.get_default()
+                    continue
+                raw = None if field.null else ''
+            try:
+                data[name] = field.clean(raw, None)
+            except ValidationError as e:
+                messages.append(f"{name}: {' '.join(e.messages)}")
+
+        email = (data.get('email') or '').lower()
+        if email in self.emails:
+            messages.append(f"email: {data['email']} already belongs to employee {self.emails[email]}")
+        elif email in self.file_emails:
+            messages.append(f"email: {data['email']} is already used on row {self.file_emails[email]}")
+
+        code = str(values.get('department') or '').strip()
+        if code:
+            data['department_id'] = self.departments.get(code.lower())
+            if data['department_id'] is None:
+                messages.append(f"department: no department with code {code}")
+
+        supervisor = str(values.get('supervisor') or '').strip().lower()
+        if supervisor and supervisor == email:
+            messages.append("supervisor: an employee cannot supervise themselves")
+        elif supervisor in self.emails:
+            data['supervisor_id'] = self.emails[supervisor]
+
+        if messages:
+            self.error(line, values, messages)
+            return None
+
+        self.file_emails[email] = line
+        employee = Employee(**data)
+        if supervisor and employee.supervisor_id is None:
+            self.pending_supervisors.append((employee, supervisor, line, values))
+        return employee
+
+    # Writing
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch or self.dry_run:
+            self.created += len(batch)
+            return
+
+        employees = [employee for employee, _, _ in batch]
+        try:
+            self.insert(employees)
+        except IntegrityError:
+            # Something else wrote a clashing row meanwhile, find it one row at a time
+            employees = []
+            for employee, line, values in batch:
+                employee.pk = None  # may have been set by the rolled back insert
+                try:
+                    self.insert([employee])
+                    employees.append(employee)
+                except IntegrityError as e:
+                    self.error(line, values, [f"not imported: {e}"])
+
+        for employee in employees:
+            self.emails[employee.email.lower()] = employee.pk
+            self.supervisors[employee.pk] = employee.supervisor_id
+        self.created += len(employees)
+
+        created_ids = [employee.pk for employee in employees]
+        search.index_employees(created_ids)
+        rebuild_summaries(created_ids)
+
+    def insert(self, employees):
+        """
+        The rows and their org chart links in one transaction. A supervisor
+        set here is an employee already in the database, the ones further
+        down the file are linked by link_supervisors.
+        """
+        with transaction.atomic():
+            Employee.objects.bulk_create(employees)
+            if any(employee.pk is None for employee in employees):
+                # Backends that can't return ids from a bulk insert
+                ids = dict(Employee.objects.filter(
+                    email__in=[employee.email for employee in employees]
+                ).values_list('email', 'employee_ID'))
+                for employee in employees:
+                    employee.pk = ids[employee.email]
+            org_chart.add_employees({employee.pk: employee.supervisor_id for employee in employees})
+
+    def link_supervisors(self):
+        """
+        Supervisors that only appear further down the file, each employee
+        moved under theirs in the org chart along with their own reports
+        """
+        known = set(self.file_emails) if self.dry_run else self.emails
+        linked = []
+        for employee, supervisor, line, values in self.pending_supervisors:
+            if not self.dry_run and employee.pk is None:
+                continue  # the row itself failed to insert
+            if supervisor not in known:
+                self.error(line, values, [f"supervisor: no employee with email {supervisor}"], imported=True)
+            elif not self.dry_run:
+                if self.reports_to(self.emails[supervisor], employee.pk):
+                    self.error(line, values, [f"supervisor: {supervisor} reports to this employee"], imported=True)
+                    continue
+                employee.supervisor_id = self.emails[supervisor]
+                self.supervisors[employee.pk] = employee.supervisor_id
+                linked.append(employee)
+        if self.dry_run:
+            return
+
+        with transaction.atomic():
+            Employee.objects.bulk_update(linked, ['supervisor'], batch_size=self.batch_size)
+            for employee in linked:
+                org_chart.move_subtree(employee.pk, employee.supervisor_id)
+
+    def reports_to(self, employee_id, manager_id):
+        # Only links between imported employees can loop, existing ones never report to them
+        seen = set()
+        while employee_id in self.supervisors and employee_id not in seen:
+            if employee_id == manager_id:
+                return True
+            seen.add(employee_id)
+            employee_id = self.supervisors[employee_id]
+        return employee_id == manager_id
+
+
+def error_report(columns, errors):
+    """
+    CSV of the problem rows as they were uploaded, whether they went in anyway
+    (without a supervisor) and what was wrong with them
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['row', *columns, 'imported', 'errors'])
+    for line, values, messages, imported in sorted(errors, key=lambda error: error[0]):
+        writer.writerow([
+            line, *(values.get(column, '') for column in columns), 'yes' if imported else 'no', '; '.join(messages),
+        ])
+    return output.getvalue()
+
+
+def import_employees(upload, filename=None, batch_size=IMPORT_BATCH_SIZE, dry_run=False):
+    """
+    Imports employees from a CSV or XLSX file object. Returns the counts, the
+    rows that failed with their messages and an error report as CSV text.
+    """
+    importer = EmployeeImport(batch_size=batch_size, dry_run=dry_run)
+    result = importer.run(upload, filename)
+    result['error_report'] = error_report(importer.columns, result['errors']) if result['errors'] else ''
+    return result
@@ -0,0 +1,188 @@
+from datetime import date
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+import csv
+import json
+import zlib
+
+from .models import Attendance, Employee, Payslip
+
+
+EXPORT_CHUNK_SIZE = 2000
+# Rows are gathered into chunks of about this many bytes before they go out (and into gzip)
+STREAM_BUFFER_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportSpec:
+    """
+    One extract: the model, its (header, lookup) columns and the fields the filters apply to
+    """
+
+    def __init__(self, model, columns, period_field, department_field):
+        self.model = model
+        self.columns = columns
+        self.period_field = period_field
+        self.department_field = department_field
+
+    @property
+    def headers(self):
+        return [header for header, _ in self.columns]
+
+    def rows(self, queryset=None, start=None, end=None, department=None):
+        """
+        Streams values_list tuples in primary key order, chunk by chunk from a server side cursor
+        """
+        queryset = self.model.objects.all() if queryset is None else queryset
+        if start:
+            queryset = queryset.filter(**{f'{self.period_field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{self.period_field}__lte': end})
+        if department:
+            queryset = queryset.filter(**{self.department_field: department})
+        return queryset.order_by('pk').values_list(
+            *(lookup for _, lookup in self.columns)
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+EXPORTS = {
+    'employees': ExportSpec(Employee, [
+        ('employee_id', 'employee_ID'),
+        ('first_name', 'fname'),
+        ('last_name', 'lname'),
+        ('surname', 'sname'),
+        ('email', 'email'),
+        ('phone_number', 'phone_number'),
+        ('job_title', 'job_title'),
+        ('profession', 'employee_profession'),
+        ('department', 'department__dpt_name'),
+        ('department_code', 'department__code'),
+        ('employment_type', 'employment_type'),
+        ('employment_status', 'employment_status'),
+        ('date_joined', 'date_joined'),
+        ('supervisor_id', 'supervisor_id'),
+        ('salary', 'salary'),
+        ('pay_grade', 'pay_grade'),
+        ('bank_name', 'bank_name'),
+        ('bank_account_number', 'bank_account_number'),
+        ('tax_id_number', 'tax_id_number'),
+        ('nhif_number', 'nhif_number'),
+        ('nssf_number', 'nssf_number'),
+    ], period_field='date_joined', department_field='department_id'),
+
+    'payslips': ExportSpec(Payslip, [
+        ('payslip_id', 'id'),
+        ('employee_id', 'employee_id'),
+        ('first_name', 'employee__fname'),
+        ('last_name', 'employee__lname'),
+        ('department', 'employee__department__dpt_name'),
+        ('pay_period_start', 'pay_period_start'),
+        ('pay_period_end', 'pay_period_end'),
+        ('status', 'status'),
+        ('basic_salary', 'basic_salary'),
+        ('allowances', 'allowances'),
+        ('bonuses', 'bonuses'),
+        ('gross_salary', 'gross_salary'),
+        ('income_tax', 'income_tax'),
+        ('nssf_deduction', 'nssf_deduction'),
+        ('nhif_deduction', 'nhif_deduction'),
+        ('other_deductions', 'other_deductions'),
+        ('total_deductions', 'total_deductions'),
+        ('net_salary', 'net_salary'),
+    ], period_field='pay_period_end', department_field='employee__department_id'),
+
+    'attendance': ExportSpec(Attendance, [
+        ('attendance_id', 'id'),
+        ('employee_id', 'attendance_employee_id'),
+        ('first_name', 'attendance_employee__fname'),
+        ('last_name', 'attendance_employee__lname'),
+        ('department', 'attendance_employee__department__dpt_name'),
+        ('date', 'attendance_date'),
+        ('check_in', 'attendance_check_in'),
+        ('check_out', 'attendance_check_out'),
+        ('status', 'attendance_status'),
+    ], period_field='attendance_date', department_field='attendance_employee__department_id'),
+}
+
+
+def parse_period(start=None, end=None):
+    try:
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except ValueError:
+        raise ValueError("start and end must be dates as YYYY-MM-DD")
+    if start and end and start > end:
+        raise ValueError("start is after end")
+    return start, end
+
+
+class _Line:
+    """
+    Write target for csv.writer that hands back the formatted line instead of storing it
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def buffered(lines, compress=False):
+    """
+    Joins lines into chunks of about STREAM_BUFFER_BYTES, gzipped as they go
+    when compress is set, so only one chunk is ever held in memory
+    """
+    # wbits 31 writes the gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAM_BUFFER_BYTES:
+            data = "".join(chunk).encode()
+            chunk, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = "".join(chunk).encode()
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def streaming_export(name, export_format='csv', compress=False, queryset=None, start=None, end=None, department=None):
+    """
+    StreamingHttpResponse for one of EXPORTS, memory stays flat whatever the table size
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export {name}, choose from {', '.join(EXPORTS)}")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format {export_format}, choose from {', '.join(EXPORT_FORMATS)}")
+
+    spec = EXPORTS[name]
+    rows = spec.rows(queryset, start=start, end=end, department=department)
+    lines = (csv_lines if export_format == 'csv' else ndjson_lines)(spec.headers, rows)
+
+    filename = "-".join([name, *(str(value) for value in (start, end) if value)]) + f".{export_format}"
+    if compress:
+        response = StreamingHttpResponse(buffered(lines, compress=True), content_type='application/gzip')
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(buffered(lines), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
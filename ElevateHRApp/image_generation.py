@@ -1,7 +1,8 @@
 from google import genai
 from google.genai import types
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+import hashlib
 import base64
 import os
 # import streamlit as st
@@ -13,8 +14,25 @@ load_dotenv()
 
 client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
 
+# Social channel variants: name -> (width, height, format, quality)
+POSTER_VARIANTS = {
+  "facebook": (1200, 630, "JPEG", 85),
+  "instagram": (1080, 1080, "WEBP", 80),
+  "linkedin": (1200, 627, "JPEG", 85),
+  "story": (1080, 1920, "WEBP", 80),
+  "thumbnail": (320, 320, "WEBP", 70),
+}
 
-def google_image_generator(prompt):
+VARIANT_DIR = "campaign_posters"
+VARIANT_WORKERS = int(os.getenv("POSTER_VARIANT_WORKERS", 2))
+
+_variant_pool = None
+
+
+def generate_image_bytes(prompt):
+  """
+  Returns the raw image bytes and mime type exactly as sent by the model
+  """
   response = client.models.generate_content(
       model="gemini-2.0-flash-preview-image-generation",
       contents=prompt,
@@ -25,12 +43,59 @@ def google_image_generator(prompt):
 
   for part in response.candidates[0].content.parts:
     if part.inline_data is not None:
-        image_data = part.inline_data.data
-        image = Image.open(BytesIO(image_data))
+      return part.inline_data.data, part.inline_data.mime_type or "image/png"
+
+  return None, None
+
+
+def google_image_generator(prompt):
+  image_data, mime_type = generate_image_bytes(prompt)
+  if image_data is None:
+    return None
+
+  # The model already returns an encoded image, base64 it as-is for HTML rendering
+  return base64.b64encode(image_data).decode("utf-8")
+
+
+def _render_variant(image_data, size, image_format, quality):
+  # Runs inside the worker process, keep PIL off the request path
+  from PIL import Image, ImageOps
+
+  with Image.open(BytesIO(image_data)) as image:
+    image = ImageOps.fit(image.convert("RGB"), size, method=Image.Resampling.LANCZOS)
+    buffered = BytesIO()
+    image.save(buffered, format=image_format, quality=quality, optimize=True)
+    return buffered.getvalue()
+
+
+def render_poster_variants(image_data, output_dir, variants=None):
+  """
+  Renders every variant of one poster into output_dir, returns {name: path}
+  """
+  variants = variants or POSTER_VARIANTS
+  digest = hashlib.sha256(image_data).hexdigest()[:16]
+  os.makedirs(output_dir, exist_ok=True)
+
+  paths = {}
+  for name, (width, height, image_format, quality) in variants.items():
+    extension = "jpg" if image_format == "JPEG" else image_format.lower()
+    path = os.path.join(output_dir, f"{digest}-{name}.{extension}")
+    if not os.path.exists(path):
+      with open(path, "wb") as f:
+        f.write(_render_variant(image_data, (width, height), image_format, quality))
+    paths[name] = path
+  return paths
+
+
+def get_variant_pool():
+  global _variant_pool
+  if _variant_pool is None:
+    _variant_pool = ProcessPoolExecutor(max_workers=VARIANT_WORKERS)
+  return _variant_pool
 
-        # Convert image to base64 for HTML rendering
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
 
-        return img_str
\ No newline at end of file
+def submit_poster_variants(image_data, output_dir, variants=None):
+  """
+  Queues variant rendering on the process pool and returns the Future
+  """
+  return get_variant_pool().submit(render_poster_variants, image_data, output_dir, variants)
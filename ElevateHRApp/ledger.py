@@ -0,0 +1,228 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+import numpy as np
+
+from .models import Employee, Payslip, PayrollLedgerEntry
+
+
+# The payroll ledger holds one PayrollLedgerEntry per pay period, department
+# and payslip amount. Every change is posted as a delta, {(start, end,
+# department_id): [payslips, {component: amount}]}, so a saved payslip costs
+# one UPDATE and reports never sum payslips.
+
+COMPONENTS = [name for name, _ in PayrollLedgerEntry.COMPONENTS]
+LEDGER_BATCH_SIZE = 2000
+
+
+def _changes():
+    return defaultdict(lambda: [0, dict.fromkeys(COMPONENTS, Decimal(0))])
+
+
+def _add(changes, key, payslips, amounts, sign=1):
+    change = changes[key]
+    change[0] += sign * payslips
+    for component in COMPONENTS:
+        change[1][component] += sign * (amounts[component] or 0)
+
+
+def ledger_rows(payslips):
+    """
+    ((start, end, department_id), payslips, {component: amount}) summed over a payslip queryset
+    """
+    rows = payslips.order_by().values('pay_period_start', 'pay_period_end', 'employee__department_id').annotate(
+        payslip_count=Count('id'), **{f'sum_{component}': Sum(component) for component in COMPONENTS},
+    )
+    for row in rows.iterator(chunk_size=LEDGER_BATCH_SIZE):
+        key = (row['pay_period_start'], row['pay_period_end'], row['employee__department_id'])
+        yield key, row['payslip_count'], {component: row[f'sum_{component}'] for component in COMPONENTS}
+
+
+def rebuild_payroll_ledger(start=None, end=None):
+    """
+    Recomputes the ledger from the payslips, for the pay periods ending between
+    start and end or for all of them. Returns the number of entries written.
+    """
+    payslips = Payslip.objects.all()
+    entries = PayrollLedgerEntry.objects.all()
+    if start:
+        payslips, entries = payslips.filter(pay_period_end__gte=start), entries.filter(pay_period_end__gte=start)
+    if end:
+        payslips, entries = payslips.filter(pay_period_end__lte=end), entries.filter(pay_period_end__lte=end)
+
+    with transaction.atomic():
+        entries.delete()
+        written = PayrollLedgerEntry.objects.bulk_create((
+            PayrollLedgerEntry(
+                pay_period_start=period_start, pay_period_end=period_end, department_id=department_id,
+                component=component, amount=amounts[component] or 0, payslips=count,
+            )
+            for (period_start, period_end, department_id), count, amounts in ledger_rows(payslips)
+            for component in COMPONENTS
+        ), batch_size=LEDGER_BATCH_SIZE)
+    return len(written)
+
+
+def _entries(key):
+    start, end, department_id = key
+    # department_id=None is an IS NULL lookup
+    return PayrollLedgerEntry.objects.filter(pay_period_start=start, pay_period_end=end, department_id=department_id)
+
+
+def _update(key, payslips, amounts):
+    # Every component of the period and department in one UPDATE
+    return _entries(key).update(
+        amount=F('amount') + Case(
+            *(When(component=component, then=Value(amounts[component])) for component in COMPONENTS),
+            default=Value(Decimal(0)), output_field=DecimalField(max_digits=16, decimal_places=2),
+        ),
+        payslips=F('payslips') + payslips,
+        updated_at=timezone.now(),
+    )
+
+
+def post(changes):
+    """
+    Adds the deltas to the ledger, creating the entries of a period and
+    department the first time it has payslips and dropping them when it has none left
+    """
+    for key, (payslips, amounts) in changes.items():
+        if not payslips and not any(amounts.values()):
+            continue
+        if not _update(key, payslips, amounts):
+            start, end, department_id = key
+            try:
+                with transaction.atomic():
+                    PayrollLedgerEntry.objects.bulk_create([
+                        PayrollLedgerEntry(
+                            pay_period_start=start, pay_period_end=end, department_id=department_id,
+                            component=component, amount=amounts[component], payslips=payslips,
+                        )
+                        for component in COMPONENTS
+                    ])
+            except IntegrityError:
+                # Another writer created them since the UPDATE
+                _update(key, payslips, amounts)
+        if payslips < 0:
+            _entries(key).filter(payslips__lte=0).delete()
+
+
+def post_batch(start, end, department_ids, pay):
+    """
+    Posts a batch of new payslips for one period: their department ids and
+    every amount as arrays in cents, as payroll.compute_pay makes them
+    """
+    positions = {}
+    groups = np.array([positions.setdefault(department_id, len(positions)) for department_id in department_ids],
+                      dtype=np.int64)
+    departments = list(positions)
+    counts = np.bincount(groups, minlength=len(departments))
+    totals = {}
+    for component in COMPONENTS:
+        totals[component] = np.zeros(len(departments), dtype=np.int64)
+        np.add.at(totals[component], groups, pay[component])
+
+    changes = _changes()
+    for index, department_id in enumerate(departments):
+        _add(changes, (start, end, department_id), int(counts[index]), {
+            component: Decimal(int(totals[component][index])).scaleb(-2) for component in COMPONENTS
+        })
+    post(changes)
+
+
+# Payslip and employee changes, called from signals.py
+
+def _stored(payslip_id):
+    return Payslip.objects.filter(pk=payslip_id).order_by('pk').values(
+        'employee_id', 'employee__department_id', 'pay_period_start', 'pay_period_end', *COMPONENTS,
+    ).first()
+
+
+def _figures(payslip):
+    # Unsaved defaults are floats (0.00), str() keeps them exact
+    return {component: Decimal(str(getattr(payslip, component))) for component in COMPONENTS}
+
+
+def payslip_changing(payslip):
+    # The figures the ledger holds for it, taken back out once the new ones are saved
+    payslip._ledger_before = _stored(payslip.pk) if payslip.pk else None
+
+
+def payslip_saved(payslip):
+    changes = _changes()
+    before = getattr(payslip, '_ledger_before', None)
+    if before is not None and before['employee_id'] == payslip.employee_id:
+        department_id = before['employee__department_id']
+    else:
+        department_id = Employee.objects.filter(pk=payslip.employee_id).values_list('department_id', flat=True).first()
+    if before is not None:
+        key = (before['pay_period_start'], before['pay_period_end'], before['employee__department_id'])
+        _add(changes, key, 1, before, sign=-1)
+    key = (payslip.pay_period_start, payslip.pay_period_end, department_id)
+    _add(changes, key, 1, _figures(payslip))
+    # A status change nets out to nothing and writes nothing
+    post(changes)
+    payslip._ledger_before = None
+
+
+def payslip_deleting(payslip):
+    # Looked up before an employee being deleted with their payslips is gone
+    payslip._ledger_department_id = Employee.objects.filter(
+        pk=payslip.employee_id,
+    ).values_list('department_id', flat=True).first()
+
+
+def payslip_deleted(payslip):
+    changes = _changes()
+    key = (payslip.pay_period_start, payslip.pay_period_end, getattr(payslip, '_ledger_department_id', None))
+    _add(changes, key, 1, _figures(payslip), sign=-1)
+    post(changes)
+
+
+def employees_moved(employee_ids, from_department_id=None, removed=False):
+    """
+    Moves the employees' payslips from a department to their current one. With
+    removed the old department's entries are already gone (deleted with it).
+    """
+    if not employee_ids:
+        return
+    changes = _changes()
+    for (start, end, department_id), payslips, amounts in ledger_rows(Payslip.objects.filter(employee_id__in=employee_ids)):
+        if not removed:
+            _add(changes, (start, end, from_department_id), payslips, amounts, sign=-1)
+        _add(changes, (start, end, department_id), payslips, amounts)
+    post(changes)
+
+
+# Reads
+
+def latest_period():
+    return PayrollLedgerEntry.objects.order_by('-pay_period_end', '-pay_period_start').values_list(
+        'pay_period_start', 'pay_period_end',
+    ).first()
+
+
+def period_totals(start, end):
+    """
+    [{department_id, department, payslips, <component>: amount}] for a pay period,
+    one row per department with the staff without one last, and the totals
+    over all of them. Reads O(departments) ledger entries.
+    """
+    departments = {}
+    for department_id, name, component, amount, payslips in PayrollLedgerEntry.objects.filter(
+        pay_period_start=start, pay_period_end=end,
+    ).values_list('department_id', 'department__dpt_name', 'component', 'amount', 'payslips'):
+        row = departments.setdefault(department_id, {
+            'department_id': department_id, 'department': name or 'No department', 'payslips': payslips,
+        })
+        row[component] = amount
+
+    rows = sorted(departments.values(), key=lambda row: (row['department_id'] is None, row['department']))
+    total = {'department_id': None, 'department': 'All departments', 'payslips': sum(row['payslips'] for row in rows)}
+    for component in COMPONENTS:
+        total[component] = sum((row.get(component, 0) for row in rows), Decimal(0))
+    for row in (*rows, total):
+        row['average_gross'] = row['gross_salary'] / row['payslips'] if row['payslips'] else Decimal(0)
+    return rows, total
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ElevateHRApp.disbursements import apply_results
+from ElevateHRApp.models import DisbursementBatch
+
+
+class Command(BaseCommand):
+    help = "Updates a disbursement batch from the bank's results file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('batch', type=int, help="Disbursement batch id")
+        parser.add_argument('file', help="CSV with reference and status columns")
+
+    def handle(self, *args, **options):
+        try:
+            batch = DisbursementBatch.objects.get(pk=options['batch'])
+            with open(options['file'], 'rb') as upload:
+                result = apply_results(batch, upload)
+        except (DisbursementBatch.DoesNotExist, OSError, ValueError) as e:
+            raise CommandError(e)
+
+        for line, message in result['errors']:
+            self.stderr.write(f"Row {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['rows']} rows in {result['seconds']:.2f}s: {result['successful']} paid, "
+            f"{result['failed']} failed, {result['unchanged']} already recorded, {len(result['errors'])} rejected"
+        ))
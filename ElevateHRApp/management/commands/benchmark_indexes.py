@@ -0,0 +1,310 @@
+from datetime import date, timedelta
+from django.apps import apps as django_apps
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.db.migrations.state import ProjectState
+import math
+import random
+import statistics
+import time
+
+from ElevateHRApp.models import Attendance, Department, Employee, LeaveRequest, Payslip
+
+
+# The indexes and constraints under test, everything else (PKs, FK indexes) stays in place
+INDEX_PACK = (
+    'employee_status_idx',
+    'employee_phone_idx',
+    'attendance_one_per_day',
+    'attendance_date_idx',
+    'leave_employee_status_idx',
+    'leave_pending_idx',
+    'payslip_employee_period_idx',
+)
+
+INSERT_BATCH_SIZE = 50000
+EPOCH = date(2024, 1, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds a synthetic HR dataset in a throwaway database and times the hot lookups "
+        "with and without the index pack, printing the EXPLAIN plans of both runs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=100000)
+        parser.add_argument('--attendance', type=int, default=10000000, help="Attendance rows")
+        parser.add_argument('--repeat', type=int, default=30, help="Timed runs per query")
+        parser.add_argument('--db-file', default='benchmark_indexes.sqlite3',
+                            help="Database file when running on SQLite")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the benchmark database and reuse its data next time")
+        parser.add_argument('--output', help="Also write the report to this markdown file")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.lines = []
+
+        # Never touch the real data, the dataset lives in a test database
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = options['db_file']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        try:
+            if not Employee.objects.exists():
+                self.populate()
+            self.load_samples()
+
+            self.set_pack(False)
+            before = self.measure()
+            self.set_pack(True)
+            after = self.measure()
+            self.report(before, after)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if options['output']:
+            with open(options['output'], 'w') as report:
+                report.write("\n".join(self.lines) + "\n")
+
+    def log(self, line="", style=None):
+        self.lines.append(line)
+        self.stdout.write(style(line) if style else line)
+
+    # Dataset
+
+    def insert_rows(self, model, fields, rows):
+        """
+        Raw executemany in batches, the ORM's per-object overhead dominates at 10M rows
+        """
+        columns = [model._meta.get_field(field).column for field in fields]
+        sql = (
+            f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} "
+            f"({', '.join(connection.ops.quote_name(column) for column in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        batch, written = [], 0
+        with connection.cursor() as cursor:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    with transaction.atomic():
+                        cursor.executemany(sql, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                with transaction.atomic():
+                    cursor.executemany(sql, batch)
+                written += len(batch)
+        return written
+
+    def populate(self):
+        employees, attendance = self.options['employees'], self.options['attendance']
+        started = time.perf_counter()
+        rng = self.random
+
+        Department.objects.bulk_create([
+            Department(dpt_name=name, code=f"D{index:02d}") for index, (name, _) in enumerate(Department.DEPT)
+        ])
+        department_ids = list(Department.objects.values_list('id', flat=True))
+        statuses = [status for status, _ in Employee.EMP_STATUS]
+
+        for start in range(0, employees, 5000):
+            Employee.objects.bulk_create([
+                Employee(
+                    fname=f"First{number}", lname=f"Last{number}", sname="Bench",
+                    employee_profession=rng.choice(Employee.PROFESSIONS)[0],
+                    gender=rng.choice(['Male', 'Female']), marital_status='Single', nationality='Kenya',
+                    email=f"employee{number}@bench.example", phone_number=f"07{number:08d}",
+                    address="Nairobi", city="Nairobi", country="Kenya",
+                    job_title="Staff", department_id=rng.choice(department_ids), employment_type='Full-time',
+                    date_joined=EPOCH - timedelta(days=rng.randrange(3650)),
+                    # Mostly active, so the rarer statuses are the selective lookups
+                    employment_status='Active' if rng.random() < 0.9 else rng.choice(statuses),
+                    salary=rng.randrange(30000, 400000), bank_name="Bench Bank", bank_account_number=str(number),
+                    emergency_contact_name="Contact", emergency_contact_relation="Sibling",
+                    emergency_contact_phone="0700000000", id_number=str(number),
+                )
+                for number in range(start, min(start + 5000, employees))
+            ])
+        employee_ids = list(Employee.objects.values_list('employee_ID', flat=True))
+        self.log(f"Created {len(employee_ids)} employees")
+
+        days = math.ceil(attendance / len(employee_ids))
+
+        def attendance_rows():
+            count = 0
+            for day in range(days):
+                attendance_date = (EPOCH + timedelta(days=day)).isoformat()
+                for employee_id in employee_ids:
+                    if count >= attendance:
+                        return
+                    count += 1
+                    status = 'Present' if rng.random() < 0.92 else rng.choice(['Absent', 'Leave'])
+                    present = status == 'Present'
+                    yield (
+                        employee_id, attendance_date,
+                        f"08:{rng.randrange(60):02d}:00" if present else None,
+                        f"17:{rng.randrange(60):02d}:00" if present else None,
+                        status,
+                    )
+
+        written = self.insert_rows(
+            Attendance,
+            ['attendance_employee', 'attendance_date', 'attendance_check_in', 'attendance_check_out', 'attendance_status'],
+            attendance_rows(),
+        )
+        self.log(f"Created {written} attendance rows over {days} days")
+
+        def leave_rows():
+            for employee_id in employee_ids:
+                for _ in range(3):
+                    start = EPOCH + timedelta(days=rng.randrange(365))
+                    yield (
+                        employee_id, rng.choice(LeaveRequest.LEAVE_TYPES)[0], start.isoformat(),
+                        (start + timedelta(days=rng.randrange(1, 10))).isoformat(), "Synthetic",
+                        'Pending' if rng.random() < 0.05 else rng.choice(['Approved', 'Rejected']),
+                    )
+
+        written = self.insert_rows(
+            LeaveRequest,
+            ['leave_employee', 'leave_type', 'leave_start_date', 'leave_end_date', 'leave_reason', 'leave_status'],
+            leave_rows(),
+        )
+        self.log(f"Created {written} leave requests")
+
+        def payslip_rows():
+            generated_on = EPOCH.isoformat()
+            for employee_id in employee_ids:
+                basic = rng.randrange(30000, 400000)
+                for month in range(1, 13):
+                    start = date(EPOCH.year, month, 1)
+                    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+                    yield (
+                        employee_id, start.isoformat(), end.isoformat(), generated_on, 'Paid',
+                        basic, 0, 0, basic, 0, 0, 0, 0, 0, basic,
+                    )
+
+        written = self.insert_rows(
+            Payslip,
+            ['employee', 'pay_period_start', 'pay_period_end', 'generated_on', 'status',
+             'basic_salary', 'allowances', 'bonuses', 'gross_salary', 'income_tax', 'nssf_deduction',
+             'nhif_deduction', 'other_deductions', 'total_deductions', 'net_salary'],
+            payslip_rows(),
+        )
+        self.log(f"Created {written} payslips in {time.perf_counter() - started:.1f}s")
+
+    def load_samples(self):
+        self.employee_ids = list(Employee.objects.values_list('employee_ID', flat=True)[:5000])
+        self.phones = list(Employee.objects.values_list('phone_number', flat=True)[:5000])
+        last_day = Attendance.objects.order_by('-attendance_date').values_list('attendance_date', flat=True).first()
+        self.days = (last_day - EPOCH).days + 1 if last_day else 1
+
+    # Index pack
+
+    def pack_items(self):
+        # Constraints first, SQLite rebuilds the whole table to add or drop one
+        for model in (Employee, Attendance, LeaveRequest, Payslip):
+            for item in list(model._meta.constraints) + list(model._meta.indexes):
+                if item.name in INDEX_PACK:
+                    yield model, item
+
+    def stripped_apps(self):
+        """
+        The models as they would be without the pack, so a table rebuild leaves it out
+        """
+        project = ProjectState.from_apps(django_apps)
+        for model_state in project.models.values():
+            for option in ('indexes', 'constraints'):
+                model_state.options[option] = [
+                    item for item in model_state.options.get(option, []) if item.name not in INDEX_PACK
+                ]
+        return project.apps
+
+    def existing_names(self, model):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+
+    def set_pack(self, enabled):
+        started = time.perf_counter()
+        stripped = None if enabled else self.stripped_apps()
+        with connection.schema_editor() as editor:
+            for model, item in self.pack_items():
+                if enabled == (item.name in self.existing_names(model)):
+                    continue
+                target = model if enabled else stripped.get_model(model._meta.app_label, model._meta.model_name)
+                if isinstance(item, models.Index):
+                    (editor.add_index if enabled else editor.remove_index)(target, item)
+                else:
+                    (editor.add_constraint if enabled else editor.remove_constraint)(target, item)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.log(
+            f"{'Created' if enabled else 'Dropped'} the index pack in {time.perf_counter() - started:.1f}s",
+            self.style.MIGRATE_HEADING,
+        )
+
+    # Queries
+
+    def cases(self):
+        rng = self.random
+        return [
+            ("Employees with a status", lambda: Employee.objects.filter(employment_status='Retired').order_by(),
+             lambda qs: qs.count()),
+            ("Employee by phone number", lambda: Employee.objects.filter(
+                phone_number=rng.choice(self.phones)).order_by().values_list('employee_ID', flat=True), list),
+            ("Attendance for an employee on a day", lambda: Attendance.objects.filter(
+                attendance_employee_id=rng.choice(self.employee_ids),
+                attendance_date=EPOCH + timedelta(days=rng.randrange(self.days))), list),
+            ("Absentees on a day", lambda: Attendance.objects.filter(
+                attendance_date=EPOCH + timedelta(days=rng.randrange(self.days)), attendance_status='Absent'),
+             lambda qs: qs.count()),
+            ("Employee's pending leave", lambda: LeaveRequest.objects.filter(
+                leave_employee_id=rng.choice(self.employee_ids), leave_status='Pending'), list),
+            ("Leave approval queue", lambda: LeaveRequest.objects.filter(
+                leave_status='Pending').order_by('leave_start_date')[:50], list),
+            ("Latest payslip of an employee", lambda: Payslip.objects.filter(
+                employee_id=rng.choice(self.employee_ids)).order_by('-pay_period_end')[:1], list),
+        ]
+
+    def measure(self):
+        results = {}
+        for label, build, run in self.cases():
+            plan = build().explain()
+            run(build())  # warm the cache
+            timings = []
+            for _ in range(self.options['repeat']):
+                queryset = build()
+                started = time.perf_counter()
+                run(queryset)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results[label] = {
+                'median': statistics.median(timings),
+                'p95': timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+                'plan': plan,
+            }
+        return results
+
+    def report(self, before, after):
+        self.log()
+        self.log(f"| Query | Before median (ms) | After median (ms) | Before p95 | After p95 | Speed-up |")
+        self.log("|---|---:|---:|---:|---:|---:|")
+        for label in before:
+            old, new = before[label], after[label]
+            speedup = old['median'] / new['median'] if new['median'] else float('inf')
+            self.log(
+                f"| {label} | {old['median']:.3f} | {new['median']:.3f} | "
+                f"{old['p95']:.3f} | {new['p95']:.3f} | {speedup:.1f}x |"
+            )
+
+        for label in before:
+            self.log()
+            self.log(f"### {label}", self.style.MIGRATE_HEADING)
+            self.log("Without the index pack:")
+            self.log("```\n" + before[label]['plan'] + "\n```")
+            self.log("With the index pack:")
+            self.log("```\n" + after[label]['plan'] + "\n```")
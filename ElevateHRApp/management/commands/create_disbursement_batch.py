@@ -0,0 +1,40 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+
+from ElevateHRApp.disbursements import create_batch, issue_bank_file, streaming_bank_file
+from ElevateHRApp.models import Department
+from ElevateHRApp.payroll import month_period
+
+
+class Command(BaseCommand):
+    help = "Creates the disbursements for a pay period's Generated payslips and optionally writes the bank file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="Earliest pay period end, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Latest pay period end, YYYY-MM-DD")
+        parser.add_argument('--department', help="Department code, every department when left out")
+        parser.add_argument('--bank-file', help="Write the bank file to this path")
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start is None or end is None:
+            start, end = month_period(start or end or date.today())
+        try:
+            department = Department.objects.get(code=options['department']) if options['department'] else None
+            batch, result = create_batch(start, end, department=department)
+        except (Department.DoesNotExist, ValueError) as e:
+            raise CommandError(e)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch {batch.pk}: {result['created']} disbursements created, {result['retried']} failed ones queued "
+            f"again, {batch.payments} payments of {batch.total_amount:,.2f} in {result['seconds']:.2f}s"
+        ))
+        if options['bank_file']:
+            number = issue_bank_file(batch)
+            if number is None:
+                self.stdout.write("Nothing to pay, no bank file written")
+                return
+            with open(options['bank_file'], 'wb') as output:
+                for chunk in streaming_bank_file(batch, number).streaming_content:
+                    output.write(chunk)
+            self.stdout.write(f"Bank file {number} written to {options['bank_file']}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+import time
+
+from ElevateHRApp.sms_outbox import dispatch_pending, DISPATCH_POLL_SECONDS
+
+
+class Command(BaseCommand):
+    help = "Sends queued outbox SMS, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit")
+        parser.add_argument('--interval', type=float, default=DISPATCH_POLL_SECONDS / 10,
+                            help="Seconds to sleep when the outbox is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = dispatch_pending()
+            if sent:
+                self.stdout.write(f"Sent {sent} message(s)")
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ElevateHRApp.employee_import import IMPORT_BATCH_SIZE, import_employees
+
+
+class Command(BaseCommand):
+    help = "Imports employees from a CSV or XLSX file, see ElevateHRApp.employee_import for the columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="Rows per bulk insert")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate, write nothing")
+        parser.add_argument('--errors', help="Write the error report to this CSV file")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as upload:
+                result = import_employees(
+                    upload, options['path'], batch_size=options['batch_size'], dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        verb = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['created']} of {result['rows']} rows in {result['seconds']:.1f}s "
+            f"({result['rows'] / max(result['seconds'], 0.001):.0f} rows/s)"
+        ))
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(result['errors'])} rows had problems, {result['failed']} were not imported"
+            ))
+            if options['errors']:
+                with open(options['errors'], 'w', newline='') as report:
+                    report.write(result['error_report'])
+                self.stdout.write(f"Error report written to {options['errors']}")
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from ElevateHRApp.models import Attendance
+
+
+class Command(BaseCommand):
+    help = (
+        "Merges attendance recorded more than once for an employee on a day into one row, the earliest "
+        "check-in and the latest check-out, so migration 0013's unique constraint can go on"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the duplicates without changing them")
+
+    def handle(self, *args, **options):
+        duplicates = (
+            Attendance.objects.values('attendance_employee_id', 'attendance_date')
+            .annotate(rows=Count('id'))
+            .filter(rows__gt=1)
+            .order_by('attendance_employee_id', 'attendance_date')
+        )
+        merged = deleted = 0
+        with transaction.atomic():
+            for duplicate in duplicates:
+                rows = list(Attendance.objects.filter(
+                    attendance_employee_id=duplicate['attendance_employee_id'],
+                    attendance_date=duplicate['attendance_date'],
+                ).order_by('id'))
+                keep, extra = rows[0], rows[1:]
+                check_ins = [row.attendance_check_in for row in rows if row.attendance_check_in]
+                check_outs = [row.attendance_check_out for row in rows if row.attendance_check_out]
+                keep.attendance_check_in = min(check_ins) if check_ins else None
+                keep.attendance_check_out = max(check_outs) if check_outs else None
+                if any(row.attendance_status == 'Present' for row in rows):
+                    keep.attendance_status = 'Present'
+
+                self.stdout.write(
+                    f"Employee {duplicate['attendance_employee_id']} on {duplicate['attendance_date']}: "
+                    f"keeping #{keep.id} ({keep.attendance_check_in} to {keep.attendance_check_out}, "
+                    f"{keep.attendance_status}), removing {', '.join(f'#{row.id}' for row in extra)}"
+                )
+                if not options['dry_run']:
+                    keep.save()
+                    Attendance.objects.filter(id__in=[row.id for row in extra]).delete()
+                merged += 1
+                deleted += len(extra)
+
+        if options['dry_run']:
+            self.stdout.write(f"{merged} days would be merged, {deleted} rows removed")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Merged {merged} days, removed {deleted} rows"))
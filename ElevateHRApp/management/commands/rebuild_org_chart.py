@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+import time
+
+from ElevateHRApp.org_chart import rebuild_hierarchy
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the org chart closure table from Employee.supervisor, e.g. after a bulk import or a restore"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        links, broken = rebuild_hierarchy()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {links} reporting links in {time.perf_counter() - started:.2f}s"
+        ))
+        if broken:
+            self.stdout.write(self.style.WARNING(
+                f"Supervisor loops were cut at employees {broken}, they show as top level until fixed"
+            ))
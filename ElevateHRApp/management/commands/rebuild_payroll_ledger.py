@@ -0,0 +1,20 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+import time
+
+from ElevateHRApp.ledger import rebuild_payroll_ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the payroll ledger from the payslips, e.g. after payslips were changed with raw SQL or a restore"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="Only pay periods ending on or after, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Only pay periods ending on or before, YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_payroll_ledger(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} ledger entries in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+import time
+
+from ElevateHRApp.search import rebuild_search_index, search_available
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the employee full-text search index, e.g. after a bulk import or a restore"
+
+    def handle(self, *args, **options):
+        if not search_available():
+            self.stdout.write(self.style.WARNING("No search index on this database, search uses LIKE"))
+            return
+        started = time.perf_counter()
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} employees in {time.perf_counter() - started:.2f}s"
+        ))
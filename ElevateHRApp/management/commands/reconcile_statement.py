@@ -0,0 +1,31 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+
+from ElevateHRApp.reconciliation import reconcile_statement
+
+
+class Command(BaseCommand):
+    help = "Reconciles a bank statement CSV against a pay period's disbursements"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Bank statement CSV")
+        parser.add_argument('--start', type=date.fromisoformat, required=True, help="Earliest pay period end, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, required=True, help="Latest pay period end, YYYY-MM-DD")
+        parser.add_argument('--report', help="Write the exceptions report to this path")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file'], 'rb') as statement:
+                result = reconcile_statement(statement, options['start'], options['end'])
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        if options['report'] and result['exceptions_report']:
+            with open(options['report'], 'w', newline='') as report:
+                report.write(result['exceptions_report'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['matched']} of {result['lines']} lines matched in {result['seconds']:.2f}s "
+            f"({result['by_transaction']} by transaction id, {result['by_account']} by account), "
+            f"{result['updated']} disbursements updated, {result['returned']} returned, "
+            f"{len(result['exceptions'])} exceptions"
+        ))
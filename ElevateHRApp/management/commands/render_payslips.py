@@ -0,0 +1,36 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+
+from ElevateHRApp.models import Department, Payslip
+from ElevateHRApp.payslip_documents import render_payslips
+
+
+class Command(BaseCommand):
+    help = "Renders and stores the payslip PDFs for a pay period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="Earliest pay period end, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Latest pay period end, YYYY-MM-DD")
+        parser.add_argument('--department', help="Department code, every department when left out")
+        parser.add_argument('--run', type=int, help="Only the payslips of this payroll run")
+        parser.add_argument('--workers', type=int, help="Worker processes, one per CPU by default")
+
+    def handle(self, *args, **options):
+        payslips = Payslip.objects.all()
+        if options['start']:
+            payslips = payslips.filter(pay_period_end__gte=options['start'])
+        if options['end']:
+            payslips = payslips.filter(pay_period_end__lte=options['end'])
+        if options['run']:
+            payslips = payslips.filter(payroll_run_id=options['run'])
+        if options['department']:
+            try:
+                payslips = payslips.filter(employee__department=Department.objects.get(code=options['department']))
+            except Department.DoesNotExist as e:
+                raise CommandError(e)
+
+        result = render_payslips(payslips, workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {result['rendered']} payslips, {result['changed']} new or changed, "
+            f"in {result['seconds']:.2f}s"
+        ))
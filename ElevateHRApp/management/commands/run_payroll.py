@@ -0,0 +1,39 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+
+from ElevateHRApp.models import Department, PayrollRun
+from ElevateHRApp.payroll import PAYROLL_BATCH_SIZE, run_payroll, start_payroll_run
+
+
+class Command(BaseCommand):
+    help = "Generates the payslips for a pay period, the current month by default"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day of the period, YYYY-MM-DD")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day of the period, YYYY-MM-DD")
+        parser.add_argument('--department', help="Department code, every department when left out")
+        parser.add_argument('--run', type=int, help="Repeat an existing payroll run instead of starting one")
+        parser.add_argument('--batch-size', type=int, default=PAYROLL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            if options['run']:
+                run = run_payroll(PayrollRun.objects.get(pk=options['run']), batch_size=options['batch_size'])
+            else:
+                department = None
+                if options['department']:
+                    department = Department.objects.get(code=options['department'])
+                run = start_payroll_run(
+                    options['start'], options['end'], department=department, batch_size=options['batch_size'],
+                )
+        except (PayrollRun.DoesNotExist, Department.DoesNotExist, ValueError) as e:
+            raise CommandError(e)
+
+        if run.status == 'Failed':
+            raise CommandError(f"Payroll run {run.pk} failed: {run.error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Payroll run {run.pk} for {run.pay_period_start} to {run.pay_period_end}: "
+            f"{run.payslips_created} payslips, {run.payslips_skipped} already paid, "
+            f"net {run.total_net:,.2f} in {run.duration_seconds:.2f}s "
+            f"({run.payslips_per_second or 0:,.0f} payslips/s)"
+        ))
@@ -0,0 +1,42 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+import time
+
+from ElevateHRApp.models import Department, Employee
+from ElevateHRApp.payroll import PAYROLL_STATUSES, to_cents
+from ElevateHRApp.statutory import compare, rates_in_force
+
+
+class Command(BaseCommand):
+    help = "Compares the statutory deductions on current salaries under the rates in force on two dates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--on', type=date.fromisoformat, default=date.today(), help="YYYY-MM-DD, today by default")
+        parser.add_argument('--against', type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+        parser.add_argument('--department', help="Department code, every department when left out")
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.filter(employment_status__in=PAYROLL_STATUSES)
+        if options['department']:
+            try:
+                employees = employees.filter(department=Department.objects.get(code=options['department']))
+            except Department.DoesNotExist as e:
+                raise CommandError(e)
+        gross = to_cents(list(employees.values_list('salary', flat=True)))
+
+        started = time.perf_counter()
+        try:
+            summary = compare(gross, options['on'], options['against'])
+        except ValueError as e:
+            raise CommandError(e)
+        seconds = time.perf_counter() - started
+
+        for label, on in (('Current', options['on']), ('Proposed', options['against'])):
+            versions = ", ".join(rates.version for rates in rates_in_force(on).values())
+            self.stdout.write(f"{label} ({on}): {versions}")
+        self.stdout.write(f"{'':<18}{'current':>16}{'proposed':>16}{'change':>16}")
+        for name, row in summary.items():
+            self.stdout.write(
+                f"{name:<18}" + "".join(f"{row[column] / 100:>16,.2f}" for column in ('current', 'proposed', 'change'))
+            )
+        self.stdout.write(self.style.SUCCESS(f"{len(gross)} employees in {seconds * 1000:.1f}ms"))
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:20
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0005_payslip_disbursement_delete_payroll"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PosterJob",
+            fields=[
+                (
+                    "job_id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("job_title", models.CharField(max_length=255)),
+                ("prompt", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Queued", "Queued"),
+                            ("Running", "Running"),
+                            ("Completed", "Completed"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Queued",
+                        max_length=20,
+                    ),
+                ),
+                ("variants_requested", models.PositiveSmallIntegerField(default=1)),
+                ("variants_completed", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "posters",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="Storage paths of the generated posters",
+                    ),
+                ),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Poster Job",
+                "verbose_name_plural": "Poster Jobs",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0006_posterjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingRegistration",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("phone", models.CharField(max_length=20, unique=True)),
+                ("otp_hash", models.CharField(max_length=64)),
+                ("first_name", models.CharField(blank=True, max_length=200)),
+                ("last_name", models.CharField(blank=True, max_length=200)),
+                ("email", models.EmailField(blank=True, max_length=254)),
+                (
+                    "password",
+                    models.CharField(
+                        help_text="Hashed, never the raw password", max_length=128
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "verbose_name": "Pending Registration",
+                "verbose_name_plural": "Pending Registrations",
+            },
+        ),
+    ]
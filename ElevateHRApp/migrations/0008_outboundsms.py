@@ -0,0 +1,92 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0007_pendingregistration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboundSms",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("recipient", models.CharField(max_length=20)),
+                ("message", models.TextField()),
+                ("sender", models.CharField(blank=True, max_length=20)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("OTP", "OTP"),
+                            ("Welcome", "Welcome"),
+                            ("Notification", "Notification"),
+                        ],
+                        default="Notification",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "priority",
+                    models.PositiveSmallIntegerField(
+                        default=5, help_text="Lower values are sent first"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Queued", "Queued"),
+                            ("Sending", "Sending"),
+                            ("Sent", "Sent"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Queued",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("claimed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "provider_message_id",
+                    models.CharField(
+                        blank=True, db_index=True, max_length=100, null=True
+                    ),
+                ),
+                (
+                    "provider_status",
+                    models.CharField(blank=True, max_length=50, null=True),
+                ),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Outbound SMS",
+                "verbose_name_plural": "Outbound SMS",
+                "ordering": ["priority", "created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "priority", "next_attempt_at"],
+                        name="outboundsms_dispatch_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0008_outboundsms"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SmsCampaign",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=200)),
+                ("message", models.TextField()),
+                (
+                    "employment_status",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("Active", "Active"),
+                            ("On Leave", "On Leave"),
+                            ("Terminated", "Terminated"),
+                            ("Resigned", "Resigned"),
+                            ("Retired", "Retired"),
+                        ],
+                        help_text="Leave empty to message every status",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Draft", "Draft"),
+                            ("Sending", "Sending"),
+                            ("Completed", "Completed"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Draft",
+                        max_length=20,
+                    ),
+                ),
+                ("total_recipients", models.PositiveIntegerField(default=0)),
+                ("sent_count", models.PositiveIntegerField(default=0)),
+                ("failed_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "department",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Leave empty to message every department",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="ElevateHRApp.department",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "SMS Campaign",
+                "verbose_name_plural": "SMS Campaigns",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SmsCampaignRecipient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("phone_number", models.CharField(max_length=20)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("Sent", "Sent"), ("Failed", "Failed")], max_length=20
+                    ),
+                ),
+                (
+                    "provider_message_id",
+                    models.CharField(
+                        blank=True, db_index=True, max_length=100, null=True
+                    ),
+                ),
+                (
+                    "provider_status",
+                    models.CharField(blank=True, max_length=50, null=True),
+                ),
+                ("cost", models.CharField(blank=True, max_length=30, null=True)),
+                ("error", models.TextField(blank=True, null=True)),
+                ("sent_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "campaign",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recipients",
+                        to="ElevateHRApp.smscampaign",
+                    ),
+                ),
+                (
+                    "employee",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="ElevateHRApp.employee",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "SMS Campaign Recipient",
+                "verbose_name_plural": "SMS Campaign Recipients",
+                "indexes": [
+                    models.Index(
+                        fields=["campaign", "status"], name="smsrecipient_campaign_idx"
+                    )
+                ],
+            },
+        ),
+    ]
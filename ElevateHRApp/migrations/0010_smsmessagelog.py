@@ -0,0 +1,101 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0009_smscampaign"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SmsDeliveryStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(unique=True)),
+                ("reports", models.PositiveIntegerField(default=0)),
+                ("delivered", models.PositiveIntegerField(default=0)),
+                ("failed", models.PositiveIntegerField(default=0)),
+                ("total_latency_seconds", models.FloatField(default=0)),
+                ("max_latency_seconds", models.FloatField(default=0)),
+            ],
+            options={
+                "verbose_name": "SMS Delivery Stats",
+                "verbose_name_plural": "SMS Delivery Stats",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SmsMessageLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider_message_id", models.CharField(max_length=100, unique=True)),
+                ("phone_number", models.CharField(max_length=20)),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("Outbox", "Outbox"), ("Campaign", "Campaign")],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        default="Sent",
+                        help_text="Latest status reported by the provider",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "failure_reason",
+                    models.CharField(blank=True, max_length=100, null=True),
+                ),
+                (
+                    "network_code",
+                    models.CharField(blank=True, max_length=20, null=True),
+                ),
+                ("sent_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("reported_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "latency_seconds",
+                    models.FloatField(
+                        blank=True,
+                        help_text="Time from sending to the final report",
+                        null=True,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "SMS Message Log",
+                "verbose_name_plural": "SMS Message Logs",
+                "ordering": ["-sent_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "sent_at"], name="smslog_status_sent_idx"
+                    ),
+                    models.Index(
+                        fields=["phone_number", "sent_at"], name="smslog_phone_sent_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
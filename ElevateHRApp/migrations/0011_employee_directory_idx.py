@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0010_smsmessagelog"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="employee",
+            index=models.Index(
+                fields=["created_at", "employee_ID"], name="employee_directory_idx"
+            ),
+        ),
+    ]
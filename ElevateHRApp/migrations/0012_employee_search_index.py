@@ -0,0 +1,80 @@
+import re
+
+from django.db import migrations
+
+
+# As ElevateHRApp.search had them when this migration was written
+SEARCH_TABLE = "elevatehrapp_employee_search"
+EMAIL_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def create_search_table(apps, schema_editor):
+    # FTS5 on SQLite, tsvector with a GIN index on Postgres, nothing elsewhere
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                "name, job_title, department, profession, email, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except Exception as e:
+            print(f"SQLite was built without FTS5, employee search will use LIKE: {e}")
+    elif vendor == "postgresql":
+        Employee = apps.get_model("ElevateHRApp", "Employee")
+        employee_table = schema_editor.quote_name(Employee._meta.db_table)
+        schema_editor.execute(
+            f"CREATE TABLE {SEARCH_TABLE} ("
+            f"employee_id integer PRIMARY KEY REFERENCES {employee_table} (\"employee_ID\") ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(f"CREATE INDEX {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)")
+
+
+def create_index(apps, schema_editor):
+    create_search_table(apps, schema_editor)
+    connection = schema_editor.connection
+    if SEARCH_TABLE not in connection.introspection.table_names():
+        return
+
+    Employee = apps.get_model("ElevateHRApp", "Employee")
+    documents = [
+        (pk, " ".join(filter(None, (fname, lname, sname))), job_title or "", department or "", profession or "",
+         f"{email} {EMAIL_SEPARATORS.sub(' ', email)}" if email else "")
+        for pk, fname, lname, sname, job_title, department, profession, email in Employee.objects.values_list(
+            "employee_ID", "fname", "lname", "sname", "job_title",
+            "department__dpt_name", "employee_profession", "email",
+        )
+    ]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, job_title, department, profession, email) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                documents,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (employee_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s || ' ' || %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'D'))",
+                documents,
+            )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0011_employee_directory_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
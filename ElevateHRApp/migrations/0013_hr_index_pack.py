@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:34
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_attendance(apps, schema_editor):
+    # The unique constraint needs one row per employee per day. Duplicates are
+    # attendance records, so they are listed for manage.py merge_duplicate_attendance
+    # (or someone) to resolve rather than merged and deleted here
+    Attendance = apps.get_model("ElevateHRApp", "Attendance")
+    duplicates = (
+        Attendance.objects.values("attendance_employee_id", "attendance_date")
+        .annotate(rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by("attendance_employee_id", "attendance_date")
+    )
+    problems = [
+        f"employee {duplicate['attendance_employee_id']} on {duplicate['attendance_date']}: {duplicate['rows']} rows"
+        for duplicate in duplicates
+    ]
+    if problems:
+        raise RuntimeError(
+            "Attendance recorded more than once a day, run manage.py merge_duplicate_attendance "
+            "or resolve them and migrate again:\n  " + "\n  ".join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0012_employee_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_attendance, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="attendance",
+            index=models.Index(fields=["attendance_date"], name="attendance_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="employee",
+            index=models.Index(
+                fields=["employment_status"], name="employee_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="employee",
+            index=models.Index(fields=["phone_number"], name="employee_phone_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="leaverequest",
+            index=models.Index(
+                fields=["leave_employee", "leave_status"],
+                name="leave_employee_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="leaverequest",
+            index=models.Index(
+                condition=models.Q(("leave_status", "Pending")),
+                fields=["leave_start_date"],
+                name="leave_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payslip",
+            index=models.Index(
+                fields=["employee", "-pay_period_end"],
+                name="payslip_employee_period_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="attendance",
+            constraint=models.UniqueConstraint(
+                fields=("attendance_employee", "attendance_date"),
+                name="attendance_one_per_day",
+            ),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def closure_rows(parents):
+    # As ElevateHRApp.org_chart had it when this migration was written: (ancestor, descendant, depth)
+    # for {employee_ID: supervisor_ID or None}, and the employees where a supervisor loop was cut
+    chains, broken = {}, []
+
+    for employee_id in parents:
+        path, seen = [], set()
+        current = employee_id
+        while current is not None and current not in chains and current not in seen:
+            seen.add(current)
+            path.append(current)
+            current = parents.get(current)
+
+        if current in seen:
+            start = path.index(current)
+            broken.append(current)
+            tail = chains[current] = [current]
+            for node in reversed(path[start + 1:]):
+                tail = chains[node] = [node] + tail
+            tail, path = chains[current], path[:start]
+        else:
+            tail = chains[current] if current is not None else []
+
+        for node in reversed(path):
+            tail = chains[node] = [node] + tail
+
+    rows = [
+        (ancestor, employee_id, depth)
+        for employee_id, chain in chains.items()
+        for depth, ancestor in enumerate(chain)
+    ]
+    return rows, broken
+
+
+def populate_hierarchy(apps, schema_editor):
+    Employee = apps.get_model("ElevateHRApp", "Employee")
+    EmployeeHierarchy = apps.get_model("ElevateHRApp", "EmployeeHierarchy")
+    rows, broken = closure_rows(dict(Employee.objects.values_list("employee_ID", "supervisor_id")))
+    if broken:
+        print(f"Supervisor loops cut at employees {broken}, fix their supervisors and run rebuild_org_chart")
+    EmployeeHierarchy.objects.bulk_create(
+        (EmployeeHierarchy(ancestor_id=a, descendant_id=d, depth=depth) for a, d, depth in rows),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0013_hr_index_pack"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmployeeHierarchy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("depth", models.PositiveSmallIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="ElevateHRApp.employee",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="ElevateHRApp.employee",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Employee Hierarchy",
+                "verbose_name_plural": "Employee Hierarchy",
+                "indexes": [
+                    models.Index(
+                        fields=["descendant", "depth"], name="employee_hierarchy_up_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("ancestor", "descendant"),
+                        name="employee_hierarchy_pair",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_hierarchy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_payslips(apps, schema_editor):
+    # The unique constraint needs one payslip per employee per period. Duplicates
+    # are payroll history, a Paid pair may be the only record of a double payment,
+    # so they are listed for someone to resolve rather than deleted
+    Payslip = apps.get_model("ElevateHRApp", "Payslip")
+    duplicates = (
+        Payslip.objects.values("employee_id", "pay_period_start", "pay_period_end")
+        .annotate(rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by("employee_id", "pay_period_end")
+    )
+    problems = []
+    for duplicate in duplicates:
+        rows = Payslip.objects.filter(
+            employee_id=duplicate["employee_id"],
+            pay_period_start=duplicate["pay_period_start"],
+            pay_period_end=duplicate["pay_period_end"],
+        ).order_by("id").values_list("id", "status", "net_salary", "disbursement__status")
+        payslips = ", ".join(
+            f"#{payslip_id} {status} net {net_salary}" + (f" (disbursement {paid})" if paid else "")
+            for payslip_id, status, net_salary, paid in rows
+        )
+        problems.append(
+            f"employee {duplicate['employee_id']}, {duplicate['pay_period_start']} to "
+            f"{duplicate['pay_period_end']}: {payslips}"
+        )
+    if problems:
+        raise RuntimeError(
+            "Payslips duplicated within a pay period, merge or move them to another period "
+            "and migrate again:\n  " + "\n  ".join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0014_employee_hierarchy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PayrollRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pay_period_start", models.DateField()),
+                ("pay_period_end", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Draft", "Draft"),
+                            ("Running", "Running"),
+                            ("Completed", "Completed"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Draft",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("employees_considered", models.PositiveIntegerField(default=0)),
+                ("payslips_created", models.PositiveIntegerField(default=0)),
+                (
+                    "payslips_skipped",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Employees already paid for the period"
+                    ),
+                ),
+                (
+                    "total_gross",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total_deductions",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "total_net",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("duration_seconds", models.FloatField(default=0)),
+                ("error", models.TextField(blank=True, null=True)),
+                (
+                    "department",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Leave empty to pay every department",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="ElevateHRApp.department",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Payroll Run",
+                "verbose_name_plural": "Payroll Runs",
+                "ordering": ["-pay_period_end", "-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="payslip",
+            name="payroll_run",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="payslips",
+                to="ElevateHRApp.payrollrun",
+            ),
+        ),
+        migrations.RunPython(check_duplicate_payslips, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="payslip",
+            constraint=models.UniqueConstraint(
+                fields=("employee", "pay_period_start", "pay_period_end"),
+                name="payslip_one_per_period",
+            ),
+        ),
+    ]
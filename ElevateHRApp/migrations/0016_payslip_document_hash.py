@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0015_payroll_run"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payslip",
+            name="document_hash",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+    ]
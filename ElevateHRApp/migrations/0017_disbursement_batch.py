@@ -0,0 +1,79 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0016_payslip_document_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DisbursementBatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pay_period_start", models.DateField()),
+                ("pay_period_end", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Open", "Open"),
+                            ("Sent", "Sent to bank"),
+                            ("Completed", "Completed"),
+                        ],
+                        default="Open",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("payments", models.PositiveIntegerField(default=0)),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("successful", models.PositiveIntegerField(default=0)),
+                ("failed", models.PositiveIntegerField(default=0)),
+                (
+                    "department",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Leave empty to pay every department",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="ElevateHRApp.department",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Disbursement Batch",
+                "verbose_name_plural": "Disbursement Batches",
+                "ordering": ["-pay_period_end", "-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="disbursement",
+            name="batch",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="disbursements",
+                to="ElevateHRApp.disbursementbatch",
+            ),
+        ),
+    ]
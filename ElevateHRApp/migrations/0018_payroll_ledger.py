@@ -0,0 +1,127 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+COMPONENTS = [
+    "basic_salary", "allowances", "bonuses", "gross_salary", "income_tax",
+    "nssf_deduction", "nhif_deduction", "other_deductions", "total_deductions", "net_salary",
+]
+
+
+def fill_ledger(apps, schema_editor):
+    # The payslips already there, later ones are posted as they change
+    Payslip = apps.get_model("ElevateHRApp", "Payslip")
+    PayrollLedgerEntry = apps.get_model("ElevateHRApp", "PayrollLedgerEntry")
+    rows = (
+        Payslip.objects.order_by()
+        .values("pay_period_start", "pay_period_end", "employee__department_id")
+        .annotate(payslip_count=Count("id"), **{f"sum_{name}": Sum(name) for name in COMPONENTS})
+    )
+    PayrollLedgerEntry.objects.bulk_create(
+        [
+            PayrollLedgerEntry(
+                pay_period_start=row["pay_period_start"],
+                pay_period_end=row["pay_period_end"],
+                department_id=row["employee__department_id"],
+                component=name,
+                amount=row[f"sum_{name}"] or 0,
+                payslips=row["payslip_count"],
+            )
+            for row in rows
+            for name in COMPONENTS
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0017_disbursement_batch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PayrollLedgerEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pay_period_start", models.DateField()),
+                ("pay_period_end", models.DateField()),
+                (
+                    "component",
+                    models.CharField(
+                        choices=[
+                            ("basic_salary", "Basic salary"),
+                            ("allowances", "Allowances"),
+                            ("bonuses", "Bonuses"),
+                            ("gross_salary", "Gross salary"),
+                            ("income_tax", "PAYE"),
+                            ("nssf_deduction", "NSSF"),
+                            ("nhif_deduction", "NHIF / SHIF"),
+                            ("other_deductions", "Other deductions"),
+                            ("total_deductions", "Total deductions"),
+                            ("net_salary", "Net salary"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                ("payslips", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "department",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Empty for staff with no department",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payroll_ledger",
+                        to="ElevateHRApp.department",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Payroll Ledger Entry",
+                "verbose_name_plural": "Payroll Ledger",
+                "ordering": ["-pay_period_end", "department", "component"],
+                "indexes": [
+                    models.Index(
+                        fields=["pay_period_end", "pay_period_start"],
+                        name="ledger_period_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("department__isnull", False)),
+                        fields=(
+                            "pay_period_start",
+                            "pay_period_end",
+                            "department",
+                            "component",
+                        ),
+                        name="ledger_one_per_department",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("department__isnull", True)),
+                        fields=("pay_period_start", "pay_period_end", "component"),
+                        name="ledger_one_without_department",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0018_payroll_ledger"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payslip",
+            name="document_hash",
+            field=models.CharField(
+                blank=True, db_default="", default="", editable=False, max_length=64
+            ),
+        ),
+    ]
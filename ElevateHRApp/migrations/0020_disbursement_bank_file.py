@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:33
+
+from django.db import migrations, models
+
+
+def number_sent_bank_files(apps, schema_editor):
+    # What was already sent as Processing counts as each batch's first bank file
+    Disbursement = apps.get_model("ElevateHRApp", "Disbursement")
+    DisbursementBatch = apps.get_model("ElevateHRApp", "DisbursementBatch")
+    Disbursement.objects.filter(status="Processing", batch__isnull=False).update(bank_file=1)
+    DisbursementBatch.objects.filter(disbursements__bank_file=1).update(bank_files=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0019_payslip_document_hash_db_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="disbursement",
+            name="bank_file",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="disbursementbatch",
+            name="bank_files",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(number_sent_bank_files, migrations.RunPython.noop),
+    ]
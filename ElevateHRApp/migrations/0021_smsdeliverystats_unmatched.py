@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ElevateHRApp", "0020_disbursement_bank_file"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="smsdeliverystats",
+            name="unmatched",
+            field=models.PositiveIntegerField(default=0, help_text="Reports for message ids that were never sent"),
+        ),
+    ]
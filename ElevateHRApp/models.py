@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.text import slugify
 from django.utils import timezone
@@ -181,12 +182,27 @@ class Employee(models.Model):
         verbose_name = "Employee"
         verbose_name_plural = "Employees"
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the directory seeks on this pair
+            models.Index(fields=['created_at', 'employee_ID'], name='employee_directory_idx'),
+            models.Index(fields=['employment_status'], name='employee_status_idx'),
+            models.Index(fields=['phone_number'], name='employee_phone_idx'),
+        ]
 
 
 
     def __str__(self):
         return self.fname + ' ' + self.lname 
 
+    def clean(self):
+        super().clean()
+        # The closure table knows everyone below this employee, signals.py stops what skips validation
+        if self.pk and self.supervisor_id is not None and (
+            self.supervisor_id == self.pk
+            or EmployeeHierarchy.objects.filter(ancestor_id=self.pk, descendant_id=self.supervisor_id).exists()
+        ):
+            raise ValidationError({'supervisor': "An employee cannot report to someone in their own reporting line"})
+
 
 # class JobPosition(models.Model):
 #     job_title = models.CharField(max_length=100, unique=True)
@@ -204,6 +220,15 @@ class Attendance(models.Model):
     attendance_check_out = models.TimeField(null=True, blank=True)
     attendance_status = models.CharField(max_length=20, choices=[('Present', 'Present'), ('Absent', 'Absent'), ('Leave', 'Leave')])
 
+    class Meta:
+        constraints = [
+            # One row per employee per day, also the index for per-employee date lookups
+            models.UniqueConstraint(fields=['attendance_employee', 'attendance_date'], name='attendance_one_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['attendance_date'], name='attendance_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.attendance_employee} {self.attendance_status}"
 
@@ -216,6 +241,9 @@ class LeaveRequest(models.Model):
         ('Emergency', 'Emergency')
     ]
 
+    # Annual leave entitlement per calendar year
+    ANNUAL_LEAVE_DAYS = 21
+
     leave_employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     leave_type = models.CharField(max_length=50, choices=LEAVE_TYPES)
     leave_start_date = models.DateField()
@@ -225,6 +253,18 @@ class LeaveRequest(models.Model):
                               choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected')],
                               default='Pending')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['leave_employee', 'leave_status'], name='leave_employee_status_idx'),
+            # The approval queue only ever reads pending requests, a small slice of the table
+            models.Index(fields=['leave_start_date'], condition=models.Q(leave_status='Pending'),
+                         name='leave_pending_idx'),
+        ]
+
+    @property
+    def days(self):
+        return (self.leave_end_date - self.leave_start_date).days + 1
+
     def __str__(self):
         return str(self.leave_employee) + ' ' + str(self.leave_status)
 
@@ -240,6 +280,50 @@ class PerformanceReview(models.Model):
         return f"{self.performance_employee} {self.performance_reviewer}"
 
 
+class PayrollRun(models.Model):
+    """
+    One batch payroll for a pay period, optionally limited to a department. The
+    engine in payroll.py fills in the payslips and the totals.
+    """
+    RUN_STATUS = [
+        ('Draft', 'Draft'),
+        ('Running', 'Running'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+    pay_period_start = models.DateField()
+    pay_period_end = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True,
+                                   help_text="Leave empty to pay every department")
+    status = models.CharField(max_length=20, choices=RUN_STATUS, default='Draft')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    # Results
+    employees_considered = models.PositiveIntegerField(default=0)
+    payslips_created = models.PositiveIntegerField(default=0)
+    payslips_skipped = models.PositiveIntegerField(default=0, help_text="Employees already paid for the period")
+    total_gross = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_deductions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_net = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    duration_seconds = models.FloatField(default=0)
+    error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Payroll Run"
+        verbose_name_plural = "Payroll Runs"
+        ordering = ['-pay_period_end', '-created_at']
+
+    @property
+    def payslips_per_second(self):
+        return self.payslips_created / self.duration_seconds if self.duration_seconds else None
+
+    def __str__(self):
+        return f"Payroll {self.pay_period_start} to {self.pay_period_end} - {self.status}"
+
+
 class Payslip(models.Model):
     PAYSLIP_STATUS = [
         ('Draft', 'Draft'),
@@ -249,6 +333,8 @@ class Payslip(models.Model):
 
     # Core Info
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='payslips')
+    payroll_run = models.ForeignKey(PayrollRun, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='payslips', editable=False)
     pay_period_start = models.DateField()
     pay_period_end = models.DateField()
     generated_on = models.DateTimeField(auto_now_add=True)
@@ -270,21 +356,120 @@ class Payslip(models.Model):
     # Final Pay
     net_salary = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
 
+    # SHA-256 of the rendered PDF, which is stored under that name
+    document_hash = models.CharField(max_length=64, blank=True, default='', db_default='', editable=False)
+
     class Meta:
         verbose_name = "Payslip"
         verbose_name_plural = "Payslips"
         ordering = ['-pay_period_end', 'employee']
+        indexes = [
+            models.Index(fields=['employee', '-pay_period_end'], name='payslip_employee_period_idx'),
+        ]
+        constraints = [
+            # One payslip per employee per period, so a payroll run can be repeated safely
+            models.UniqueConstraint(fields=['employee', 'pay_period_start', 'pay_period_end'],
+                                    name='payslip_one_per_period'),
+        ]
 
     def save(self, *args, **kwargs):
         self.gross_salary = self.basic_salary + self.allowances + self.bonuses
         self.total_deductions = self.income_tax + self.nssf_deduction + self.nhif_deduction + self.other_deductions
         self.net_salary = self.gross_salary - self.total_deductions
+        # The stored PDF shows the old figures, it is rendered again when next needed
+        self.document_hash = ''
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Payslip for {self.employee} - {self.pay_period_start} to {self.pay_period_end}"
 
 
+class PayrollLedgerEntry(models.Model):
+    """
+    The total of one payslip amount over a pay period's payslips in one
+    department (by the employees' current department). ledger.py keeps it in
+    step with every payslip change, so payroll reports read a few rows per
+    department instead of summing payslips.
+    """
+    COMPONENTS = [
+        ('basic_salary', 'Basic salary'),
+        ('allowances', 'Allowances'),
+        ('bonuses', 'Bonuses'),
+        ('gross_salary', 'Gross salary'),
+        ('income_tax', 'PAYE'),
+        ('nssf_deduction', 'NSSF'),
+        ('nhif_deduction', 'NHIF / SHIF'),
+        ('other_deductions', 'Other deductions'),
+        ('total_deductions', 'Total deductions'),
+        ('net_salary', 'Net salary'),
+    ]
+
+    pay_period_start = models.DateField()
+    pay_period_end = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='payroll_ledger', help_text="Empty for staff with no department")
+    component = models.CharField(max_length=20, choices=COMPONENTS)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    payslips = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Payroll Ledger Entry"
+        verbose_name_plural = "Payroll Ledger"
+        ordering = ['-pay_period_end', 'department', 'component']
+        indexes = [
+            models.Index(fields=['pay_period_end', 'pay_period_start'], name='ledger_period_idx'),
+        ]
+        constraints = [
+            # NULLs never clash in a unique index, staff with no department get one of their own
+            models.UniqueConstraint(fields=['pay_period_start', 'pay_period_end', 'department', 'component'],
+                                    condition=models.Q(department__isnull=False), name='ledger_one_per_department'),
+            models.UniqueConstraint(fields=['pay_period_start', 'pay_period_end', 'component'],
+                                    condition=models.Q(department__isnull=True), name='ledger_one_without_department'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_component_display()} {self.pay_period_start} to {self.pay_period_end}: {self.amount}"
+
+
+class DisbursementBatch(models.Model):
+    """
+    One bank payment run over the Generated payslips of a pay period, optionally
+    limited to a department. disbursements.py fills it, writes the bank file and
+    applies the bank's results.
+    """
+    BATCH_STATUS = [
+        ('Open', 'Open'),
+        ('Sent', 'Sent to bank'),
+        ('Completed', 'Completed'),
+    ]
+
+    pay_period_start = models.DateField()
+    pay_period_end = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True,
+                                   help_text="Leave empty to pay every department")
+    status = models.CharField(max_length=20, choices=BATCH_STATUS, default='Open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    # Totals
+    payments = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    successful = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Bank files issued so far, each disbursement records the one it went out in
+    bank_files = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        verbose_name = "Disbursement Batch"
+        verbose_name_plural = "Disbursement Batches"
+        ordering = ['-pay_period_end', '-created_at']
+
+    def __str__(self):
+        return f"Disbursements {self.pay_period_start} to {self.pay_period_end} - {self.status}"
+
+
 class Disbursement(models.Model):
     DISBURSEMENT_STATUS = [
         ('Pending', 'Pending'),
@@ -294,12 +479,15 @@ class Disbursement(models.Model):
     ]
 
     payslip = models.OneToOneField(Payslip, on_delete=models.CASCADE, related_name='disbursement')
+    batch = models.ForeignKey(DisbursementBatch, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='disbursements', editable=False)
     disbursement_date = models.DateTimeField(auto_now_add=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=DISBURSEMENT_STATUS, default='Pending')
     payment_method = models.CharField(max_length=50, default='Bank Transfer')
     transaction_id = models.CharField(max_length=100, blank=True, null=True)
     failure_reason = models.TextField(blank=True, null=True)
+    bank_file = models.PositiveIntegerField(blank=True, null=True, editable=False)
 
     class Meta:
         verbose_name = "Disbursement"
@@ -351,6 +539,232 @@ class JobPosting(models.Model):
         return f"{self.job_title} at {self.job_department}"
 
 
+class PosterJob(models.Model):
+    JOB_STATUS = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_title = models.CharField(max_length=255)
+    prompt = models.TextField()
+    status = models.CharField(max_length=20, choices=JOB_STATUS, default='Queued')
+    variants_requested = models.PositiveSmallIntegerField(default=1)
+    variants_completed = models.PositiveSmallIntegerField(default=0)
+    posters = models.JSONField(default=list, blank=True, help_text="Storage paths of the generated posters")
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Poster Job"
+        verbose_name_plural = "Poster Jobs"
+        ordering = ['-created_at']
+
+    @property
+    def progress(self):
+        if not self.variants_requested:
+            return 0
+        return round(100 * self.variants_completed / self.variants_requested)
+
+    def __str__(self):
+        return f"Poster job for {self.job_title} - {self.status}"
+
+
+class PendingRegistration(models.Model):
+    phone = models.CharField(max_length=20, unique=True)
+    otp_hash = models.CharField(max_length=64)
+    first_name = models.CharField(max_length=200, blank=True)
+    last_name = models.CharField(max_length=200, blank=True)
+    email = models.EmailField(blank=True)
+    password = models.CharField(max_length=128, help_text="Hashed, never the raw password")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Pending Registration"
+        verbose_name_plural = "Pending Registrations"
+
+    def __str__(self):
+        return f"{self.phone} - expires {self.expires_at}"
+
 
+class OutboundSms(models.Model):
+    SMS_KIND = [
+        ('OTP', 'OTP'),
+        ('Welcome', 'Welcome'),
+        ('Notification', 'Notification'),
+    ]
 
+    SMS_STATUS = [
+        ('Queued', 'Queued'),
+        ('Sending', 'Sending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    ]
+
+    recipient = models.CharField(max_length=20)
+    message = models.TextField()
+    sender = models.CharField(max_length=20, blank=True)
+    kind = models.CharField(max_length=20, choices=SMS_KIND, default='Notification')
+    priority = models.PositiveSmallIntegerField(default=5, help_text="Lower values are sent first")
+    status = models.CharField(max_length=20, choices=SMS_STATUS, default='Queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    provider_message_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    provider_status = models.CharField(max_length=50, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Outbound SMS"
+        verbose_name_plural = "Outbound SMS"
+        ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'next_attempt_at'], name='outboundsms_dispatch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} SMS to {self.recipient} - {self.status}"
 
+
+class SmsCampaign(models.Model):
+    CAMPAIGN_STATUS = [
+        ('Draft', 'Draft'),
+        ('Sending', 'Sending'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    message = models.TextField()
+    department = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True,
+                                   help_text="Leave empty to message every department")
+    employment_status = models.CharField(max_length=20, choices=Employee.EMP_STATUS, blank=True,
+                                         help_text="Leave empty to message every status")
+    status = models.CharField(max_length=20, choices=CAMPAIGN_STATUS, default='Draft')
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "SMS Campaign"
+        verbose_name_plural = "SMS Campaigns"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.name} - {self.status}"
+
+
+class SmsCampaignRecipient(models.Model):
+    RECIPIENT_STATUS = [
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(SmsCampaign, on_delete=models.CASCADE, related_name='recipients')
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True)
+    phone_number = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, choices=RECIPIENT_STATUS)
+    provider_message_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    provider_status = models.CharField(max_length=50, blank=True, null=True)
+    cost = models.CharField(max_length=30, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "SMS Campaign Recipient"
+        verbose_name_plural = "SMS Campaign Recipients"
+        indexes = [
+            models.Index(fields=['campaign', 'status'], name='smsrecipient_campaign_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.phone_number} - {self.status}"
+
+
+class SmsMessageLog(models.Model):
+    SMS_SOURCE = [
+        ('Outbox', 'Outbox'),
+        ('Campaign', 'Campaign'),
+    ]
+
+    provider_message_id = models.CharField(max_length=100, unique=True)
+    phone_number = models.CharField(max_length=20)
+    source = models.CharField(max_length=20, choices=SMS_SOURCE)
+    status = models.CharField(max_length=50, default='Sent', help_text="Latest status reported by the provider")
+    failure_reason = models.CharField(max_length=100, blank=True, null=True)
+    network_code = models.CharField(max_length=20, blank=True, null=True)
+    sent_at = models.DateTimeField(default=timezone.now)
+    reported_at = models.DateTimeField(blank=True, null=True)
+    latency_seconds = models.FloatField(blank=True, null=True, help_text="Time from sending to the final report")
+
+    class Meta:
+        verbose_name = "SMS Message Log"
+        verbose_name_plural = "SMS Message Logs"
+        ordering = ['-sent_at']
+        indexes = [
+            models.Index(fields=['status', 'sent_at'], name='smslog_status_sent_idx'),
+            models.Index(fields=['phone_number', 'sent_at'], name='smslog_phone_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider_message_id} to {self.phone_number} - {self.status}"
+
+
+class SmsDeliveryStats(models.Model):
+    day = models.DateField(unique=True)
+    reports = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    unmatched = models.PositiveIntegerField(default=0, help_text="Reports for message ids that were never sent")
+    total_latency_seconds = models.FloatField(default=0)
+    max_latency_seconds = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name = "SMS Delivery Stats"
+        verbose_name_plural = "SMS Delivery Stats"
+        ordering = ['-day']
+
+    @property
+    def failure_rate(self):
+        finished = self.delivered + self.failed
+        return self.failed / finished if finished else 0
+
+    @property
+    def average_latency_seconds(self):
+        finished = self.delivered + self.failed
+        return self.total_latency_seconds / finished if finished else 0
+
+    def __str__(self):
+        return f"SMS delivery on {self.day}"
+
+
+class EmployeeHierarchy(models.Model):
+    """
+    Closure table over Employee.supervisor: one row per (manager, report) pair
+    at any distance, plus a depth 0 row per employee, maintained by org_chart
+    """
+    ancestor = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Employee Hierarchy"
+        verbose_name_plural = "Employee Hierarchy"
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='employee_hierarchy_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='employee_hierarchy_up_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
@@ -0,0 +1,280 @@
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Q
+
+from .models import Employee, EmployeeHierarchy
+
+
+HIERARCHY_BATCH_SIZE = 5000
+
+# Fields shown on an org chart node
+NODE_FIELDS = ('employee_ID', 'fname', 'lname', 'job_title', 'department__dpt_name', 'supervisor_id')
+
+
+def closure_rows(parents):
+    """
+    (ancestor, descendant, depth) for every pair in {employee_ID: supervisor_ID or None}.
+    Returns (rows, broken) where broken lists the employees at which a looping
+    supervisor chain was cut, they are treated as the top of their tree.
+    """
+    chains, broken = {}, []  # employee_ID -> [employee_ID, supervisor, their supervisor, ...]
+
+    for employee_id in parents:
+        path, seen = [], set()
+        current = employee_id
+        while current is not None and current not in chains and current not in seen:
+            seen.add(current)
+            path.append(current)
+            current = parents.get(current)
+
+        if current in seen:
+            # Cut the loop at the first repeated employee
+            start = path.index(current)
+            broken.append(current)
+            tail = chains[current] = [current]
+            for node in reversed(path[start + 1:]):
+                tail = chains[node] = [node] + tail
+            tail, path = chains[current], path[:start]
+        else:
+            tail = chains[current] if current is not None else []
+
+        for node in reversed(path):
+            tail = chains[node] = [node] + tail
+
+    rows = [
+        (ancestor, employee_id, depth)
+        for employee_id, chain in chains.items()
+        for depth, ancestor in enumerate(chain)
+    ]
+    return rows, broken
+
+
+def insert_links(rows):
+    """
+    Raw executemany of (ancestor, descendant, depth) rows, a full rebuild or a
+    bulk import writes several links per employee and the ORM's per-object
+    overhead dominates at that size
+    """
+    table = connection.ops.quote_name(EmployeeHierarchy._meta.db_table)
+    columns = ", ".join(
+        connection.ops.quote_name(EmployeeHierarchy._meta.get_field(name).column)
+        for name in ('ancestor', 'descendant', 'depth')
+    )
+    sql = f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s)"
+    batch, written = [], 0
+    with connection.cursor() as cursor:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= HIERARCHY_BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            written += len(batch)
+    return written
+
+
+def rebuild_hierarchy():
+    """
+    Recomputes the whole closure table from the supervisor pointers
+    """
+    parents = dict(Employee.objects.values_list('employee_ID', 'supervisor_id'))
+    rows, broken = closure_rows(parents)
+    with transaction.atomic():
+        EmployeeHierarchy.objects.all().delete()
+        insert_links(rows)
+    return len(rows), broken
+
+
+def would_create_cycle(employee_id, supervisor_id):
+    if employee_id is None or supervisor_id is None:
+        return False
+    if employee_id == supervisor_id:
+        return True
+    return EmployeeHierarchy.objects.filter(ancestor_id=employee_id, descendant_id=supervisor_id).exists()
+
+
+def current_supervisor(employee_id):
+    """
+    The supervisor the closure table has on record, None for the top or an unknown employee
+    """
+    return EmployeeHierarchy.objects.filter(descendant_id=employee_id, depth=1).values_list(
+        'ancestor_id', flat=True
+    ).first()
+
+
+def add_employee(employee_id, supervisor_id=None):
+    """
+    Links a new employee under supervisor_id: a copy of the supervisor's ancestor chain one level deeper
+    """
+    links = [EmployeeHierarchy(ancestor_id=employee_id, descendant_id=employee_id, depth=0)]
+    if supervisor_id is not None:
+        links += [
+            EmployeeHierarchy(ancestor_id=ancestor_id, descendant_id=employee_id, depth=depth + 1)
+            for ancestor_id, depth in EmployeeHierarchy.objects.filter(
+                descendant_id=supervisor_id
+            ).values_list('ancestor_id', 'depth')
+        ]
+    EmployeeHierarchy.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def add_employees(parents):
+    """
+    Bulk add_employee for {new employee_ID: supervisor_ID or None}, where a supervisor can be
+    another new employee or an existing one. Returns the employees at which a loop among the
+    new supervisors was cut, as in closure_rows.
+    """
+    # Chains among the new employees first, then each new top inherits its existing supervisor's chain
+    inside = {
+        employee_id: supervisor_id if supervisor_id in parents else None
+        for employee_id, supervisor_id in parents.items()
+    }
+    rows, broken = closure_rows(inside)
+    external = {parents[employee_id] for employee_id, supervisor_id in inside.items() if supervisor_id is None}
+    external.discard(None)
+
+    above = defaultdict(list)
+    for ancestor_id, descendant_id, depth in EmployeeHierarchy.objects.filter(
+        descendant_id__in=external
+    ).values_list('ancestor_id', 'descendant_id', 'depth'):
+        above[descendant_id].append((ancestor_id, depth))
+
+    def links():
+        for ancestor_id, employee_id, depth in rows:
+            yield ancestor_id, employee_id, depth
+            if inside[ancestor_id] is None:
+                for top_id, up in above.get(parents[ancestor_id], ()):
+                    yield top_id, employee_id, depth + up + 1
+
+    with transaction.atomic():
+        insert_links(links())
+    return broken
+
+
+def move_subtree(employee_id, supervisor_id):
+    """
+    Re-parents employee_id and everyone under them: the links from the old
+    ancestors into the subtree are dropped and the new ancestors are crossed
+    with the subtree, the links inside the subtree stay as they are
+    """
+    if would_create_cycle(employee_id, supervisor_id):
+        raise ValueError("An employee cannot report to someone in their own reporting line")
+
+    with transaction.atomic():
+        subtree = list(
+            EmployeeHierarchy.objects.filter(ancestor_id=employee_id).values_list('descendant_id', 'depth')
+        )
+        if not subtree:
+            add_employee(employee_id, supervisor_id)
+            return
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+
+        EmployeeHierarchy.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+
+        if supervisor_id is not None:
+            ancestors = list(
+                EmployeeHierarchy.objects.filter(descendant_id=supervisor_id).values_list('ancestor_id', 'depth')
+            )
+            EmployeeHierarchy.objects.bulk_create(
+                (
+                    EmployeeHierarchy(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+                    for ancestor_id, up in ancestors
+                    for descendant_id, down in subtree
+                ),
+                batch_size=HIERARCHY_BATCH_SIZE,
+            )
+
+
+def supervisor_changed(employee_id, supervisor_id):
+    """
+    Brings the closure table in line after a save, a no-op unless the supervisor actually moved
+    """
+    if not EmployeeHierarchy.objects.filter(ancestor_id=employee_id, descendant_id=employee_id).exists():
+        add_employee(employee_id, supervisor_id)
+    elif current_supervisor(employee_id) != supervisor_id:
+        move_subtree(employee_id, supervisor_id)
+
+
+# Queries, each one indexed read of the closure table
+
+def subtree(employee_id, max_depth=None, include_self=False):
+    """
+    Everyone reporting to employee_id, directly or not, annotated with their distance
+    """
+    links = Q(ancestor_links__ancestor_id=employee_id)
+    links &= Q(ancestor_links__depth__gte=0 if include_self else 1)
+    if max_depth is not None:
+        links &= Q(ancestor_links__depth__lte=max_depth)
+    return Employee.objects.filter(links).annotate(level=F('ancestor_links__depth')).order_by('level', 'employee_ID')
+
+
+def ancestors(employee_id):
+    """
+    The reporting line above employee_id, nearest manager first
+    """
+    return Employee.objects.filter(
+        descendant_links__descendant_id=employee_id, descendant_links__depth__gte=1,
+    ).annotate(level=F('descendant_links__depth')).order_by('level')
+
+
+def reporting_depth(employee_id):
+    return EmployeeHierarchy.objects.filter(descendant_id=employee_id).aggregate(depth=Max('depth'))['depth'] or 0
+
+
+def headcounts(manager_ids=None):
+    """
+    {manager employee_ID: {'direct_reports', 'headcount', 'levels'}} for everyone with reports
+    """
+    links = EmployeeHierarchy.objects.filter(depth__gte=1)
+    if manager_ids is not None:
+        links = links.filter(ancestor_id__in=list(manager_ids))
+    return {
+        row['ancestor_id']: {
+            'direct_reports': row['direct_reports'],
+            'headcount': row['headcount'],
+            'levels': row['levels'],
+        }
+        for row in links.values('ancestor_id').annotate(
+            direct_reports=Count('id', filter=Q(depth=1)),
+            headcount=Count('id'),
+            levels=Max('depth'),
+        ).order_by()
+    }
+
+
+def org_chart(root_id=None, max_depth=None):
+    """
+    Nested {'employee_ID', 'name', ..., 'headcount', 'reports': [...]} trees,
+    one per top-level employee, or the single tree under root_id
+    """
+    if root_id is None:
+        nodes = Employee.objects.order_by('employee_ID')
+        if max_depth is not None:
+            nodes = nodes.annotate(level=Max('ancestor_links__depth')).filter(level__lte=max_depth)
+    else:
+        nodes = subtree(root_id, max_depth=max_depth, include_self=True)
+    rows = list(nodes.values(*NODE_FIELDS))
+    counts = headcounts([row['employee_ID'] for row in rows]) if rows else {}
+
+    by_id = {}
+    for row in rows:
+        by_id[row['employee_ID']] = {
+            'employee_ID': row['employee_ID'],
+            'name': f"{row['fname']} {row['lname']}",
+            'job_title': row['job_title'],
+            'department': row['department__dpt_name'],
+            'direct_reports': counts.get(row['employee_ID'], {}).get('direct_reports', 0),
+            'headcount': counts.get(row['employee_ID'], {}).get('headcount', 0),
+            'reports': [],
+        }
+
+    roots = []
+    for row in rows:
+        node = by_id[row['employee_ID']]
+        parent = by_id.get(row['supervisor_id'])
+        if parent is not None and row['employee_ID'] != root_id:
+            parent['reports'].append(node)
+        else:
+            roots.append(node)
+    return roots
@@ -0,0 +1,240 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from datetime import timedelta
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .models import PendingRegistration
+
+
+DEFAULT_OTP_STORE = {
+    'BACKEND': 'ElevateHRApp.otp_store.DatabaseOTPStore',
+    'TTL': 300,
+    'MAX_ENTRIES': 10000,
+    'MAX_ATTEMPTS': 5,
+}
+
+PROFILE_FIELDS = ('first_name', 'last_name', 'email', 'password')
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def hash_otp(phone, otp):
+    # Keyed on the phone too, so equal codes for two numbers never share a hash
+    message = f"{phone}:{str(otp).strip().upper()}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+class BaseOTPStore:
+    """
+    Pending registrations keyed by phone, with a TTL, a size bound and an attempt limit
+    """
+
+    def __init__(self, ttl=300, max_entries=10000, max_attempts=5, **options):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_attempts = max_attempts
+        self.options = options
+
+    def put(self, phone, otp, first_name='', last_name='', email='', password=''):
+        """Stores (or replaces) the pending registration for phone"""
+        raise NotImplementedError
+
+    def verify(self, phone, otp):
+        """
+        Returns the stored profile and consumes the entry when otp matches,
+        otherwise counts the attempt and returns None
+        """
+        raise NotImplementedError
+
+    def discard(self, phone):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        raise NotImplementedError
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """
+    Backed by the PendingRegistration table, shared by every worker using the default database
+    """
+
+    def put(self, phone, otp, first_name='', last_name='', email='', password=''):
+        now = timezone.now()
+        with transaction.atomic():
+            PendingRegistration.objects.update_or_create(phone=phone, defaults={
+                'otp_hash': hash_otp(phone, otp),
+                'first_name': first_name or '',
+                'last_name': last_name or '',
+                'email': email or '',
+                'password': make_password(password),
+                'attempts': 0,
+                'expires_at': now + timedelta(seconds=self.ttl),
+            })
+        self._enforce_bound()
+
+    def verify(self, phone, otp):
+        now = timezone.now()
+        with transaction.atomic():
+            entry = PendingRegistration.objects.select_for_update().filter(phone=phone).first()
+            if entry is None:
+                return None
+
+            if entry.expires_at <= now or entry.attempts >= self.max_attempts:
+                entry.delete()
+                return None
+
+            if not hmac.compare_digest(entry.otp_hash, hash_otp(phone, otp)):
+                entry.attempts += 1
+                if entry.attempts >= self.max_attempts:
+                    entry.delete()
+                else:
+                    entry.save(update_fields=['attempts'])
+                return None
+
+            entry.delete()
+            return {field: getattr(entry, field) for field in PROFILE_FIELDS}
+
+    def discard(self, phone):
+        PendingRegistration.objects.filter(phone=phone).delete()
+
+    def purge_expired(self):
+        return PendingRegistration.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+    def _enforce_bound(self):
+        if PendingRegistration.objects.count() <= self.max_entries:
+            return
+        self.purge_expired()
+
+        overflow = PendingRegistration.objects.count() - self.max_entries
+        if overflow > 0:
+            oldest = PendingRegistration.objects.order_by('expires_at').values_list('pk', flat=True)[:overflow]
+            PendingRegistration.objects.filter(pk__in=list(oldest)).delete()
+
+
+class SQLiteOTPStore(BaseOTPStore):
+    """
+    Local SQLite file in WAL mode, shared by the gunicorn workers of one host without touching the main database
+    """
+
+    def __init__(self, ttl=300, max_entries=10000, max_attempts=5, **options):
+        super().__init__(ttl, max_entries, max_attempts, **options)
+        self.path = str(options.get('PATH') or os.path.join(settings.BASE_DIR, 'otp_store.sqlite3'))
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_registration (
+                    phone TEXT PRIMARY KEY,
+                    otp_hash TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS pending_registration_expires ON pending_registration (expires_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn = self._local.conn = _Transaction(conn)
+        return conn
+
+    def put(self, phone, otp, first_name='', last_name='', email='', password=''):
+        profile = json.dumps({
+            'first_name': first_name or '',
+            'last_name': last_name or '',
+            'email': email or '',
+            'password': make_password(password),
+        })
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pending_registration (phone, otp_hash, profile, attempts, expires_at) "
+                "VALUES (?, ?, ?, 0, ?)",
+                (phone, hash_otp(phone, otp), profile, time.time() + self.ttl),
+            )
+            self._enforce_bound(conn)
+
+    def verify(self, phone, otp):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT otp_hash, profile, attempts, expires_at FROM pending_registration WHERE phone = ?", (phone,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            otp_hash, profile, attempts, expires_at = row
+            if expires_at <= time.time() or attempts >= self.max_attempts:
+                conn.execute("DELETE FROM pending_registration WHERE phone = ?", (phone,))
+                return None
+
+            if not hmac.compare_digest(otp_hash, hash_otp(phone, otp)):
+                if attempts + 1 >= self.max_attempts:
+                    conn.execute("DELETE FROM pending_registration WHERE phone = ?", (phone,))
+                else:
+                    conn.execute("UPDATE pending_registration SET attempts = attempts + 1 WHERE phone = ?", (phone,))
+                return None
+
+            conn.execute("DELETE FROM pending_registration WHERE phone = ?", (phone,))
+            return json.loads(profile)
+
+    def discard(self, phone):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM pending_registration WHERE phone = ?", (phone,))
+
+    def purge_expired(self):
+        with self._connection() as conn:
+            return conn.execute("DELETE FROM pending_registration WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def _enforce_bound(self, conn):
+        count = conn.execute("SELECT COUNT(*) FROM pending_registration").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        conn.execute("DELETE FROM pending_registration WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM pending_registration WHERE phone IN ("
+            "SELECT phone FROM pending_registration ORDER BY expires_at "
+            "LIMIT max(0, (SELECT COUNT(*) FROM pending_registration) - ?))",
+            (self.max_entries,),
+        )
+
+
+class _Transaction:
+    # Wraps a sqlite3 connection so `with` takes the write lock up front (BEGIN IMMEDIATE)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def get_otp_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = {**DEFAULT_OTP_STORE, **getattr(settings, 'OTP_STORE', {})}
+                backend = import_string(config.pop('BACKEND'))
+                _store = backend(
+                    ttl=config.pop('TTL'),
+                    max_entries=config.pop('MAX_ENTRIES'),
+                    max_attempts=config.pop('MAX_ATTEMPTS'),
+                    **config,
+                )
+    return _store
@@ -0,0 +1,198 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+from django.utils import timezone
+import numpy as np
+import time
+
+from USSD.summaries import rebuild_summaries
+from .dashboard import invalidate_dashboards
+from .ledger import post_batch
+from .models import Employee, Payslip, PayrollRun
+from .statutory import statutory_deductions
+
+
+PAYROLL_BATCH_SIZE = 2000
+# A run still Running after this long lost its worker. Its payslips were written
+# in one transaction that never committed, so it can be claimed and run again.
+STALE_RUN_AFTER = timedelta(hours=1)
+# Staff on leave stay on the payroll
+PAYROLL_STATUSES = ('Active', 'On Leave')
+PAYSLIP_AMOUNTS = (
+    'basic_salary', 'allowances', 'bonuses', 'gross_salary',
+    'income_tax', 'nssf_deduction', 'nhif_deduction', 'other_deductions', 'total_deductions', 'net_salary',
+)
+
+
+def month_period(day):
+    """
+    First and last day of the month day falls in
+    """
+    start = day.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+def check_period(start, end):
+    """
+    Pay is computed from monthly salaries with the monthly PAYE, NSSF and SHIF
+    bands, so a run has to cover exactly one calendar month
+    """
+    if start > end:
+        raise ValueError("The pay period starts after it ends")
+    if (start, end) != month_period(start):
+        first, last = month_period(start)
+        raise ValueError(f"A payroll run covers one calendar month, e.g. {first} to {last}")
+
+
+def to_cents(amounts):
+    # Money is handled as int64 cents so the sums stay exact
+    return np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+
+def from_cents(cents):
+    return [Decimal(value).scaleb(-2) for value in cents.tolist()]
+
+
+def period_earnings(salary_cents, date_joined, start, end):
+    """
+    Basic pay for the period from the monthly salaries, prorated by calendar
+    days for anyone who joined part way through it
+    """
+    period_days = (end - start).days + 1
+    first_day = np.maximum(np.asarray(date_joined, dtype='datetime64[D]'), np.datetime64(start, 'D'))
+    days = np.clip((np.datetime64(end, 'D') - first_day).astype(np.int64) + 1, 0, period_days)
+    return np.rint(salary_cents * days / period_days).astype(np.int64)
+
+
+def compute_pay(basic, period_end):
+    """
+    Every payslip amount for an array of basic pay in cents, as arrays in cents
+    """
+    zeros = np.zeros_like(basic)
+    pay = {'basic_salary': basic, 'allowances': zeros, 'bonuses': zeros}
+    pay['gross_salary'] = basic + pay['allowances'] + pay['bonuses']
+
+    pay.update(statutory_deductions(pay['gross_salary'], period_end))
+    # Loans and salary advances are still typed in on the payslip
+    pay['other_deductions'] = zeros
+    pay['total_deductions'] = pay['income_tax'] + pay['nssf_deduction'] + pay['nhif_deduction'] + pay['other_deductions']
+    pay['net_salary'] = pay['gross_salary'] - pay['total_deductions']
+    return pay
+
+
+def payroll_employees(run):
+    employees = Employee.objects.filter(
+        employment_status__in=PAYROLL_STATUSES, date_joined__lte=run.pay_period_end,
+    )
+    if run.department_id:
+        employees = employees.filter(department_id=run.department_id)
+    return employees
+
+
+def _write_batch(run, rows):
+    """
+    Computes and inserts the payslips for one batch of (employee_ID, salary, date_joined, paid, department_id) rows
+    """
+    employee_ids = [row[0] for row in rows]
+    basic = period_earnings(
+        to_cents([row[1] for row in rows]), [row[2] for row in rows], run.pay_period_start, run.pay_period_end,
+    )
+    pay = compute_pay(basic, run.pay_period_end)
+    amounts = {name: from_cents(values) for name, values in pay.items()}
+
+    # Payslip.save would compute the totals one by one, they are already in amounts
+    Payslip.objects.bulk_create([
+        Payslip(
+            employee_id=employee_id, payroll_run=run, status='Generated',
+            pay_period_start=run.pay_period_start, pay_period_end=run.pay_period_end,
+            **{name: amounts[name][index] for name in PAYSLIP_AMOUNTS},
+        )
+        for index, employee_id in enumerate(employee_ids)
+    ])
+
+    # bulk_create skips the Payslip signals
+    rebuild_summaries(employee_ids)
+    invalidate_dashboards(employee_ids)
+    post_batch(run.pay_period_start, run.pay_period_end, [row[4] for row in rows], pay)
+    return len(employee_ids)
+
+
+def claimable_runs(now=None):
+    """
+    Runs that can be started: any not Running, and Running ones gone stale
+    """
+    now = now or timezone.now()
+    return ~Q(status='Running') | Q(started_at__lt=now - STALE_RUN_AFTER)
+
+
+def run_payroll(run, batch_size=PAYROLL_BATCH_SIZE):
+    """
+    Generates the payslips of a PayrollRun in batches inside one transaction.
+    Employees who already have a payslip for the period are skipped, so a run
+    can be repeated, e.g. after new hires, without paying anyone twice.
+    """
+    check_period(run.pay_period_start, run.pay_period_end)
+    started = time.perf_counter()
+    now = timezone.now()
+    # Claimed with a conditional UPDATE, so two workers never run it at once
+    claimed = PayrollRun.objects.filter(claimable_runs(now), pk=run.pk).update(
+        status='Running', started_at=now, error=None,
+    )
+    if not claimed:
+        raise ValueError("This payroll run is already running")
+    run.status, run.started_at, run.error = 'Running', now, None
+
+    already_paid = Payslip.objects.filter(
+        employee=OuterRef('pk'), pay_period_start=run.pay_period_start, pay_period_end=run.pay_period_end,
+    )
+    rows = payroll_employees(run).annotate(paid=Exists(already_paid)).order_by('pk').values_list(
+        'employee_ID', 'salary', 'date_joined', 'paid', 'department_id',
+    )
+
+    considered = created = 0
+    try:
+        with transaction.atomic():
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                considered += 1
+                if not row[3]:
+                    batch.append(row)
+                if len(batch) >= batch_size:
+                    created += _write_batch(run, batch)
+                    batch = []
+            if batch:
+                created += _write_batch(run, batch)
+    except Exception as e:
+        print(f'Payroll run {run.pk} failed: {e}')
+        run.status, run.error = 'Failed', str(e)
+        run.duration_seconds = time.perf_counter() - started
+        run.save(update_fields=['status', 'error', 'duration_seconds'])
+        return run
+
+    # The counts are for this call, the totals for every payslip of the run
+    totals = run.payslips.aggregate(
+        gross=Sum('gross_salary'), deductions=Sum('total_deductions'), net=Sum('net_salary'),
+    )
+    run.employees_considered = considered
+    run.payslips_created = created
+    run.payslips_skipped = considered - created
+    run.total_gross = totals['gross'] or 0
+    run.total_deductions = totals['deductions'] or 0
+    run.total_net = totals['net'] or 0
+    run.status, run.completed_at = 'Completed', timezone.now()
+    run.duration_seconds = time.perf_counter() - started
+    run.save()
+    return run
+
+
+def start_payroll_run(start=None, end=None, department=None, batch_size=PAYROLL_BATCH_SIZE):
+    """
+    Creates and runs a PayrollRun, for the current month unless a period is given
+    """
+    if start is None or end is None:
+        start, end = month_period(start or date.today())
+    check_period(start, end)
+    run = PayrollRun.objects.create(pay_period_start=start, pay_period_end=end, department=department)
+    return run_payroll(run, batch_size=batch_size)
@@ -0,0 +1,356 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+import hashlib
+import os
+import time
+import zipfile
+
+from .models import Payslip
+
+
+DOCUMENTS_DIR = 'payslips'
+# Below this many payslips a process pool costs more than it saves
+PARALLEL_THRESHOLD = 200
+RENDER_CHUNK_SIZE = 250
+
+# Payslip values a document shows, read with values() so rows can go to the worker processes
+DOCUMENT_FIELDS = (
+    'id', 'employee_id', 'employee__fname', 'employee__lname', 'employee__job_title', 'employee__department__dpt_name',
+    'employee__tax_id_number', 'employee__nssf_number', 'employee__nhif_number', 'employee__bank_name',
+    'employee__bank_account_number', 'pay_period_start', 'pay_period_end',
+    'basic_salary', 'allowances', 'bonuses', 'gross_salary',
+    'income_tax', 'nssf_deduction', 'nhif_deduction', 'other_deductions', 'total_deductions', 'net_salary',
+)
+
+
+# The page, A4 in points from the bottom left. ('text', x, y, size, bold, text) is fixed,
+# ('field', x, y, size, bold, key, right aligned) is filled from a payslip row and
+# ('line', x1, y1, x2, y2) / ('bar', x, y, width, height) are drawn.
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+LEFT, RIGHT = 50, 545
+
+
+def _amount_rows(top, rows):
+    items = []
+    for offset, (label, key, bold) in enumerate(rows):
+        y = top - offset * 18
+        items.append(('text', LEFT + 10, y, 10, bold, label))
+        items.append(('field', RIGHT - 10, y, 10, bold, key, True))
+    return items
+
+
+LAYOUT = [
+    ('bar', 0, 772, PAGE_WIDTH, 70),
+    ('text', LEFT, 800, 22, True, "PAYSLIP"),
+    ('field', RIGHT, 804, 10, False, 'period', True),
+    ('text', LEFT, 735, 10, False, "Employee"),
+    ('field', 150, 735, 10, True, 'name', False),
+    ('text', LEFT, 717, 10, False, "Employee ID"),
+    ('field', 150, 717, 10, False, 'employee_id', False),
+    ('text', LEFT, 699, 10, False, "Job title"),
+    ('field', 150, 699, 10, False, 'employee__job_title', False),
+    ('text', LEFT, 681, 10, False, "Department"),
+    ('field', 150, 681, 10, False, 'employee__department__dpt_name', False),
+    ('text', 330, 735, 10, False, "KRA PIN"),
+    ('field', 410, 735, 10, False, 'employee__tax_id_number', False),
+    ('text', 330, 717, 10, False, "NSSF No."),
+    ('field', 410, 717, 10, False, 'employee__nssf_number', False),
+    ('text', 330, 699, 10, False, "NHIF No."),
+    ('field', 410, 699, 10, False, 'employee__nhif_number', False),
+    ('text', 330, 681, 10, False, "Paid to"),
+    ('field', 410, 681, 10, False, 'bank', False),
+    ('line', LEFT, 660, RIGHT, 660),
+    ('text', LEFT, 638, 12, True, "Earnings"),
+    *_amount_rows(616, [
+        ("Basic salary", 'basic_salary', False),
+        ("Allowances", 'allowances', False),
+        ("Bonuses", 'bonuses', False),
+        ("Gross pay", 'gross_salary', True),
+    ]),
+    ('line', LEFT, 548, RIGHT, 548),
+    ('text', LEFT, 526, 12, True, "Deductions"),
+    *_amount_rows(504, [
+        ("PAYE", 'income_tax', False),
+        ("NSSF", 'nssf_deduction', False),
+        ("NHIF / SHIF", 'nhif_deduction', False),
+        ("Other deductions", 'other_deductions', False),
+        ("Total deductions", 'total_deductions', True),
+    ]),
+    ('line', LEFT, 418, RIGHT, 418),
+    ('text', LEFT, 394, 14, True, "Net pay (KES)"),
+    ('field', RIGHT - 10, 394, 14, True, 'net_salary', True),
+    ('text', LEFT, 80, 8, False, "This payslip was generated electronically and does not need a signature."),
+]
+
+# Helvetica widths in thousandths of the font size, for right aligning figures
+_WIDTHS = {' ': 278, ',': 278, '.': 278, '-': 333, '/': 278, ':': 278, '(': 333, ')': 333}
+_BOLD_WIDTHS = {' ': 278, ',': 278, '.': 278, '-': 333, '/': 278, ':': 333, '(': 333, ')': 333}
+
+
+def _width(text, size, bold):
+    widths = _BOLD_WIDTHS if bold else _WIDTHS
+    # Digits are 556 in both weights, letters are close enough to it for a date range
+    return sum(widths.get(char, 556) for char in text) * size / 1000
+
+
+def _escape(value):
+    text = str(value).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return text.encode('cp1252', errors='replace')
+
+
+def _values(row):
+    """
+    What each field slot shows for a payslip row
+    """
+    values = {key: '' if value is None else value for key, value in row.items()}
+    for key in ('basic_salary', 'allowances', 'bonuses', 'gross_salary', 'income_tax', 'nssf_deduction',
+                'nhif_deduction', 'other_deductions', 'total_deductions', 'net_salary'):
+        values[key] = f"{row[key]:,.2f}"
+    values['name'] = f"{row['employee__fname']} {row['employee__lname']}"
+    values['period'] = f"{row['pay_period_start']:%d %b %Y} - {row['pay_period_end']:%d %b %Y}"
+    values['bank'] = f"{values['employee__bank_name']} {values['employee__bank_account_number']}".strip()
+    return values
+
+
+class PayslipTemplate:
+    """
+    The layout compiled once into the fixed bytes of a PDF: everything but the
+    field values and the lengths and offsets that follow from them. Rendering
+    a payslip is then a join, and the same row always gives the same bytes.
+    """
+
+    def __init__(self, layout):
+        # Content stream as fixed bytes between (key, x, y, size, bold, right aligned, font operators) slots
+        self.parts = []
+        static = []
+        for item in layout:
+            kind = item[0]
+            if kind == 'bar':
+                _, x, y, width, height = item
+                static.append(f"0.4 0.49 0.92 rg {x} {y} {width} {height} re f 0 g\n")
+            elif kind == 'line':
+                _, x1, y1, x2, y2 = item
+                static.append(f"0.8 G 0.5 w {x1} {y1} m {x2} {y2} l S\n")
+            elif kind == 'text':
+                _, x, y, size, bold, text = item
+                colour = "1 g " if y > 772 else ""
+                static.append(f"BT {colour}/{'F2' if bold else 'F1'} {size} Tf {x} {y} Td (")
+                self.parts.append("".join(static).encode() + _escape(text) + b") Tj ET 0 g\n")
+                static = []
+            elif kind == 'field':
+                _, x, y, size, bold, key, right = item
+                colour = "1 g " if y > 772 else ""
+                self.parts.append("".join(static).encode())
+                static = []
+                self.parts.append((key, x, y, size, bold, right, f"BT {colour}/{'F2' if bold else 'F1'} {size} Tf "))
+        self.parts.append("".join(static).encode())
+
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>".encode(),
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        ]
+        head = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(head))
+            head += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        self.head = head
+        # The contents object comes last, so every offset but the xref's own is fixed
+        offsets.append(len(head))
+        self.xref = b"xref\n0 7\n0000000000 65535 f \n" + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        self.trailer = b"trailer\n<< /Size 7 /Root 1 0 R >>\nstartxref\n"
+
+    def content(self, row):
+        values = _values(row)
+        out = []
+        for part in self.parts:
+            if isinstance(part, bytes):
+                out.append(part)
+                continue
+            key, x, y, size, bold, right, font = part
+            value = str(values[key])
+            if right:
+                x = round(x - _width(value, size, bold), 2)
+            out.append(f"{font}{x} {y} Td (".encode() + _escape(value) + b") Tj ET 0 g\n")
+        return b"".join(out)
+
+    def render(self, row):
+        stream = self.content(row)
+        contents = b"6 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (len(stream), stream)
+        xref_offset = len(self.head) + len(contents)
+        return b"".join([self.head, contents, self.xref, self.trailer, b"%d\n%%%%EOF\n" % xref_offset])
+
+
+# Compiled at import, so once per worker process too
+TEMPLATE = PayslipTemplate(LAYOUT)
+
+
+def document_name(digest):
+    return f"{DOCUMENTS_DIR}/{digest[:2]}/{digest}.pdf"
+
+
+def render_document(row):
+    """
+    (SHA-256, PDF bytes) for a payslip row with DOCUMENT_FIELDS
+    """
+    data = TEMPLATE.render(row)
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def store_document(digest, data):
+    """
+    Saves a PDF under its hash, identical documents are only written once
+    """
+    name = document_name(digest)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(data))
+        if saved != name:
+            # Another render stored the same document meanwhile
+            default_storage.delete(saved)
+    return name
+
+
+def _render_chunk(rows):
+    """
+    Renders and stores a chunk of payslip rows, in a worker process or not.
+    Returns (payslip id, hash) pairs, the database is left to the caller.
+    """
+    results = []
+    for row in rows:
+        digest, data = render_document(row)
+        store_document(digest, data)
+        results.append((row['id'], digest))
+    return results
+
+
+def _start_worker():
+    # Workers that were spawned rather than forked start without Django set up
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def record_hashes(changes):
+    """
+    Raw executemany of (hash, payslip id), bulk_update's CASE per row costs more
+    than the rendering. None of the Payslip signals care about the hash.
+    """
+    quote = connection.ops.quote_name
+    sql = (
+        f"UPDATE {quote(Payslip._meta.db_table)} SET {quote(Payslip._meta.get_field('document_hash').column)} = %s "
+        f"WHERE {quote(Payslip._meta.pk.column)} = %s"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(changes), RENDER_CHUNK_SIZE * 4):
+            cursor.executemany(sql, changes[start:start + RENDER_CHUNK_SIZE * 4])
+
+
+def render_payslips(queryset, workers=None):
+    """
+    Renders the PDFs of a payslip queryset, in a process pool when there are
+    enough of them, stores the ones not already stored and records each
+    payslip's hash. Rendering is cheap next to writing, so everything is
+    rendered and unchanged documents cost no write. The workers write to
+    storage themselves, the PDFs never travel back.
+    """
+    started = time.perf_counter()
+    rows = list(queryset.order_by('pk').values(*DOCUMENT_FIELDS, 'document_hash'))
+    current = {row['id']: row['document_hash'] for row in rows}
+
+    workers = workers or os.cpu_count() or 1
+    if len(rows) < PARALLEL_THRESHOLD or workers == 1:
+        results = _render_chunk(rows)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker) as pool:
+            results = [result for chunk in pool.map(_render_chunk, _chunks(rows, RENDER_CHUNK_SIZE))
+                       for result in chunk]
+
+    changed = [(digest, payslip_id) for payslip_id, digest in results if current[payslip_id] != digest]
+    record_hashes(changed)
+    return {'rendered': len(results), 'changed': len(changed), 'seconds': time.perf_counter() - started}
+
+
+def payslip_document(payslip):
+    """
+    Storage name of a payslip's PDF, rendering it first if it isn't stored yet
+    """
+    if payslip.document_hash and default_storage.exists(document_name(payslip.document_hash)):
+        return document_name(payslip.document_hash)
+    row = Payslip.objects.filter(pk=payslip.pk).values(*DOCUMENT_FIELDS).get()
+    digest, data = render_document(row)
+    Payslip.objects.filter(pk=payslip.pk).update(document_hash=digest)
+    payslip.document_hash = digest
+    return store_document(digest, data)
+
+
+class _Chunks:
+    """
+    Unseekable write target for ZipFile that hands over what was written since the last take()
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def archive_name(row):
+    department = (row['employee__department__dpt_name'] or "No department").replace('/', '-')
+    period = f"{row['pay_period_start']:%Y-%m-%d}_{row['pay_period_end']:%Y-%m-%d}"
+    return f"{period}/{department}/{row['employee_id']}-{row['employee__fname']}-{row['employee__lname']}.pdf"
+
+
+def zip_documents(queryset):
+    """
+    Yields a ZIP of the payslips' PDFs one member at a time, reading each from storage
+    (or rendering it, when missing) as it goes, so only one document is in memory
+    """
+    target = _Chunks()
+    rows = queryset.order_by('pay_period_end', 'employee__department__dpt_name', 'employee_id').values(
+        *DOCUMENT_FIELDS, 'document_hash',
+    ).iterator(chunk_size=RENDER_CHUNK_SIZE)
+
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for row in rows:
+            name = document_name(row['document_hash']) if row['document_hash'] else None
+            if name and default_storage.exists(name):
+                with default_storage.open(name, 'rb') as document:
+                    data = document.read()
+            else:
+                digest, data = render_document(row)
+                store_document(digest, data)
+                Payslip.objects.filter(pk=row['id']).update(document_hash=digest)
+
+            member = zipfile.ZipInfo(archive_name(row), date_time=row['pay_period_end'].timetuple()[:6])
+            member.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(member, data)
+            yield target.take()
+    yield target.take()
+
+
+def streaming_documents(queryset, filename):
+    response = StreamingHttpResponse(zip_documents(queryset), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
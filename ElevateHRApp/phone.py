@@ -0,0 +1,19 @@
+import re
+
+
+DEFAULT_COUNTRY_CODE = '254'
+
+
+def normalise_phone(phone_number, country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Normalises a local or international number to +<country code><subscriber>,
+    e.g. 0712345678, 712345678 and +254 712 345 678 all become +254712345678
+    """
+    digits = re.sub(r'\D', '', str(phone_number or ''))
+    if not digits:
+        return ''
+
+    if digits.startswith(country_code) and len(digits) > 9:
+        return f"+{digits}"
+
+    return f"+{country_code}{digits.lstrip('0')}"
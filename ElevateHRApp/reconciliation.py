@@ -0,0 +1,260 @@
+import codecs
+import csv
+import io
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+
+from .dashboard import invalidate_dashboards
+from .disbursements import RESULT_STATUSES, update_batch_totals, update_statuses
+from .models import Disbursement, DisbursementBatch, Payslip
+
+
+RECONCILE_CHUNK_SIZE = 5000
+# How long after a disbursement is created its payment can show up on a statement
+MATCH_WINDOW_DAYS = 10
+# Disbursements that went out in a bank file, the only ones a line without a known transaction id can be for
+SENT_STATUSES = ('Processing', 'Successful')
+
+# Statement column names banks use, by the name used here
+STATEMENT_COLUMNS = {
+    'transaction_id': ('transaction_id', 'transaction_reference', 'bank_reference', 'reference'),
+    'account': ('account', 'account_number', 'beneficiary_account', 'credit_account'),
+    'amount': ('amount', 'debit', 'debit_amount'),
+    'date': ('date', 'value_date', 'transaction_date', 'posting_date'),
+    'status': ('status',),
+    'description': ('description', 'narration', 'details'),
+}
+REQUIRED_STATEMENT_COLUMNS = ('account', 'amount', 'date')
+
+
+def _columns(header):
+    header = [column.strip().lower().replace(' ', '_') for column in header]
+    positions = {}
+    for name, aliases in STATEMENT_COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                positions[name] = header.index(alias)
+                break
+    missing = [name for name in REQUIRED_STATEMENT_COLUMNS if name not in positions]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return positions
+
+
+def _statement_lines(upload):
+    """
+    (line number, {column: value}) for each statement line, read as it goes
+    """
+    reader = csv.reader(codecs.iterdecode(upload, 'utf-8-sig'))
+    positions = _columns(next(reader, []))
+    for values in reader:
+        if any(value.strip() for value in values):
+            yield reader.line_num, {
+                name: values[position].strip() if position < len(values) else ''
+                for name, position in positions.items()
+            }
+
+
+def _cents(value):
+    # Debits can come signed or in brackets, the direction is in the status column
+    value = value.replace(',', '').replace('(', '').replace(')', '').lstrip('-+')
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return datetime.strptime(value, '%d/%m/%Y').date()
+
+
+def _account(value):
+    return value.replace(' ', '').replace('-', '').lstrip('0')
+
+
+class StatementReconciliation:
+    """
+    Matches a bank statement against the disbursements of a pay period. The
+    disbursements are loaded once into two hash tables, by transaction id and
+    by (account, amount) with their dates, and every statement line is a
+    lookup in them. Changes are written in bulk at the end.
+    """
+
+    def __init__(self, start, end):
+        self.start, self.end = start, end
+        self.exceptions = []  # (line, statement values, disbursement id, problem)
+        self.changes = {}  # disbursement id -> (status, transaction_id, failure_reason)
+        self.lines = self.matched = self.by_transaction = self.by_account = self.returned = self.unchanged = 0
+
+    def load(self):
+        rows = Disbursement.objects.filter(payslip__pay_period_end__range=(self.start, self.end)).values_list(
+            'id', 'transaction_id', 'amount', 'status', 'disbursement_date', 'payslip_id',
+            'payslip__employee_id', 'payslip__employee__bank_account_number', 'batch_id',
+        ).iterator(chunk_size=RECONCILE_CHUNK_SIZE)
+
+        self.disbursements = {}
+        self.transactions = {}
+        candidates = defaultdict(list)
+        for disbursement_id, transaction_id, amount, status, created, payslip_id, employee_id, account, batch_id in rows:
+            cents = int(amount * 100)
+            account = account or ''
+            self.disbursements[disbursement_id] = (status, transaction_id, cents, payslip_id, employee_id, batch_id, account)
+            if transaction_id:
+                self.transactions[transaction_id] = disbursement_id
+            if status in SENT_STATUSES:
+                candidates[(_account(account), cents)].append((created.date(), disbursement_id))
+        # Sorted by date so a line takes the earliest open disbursement it can be for
+        self.candidates = {key: sorted(values) for key, values in candidates.items()}
+        self.seen = set()
+
+    def exception(self, line, values, disbursement_id, problem):
+        self.exceptions.append((line, values, disbursement_id, problem))
+
+    def find(self, values, cents, day, status):
+        """
+        The disbursement a statement line is for, by transaction id or else by account, amount and date
+        """
+        transaction_id = values.get('transaction_id') or None
+        disbursement_id = self.transactions.get(transaction_id) if transaction_id else None
+        if disbursement_id is not None:
+            self.by_transaction += 1
+            return disbursement_id
+
+        options = self.candidates.get((_account(values['account']), cents), ())
+        earliest = day - timedelta(days=MATCH_WINDOW_DAYS)
+        for created, candidate in options[bisect_left(options, (earliest, 0)):]:
+            if created > day:
+                break
+            # Not one known under another transaction id, nor one already paid by another line
+            # (a return does follow the payment it reverses)
+            if transaction_id and self.disbursements[candidate][1]:
+                continue
+            if candidate not in self.seen or status == 'Failed':
+                self.by_account += 1
+                return candidate
+        return None
+
+    def match(self, line, values):
+        try:
+            cents, day = _cents(values['amount']), _date(values['date'])
+        except (InvalidOperation, ValueError):
+            self.exception(line, values, None, "unreadable amount or date")
+            return
+        status = RESULT_STATUSES.get(values['status'].lower()) if values.get('status') else 'Successful'
+        if status is None:
+            self.exception(line, values, None, f"unknown status {values['status']!r}")
+            return
+
+        disbursement_id = self.find(values, cents, day, status)
+        if disbursement_id is None:
+            self.exception(line, values, None, "no matching disbursement")
+            return
+        current, known_transaction_id, expected, *_ = self.disbursements[disbursement_id]
+        if disbursement_id in self.seen and status == 'Successful':
+            self.exception(line, values, disbursement_id, "disbursement already matched to another line")
+            return
+        if cents != expected:
+            self.exception(line, values, disbursement_id, f"amount {cents / 100:.2f} does not match {expected / 100:.2f}")
+            return
+
+        self.seen.add(disbursement_id)
+        self.matched += 1
+        transaction_id = values.get('transaction_id') or known_transaction_id
+        if status == 'Failed':
+            self.returned += 1
+            reason = f"Returned by the bank on {day}" + (f": {values['description']}" if values.get('description') else "")
+            self.changes[disbursement_id] = ('Failed', transaction_id, reason)
+        elif current == 'Successful' and transaction_id == known_transaction_id and disbursement_id not in self.changes:
+            self.unchanged += 1
+        else:
+            self.changes[disbursement_id] = ('Successful', transaction_id, None)
+
+    def run(self, upload):
+        started = time.perf_counter()
+        with transaction.atomic():
+            # Lock the period's disbursements (and their payslips) until the changes are written
+            list(Disbursement.objects.select_for_update().filter(
+                payslip__pay_period_end__range=(self.start, self.end),
+            ).values_list('id', flat=True))
+            self.load()
+            for line, values in _statement_lines(upload):
+                self.lines += 1
+                self.match(line, values)
+            self.missing()
+            self.apply()
+        return {
+            'lines': self.lines,
+            'matched': self.matched,
+            'by_transaction': self.by_transaction,
+            'by_account': self.by_account,
+            'returned': self.returned,
+            'unchanged': self.unchanged,
+            'updated': len(self.changes),
+            'exceptions': self.exceptions,
+            'seconds': time.perf_counter() - started,
+        }
+
+    def missing(self):
+        """
+        Disbursements sent to the bank that no statement line accounts for
+        """
+        for disbursement_id, (status, transaction_id, cents, *_, account) in self.disbursements.items():
+            if status == 'Processing' and disbursement_id not in self.seen:
+                values = {'transaction_id': transaction_id or '', 'account': account, 'amount': f"{cents / 100:.2f}"}
+                self.exception(None, values, disbursement_id, "sent to the bank but not on the statement")
+
+    def apply(self):
+        changes = [
+            (status, transaction_id, reason, disbursement_id)
+            for disbursement_id, (status, transaction_id, reason) in self.changes.items()
+        ]
+        for start in range(0, len(changes), RECONCILE_CHUNK_SIZE):
+            update_statuses(changes[start:start + RECONCILE_CHUNK_SIZE])
+
+        paid, returned, employees, batches = [], [], set(), set()
+        for disbursement_id, (status, *_) in self.changes.items():
+            _, _, _, payslip_id, employee_id, batch_id, _ = self.disbursements[disbursement_id]
+            (paid if status == 'Successful' else returned).append(payslip_id)
+            employees.add(employee_id)
+            batches.add(batch_id)
+        for start in range(0, max(len(paid), len(returned)), RECONCILE_CHUNK_SIZE):
+            Payslip.objects.filter(id__in=paid[start:start + RECONCILE_CHUNK_SIZE]).update(status='Paid')
+            # A returned payment leaves the payslip to be paid again by the next batch
+            Payslip.objects.filter(id__in=returned[start:start + RECONCILE_CHUNK_SIZE]).update(status='Generated')
+
+        for batch in DisbursementBatch.objects.filter(id__in=batches):
+            update_batch_totals(batch)
+        # The updates skip the signals, the dashboards show payslip statuses
+        invalidate_dashboards(employees)
+
+
+def exceptions_report(exceptions):
+    """
+    CSV of the statement lines that didn't reconcile and the disbursements missing from the statement
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['line', 'transaction_id', 'account', 'amount', 'date', 'disbursement', 'problem'])
+    for line, values, disbursement_id, problem in sorted(exceptions, key=lambda row: (row[0] is None, row[0] or 0)):
+        writer.writerow([
+            line or '', *(values.get(column, '') for column in ('transaction_id', 'account', 'amount', 'date')),
+            disbursement_id or '', problem,
+        ])
+    return output.getvalue()
+
+
+def reconcile_statement(upload, start, end):
+    """
+    Reconciles a bank statement CSV against the disbursements of the payslips
+    ending between start and end. Returns the counts, the exceptions and an
+    exceptions report as CSV text.
+    """
+    if start > end:
+        raise ValueError("The period starts after it ends")
+    result = StatementReconciliation(start, end).run(upload)
+    result['exceptions_report'] = exceptions_report(result['exceptions']) if result['exceptions'] else ''
+    return result
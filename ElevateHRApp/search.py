@@ -0,0 +1,196 @@
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+import re
+
+from .models import Employee
+
+
+SEARCH_TABLE = 'elevatehrapp_employee_search'
+MAX_SEARCH_TERMS = 8
+INDEX_BATCH_SIZE = 1000
+
+# Column weights, a hit on the name outranks one on the job title, and so on down to the email
+SQLITE_WEIGHTS = (10.0, 5.0, 2.0, 2.0, 1.0)
+EMAIL_SEPARATORS = re.compile(r"[\W_]+")
+
+_available = None
+
+
+def search_available():
+    global _available
+    if _available is None:
+        _available = SEARCH_TABLE in connection.introspection.table_names()
+    return _available
+
+
+def _split_email(email):
+    # john.smith@acme.co also matches "smith" and "acme"
+    return f"{email} {EMAIL_SEPARATORS.sub(' ', email)}" if email else ""
+
+
+def write_documents(cursor, vendor, rows):
+    """
+    Upserts the search documents for rows of
+    (employee_ID, fname, lname, sname, job_title, department, profession, email)
+    """
+    documents = [
+        (pk, " ".join(filter(None, (fname, lname, sname))), job_title or "",
+         department or "", profession or "", _split_email(email))
+        for pk, fname, lname, sname, job_title, department, profession, email in rows
+    ]
+    if not documents:
+        return
+    if vendor == 'sqlite':
+        cursor.executemany(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(document[0],) for document in documents]
+        )
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, job_title, department, profession, email) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            documents,
+        )
+    else:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (employee_id, document) VALUES (%s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s), 'B') || "
+            "setweight(to_tsvector('simple', %s || ' ' || %s), 'C') || "
+            "setweight(to_tsvector('simple', %s), 'D')) "
+            "ON CONFLICT (employee_id) DO UPDATE SET document = EXCLUDED.document",
+            documents,
+        )
+
+
+def _document_rows(queryset):
+    return queryset.values_list(
+        'employee_ID', 'fname', 'lname', 'sname', 'job_title',
+        'department__dpt_name', 'employee_profession', 'email',
+    )
+
+
+def index_employees(employee_ids):
+    """
+    Refreshes the search documents of these employees, call it after bulk writes
+    that bypass the post_save signal
+    """
+    employee_ids = list(employee_ids)
+    if not employee_ids or not search_available():
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(employee_ids), INDEX_BATCH_SIZE):
+            batch = employee_ids[start:start + INDEX_BATCH_SIZE]
+            rows = list(_document_rows(Employee.objects.filter(employee_ID__in=batch)))
+            # Employees deleted in the meantime drop out of the index
+            missing = set(batch) - {row[0] for row in rows}
+            if missing:
+                remove_employees(missing)
+            write_documents(cursor, connection.vendor, rows)
+    return len(employee_ids)
+
+
+def remove_employees(employee_ids):
+    if not employee_ids or not search_available():
+        return
+    with connection.cursor() as cursor:
+        key = 'rowid' if connection.vendor == 'sqlite' else 'employee_id'
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE {key} = %s", [(pk,) for pk in employee_ids])
+
+
+def rebuild_search_index():
+    if not search_available():
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        rows = []
+        for row in _document_rows(Employee.objects.order_by()).iterator(chunk_size=INDEX_BATCH_SIZE):
+            rows.append(row)
+            if len(rows) >= INDEX_BATCH_SIZE:
+                write_documents(cursor, connection.vendor, rows)
+                rows = []
+        write_documents(cursor, connection.vendor, rows)
+    return Employee.objects.count()
+
+
+def search_terms(query):
+    return re.findall(r"\w+", (query or "").lower())[:MAX_SEARCH_TERMS]
+
+
+def _like_filter(terms):
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(fname__icontains=term) | Q(lname__icontains=term) | Q(email__icontains=term)
+            | Q(job_title__icontains=term) | Q(employee_profession__icontains=term)
+            | Q(department__dpt_name__icontains=term)
+        )
+    return condition
+
+
+def _match(terms):
+    if connection.vendor == 'sqlite':
+        return f"{SEARCH_TABLE} MATCH %s", " ".join(f'"{term}"*' for term in terms)
+    return "document @@ to_tsquery('simple', %s)", " & ".join(f"{term}:*" for term in terms)
+
+
+def search_filter(query):
+    """
+    Q for the employees matching every term of query as a word prefix. The
+    matches are a subquery on the search table, not a list of ids, so
+    filtering a queryset with it drops none of them.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return Q(employee_ID__in=[])
+    if not search_available():
+        return _like_filter(terms)
+    condition, match = _match(terms)
+    key = 'rowid' if connection.vendor == 'sqlite' else 'employee_id'
+    return Q(employee_ID__in=RawSQL(f"SELECT {key} FROM {SEARCH_TABLE} WHERE {condition}", [match]))
+
+
+def ranked_search(query, limit, after=None, within=None):
+    """
+    [(rank, employee_ID)] of the next limit employees matching query, best
+    match first. after is the (rank, employee_ID) of the last match already
+    shown and within an Employee queryset to narrow the matches to, both
+    applied in the search query so every page costs the same.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if not search_available():
+        # LIKE has no rank, the matches come in employee_ID order
+        queryset = Employee.objects.filter(_like_filter(terms))
+        if within is not None:
+            queryset = queryset.filter(employee_ID__in=within.values('employee_ID'))
+        if after:
+            queryset = queryset.filter(employee_ID__gt=after[1])
+        return [(0.0, pk) for pk in queryset.order_by('employee_ID').values_list('employee_ID', flat=True)[:limit]]
+
+    condition, match = _match(terms)
+    if connection.vendor == 'sqlite':
+        # bm25 is lower for a better match
+        key, direction, later, placeholder = 'rowid', 'ASC', '>', '%s'
+        rank, rank_params = f"bm25({SEARCH_TABLE}, {', '.join(str(weight) for weight in SQLITE_WEIGHTS)})", []
+    else:
+        key, direction, later, placeholder = 'employee_id', 'DESC', '<', '%s::real'
+        rank, rank_params = "ts_rank(document, to_tsquery('simple', %s))", [match]
+
+    where, params = [condition], [*rank_params, match]
+    if after:
+        where.append(f"({rank} {later} {placeholder} OR ({rank} = {placeholder} AND {key} > %s))")
+        params += [*rank_params, after[0], *rank_params, after[0], after[1]]
+    if within is not None:
+        sql, within_params = within.values('employee_ID').query.sql_with_params()
+        where.append(f"{key} IN ({sql})")
+        params += within_params
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {rank}, {key} FROM {SEARCH_TABLE} WHERE {' AND '.join(where)} "
+            f"ORDER BY 1 {direction}, 2 LIMIT %s",
+            [*params, limit],
+        )
+        return cursor.fetchall()
@@ -0,0 +1,191 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Attendance, Department, Employee, LeaveRequest, Payslip, PerformanceReview, Training
+from .dashboard import invalidate_dashboards
+from . import ledger, org_chart, search
+
+
+# Employee fields the receivers here and in the USSD app react to. A save reads
+# their stored values once, so the receivers can skip the ones it left alone.
+SEARCH_FIELDS = ('fname', 'lname', 'sname', 'job_title', 'department', 'employee_profession', 'email')
+# What a subordinate's dashboard shows of their supervisor
+SUPERVISOR_CARD_FIELDS = ('fname', 'lname', 'job_title')
+TRACKED_FIELDS = (*SEARCH_FIELDS, 'supervisor', 'phone_number', 'resume', 'contract_file', 'profile_picture')
+
+
+def _stored_value(instance, name):
+    field = Employee._meta.get_field(name)
+    return field.get_prep_value(field.value_from_object(instance))
+
+
+@receiver(pre_save, sender=Employee)
+def remember_previous_values(sender, instance, update_fields=None, **kwargs):
+    instance._previous = None
+    if instance._state.adding:
+        return
+    fields = [
+        name for name in TRACKED_FIELDS
+        if update_fields is None or {name, Employee._meta.get_field(name).attname} & set(update_fields)
+    ]
+    # A save limited to other fields needs no query
+    instance._previous = Employee.objects.filter(pk=instance.pk).values(*fields).first() if fields else {}
+
+
+def employee_changed(instance, created, fields):
+    """
+    Whether a save of instance wrote a new value to any of fields, from TRACKED_FIELDS
+    """
+    previous = getattr(instance, '_previous', None)
+    if created or previous is None:
+        return True
+    return any(name in previous and previous[name] != _stored_value(instance, name) for name in fields)
+
+
+@receiver(post_save, sender=Employee)
+def index_employee(sender, instance, created, **kwargs):
+    if employee_changed(instance, created, SEARCH_FIELDS):
+        search.index_employees([instance.employee_ID])
+    employee_ids = [instance.employee_ID]
+    # Subordinates show this employee as their supervisor
+    if not created and employee_changed(instance, created, SUPERVISOR_CARD_FIELDS):
+        employee_ids += instance.subordinates.values_list('employee_ID', flat=True)
+    invalidate_dashboards(employee_ids)
+
+
+@receiver(pre_delete, sender=Employee)
+def drop_supervisor_from_dashboards(sender, instance, **kwargs):
+    invalidate_dashboards([instance.employee_ID, *instance.subordinates.values_list('employee_ID', flat=True)])
+
+
+@receiver(post_delete, sender=Employee)
+def unindex_employee(sender, instance, **kwargs):
+    search.remove_employees([instance.employee_ID])
+
+
+# Org chart closure table, kept in step with Employee.supervisor
+
+@receiver(pre_save, sender=Employee)
+def reject_supervisor_loop(sender, instance, **kwargs):
+    # Forms get a ValidationError from Employee.clean(), this stops saves that skip it
+    if (instance.pk and employee_changed(instance, False, ['supervisor'])
+            and org_chart.would_create_cycle(instance.pk, instance.supervisor_id)):
+        raise ValueError("An employee cannot report to someone in their own reporting line")
+
+
+@receiver(post_save, sender=Employee)
+def update_org_chart(sender, instance, created, **kwargs):
+    if employee_changed(instance, created, ['supervisor']):
+        org_chart.supervisor_changed(instance.employee_ID, instance.supervisor_id)
+
+
+@receiver(pre_delete, sender=Employee)
+def remember_direct_reports(sender, instance, **kwargs):
+    # The delete nulls their supervisor with a plain UPDATE, they become the top of their own tree
+    instance._direct_report_ids = list(instance.subordinates.values_list('employee_ID', flat=True))
+
+
+@receiver(post_delete, sender=Employee)
+def detach_direct_reports(sender, instance, **kwargs):
+    for employee_id in getattr(instance, '_direct_report_ids', ()):
+        org_chart.move_subtree(employee_id, None)
+
+
+@receiver(post_save, sender=Department)
+def reindex_department(sender, instance, created, **kwargs):
+    if not created:
+        member_ids = list(instance.employees.values_list('employee_ID', flat=True))
+        search.index_employees(member_ids)
+        invalidate_dashboards(member_ids)
+
+
+@receiver(pre_delete, sender=Department)
+def remember_department_members(sender, instance, **kwargs):
+    # The delete nulls their department with a plain UPDATE, reindex them afterwards
+    instance._member_ids = list(instance.employees.values_list('employee_ID', flat=True))
+
+
+@receiver(post_delete, sender=Department)
+def reindex_former_members(sender, instance, **kwargs):
+    member_ids = getattr(instance, '_member_ids', ())
+    search.index_employees(member_ids)
+    invalidate_dashboards(member_ids)
+
+
+# Payroll ledger, posted the difference every payslip change makes
+
+@receiver(pre_save, sender=Payslip)
+def remember_ledger_figures(sender, instance, **kwargs):
+    ledger.payslip_changing(instance)
+
+
+@receiver(post_save, sender=Payslip)
+def post_payslip_to_ledger(sender, instance, **kwargs):
+    ledger.payslip_saved(instance)
+
+
+@receiver(pre_delete, sender=Payslip)
+def remember_ledger_department(sender, instance, **kwargs):
+    ledger.payslip_deleting(instance)
+
+
+@receiver(post_delete, sender=Payslip)
+def reverse_payslip_in_ledger(sender, instance, **kwargs):
+    ledger.payslip_deleted(instance)
+
+
+@receiver(post_save, sender=Employee)
+def move_payslips_in_ledger(sender, instance, created, **kwargs):
+    # The ledger is by current department, a transfer takes the payslips along
+    if not created and instance._previous is not None and employee_changed(instance, created, ['department']):
+        ledger.employees_moved([instance.pk], instance._previous['department'])
+
+
+@receiver(post_delete, sender=Department)
+def move_former_members_in_ledger(sender, instance, **kwargs):
+    ledger.employees_moved(getattr(instance, '_member_ids', ()), removed=True)
+
+
+# Dashboard read models, dropped for exactly the employees a change touches
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def drop_attendance_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.attendance_employee_id])
+
+
+@receiver(post_save, sender=LeaveRequest)
+@receiver(post_delete, sender=LeaveRequest)
+def drop_leave_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.leave_employee_id])
+
+
+@receiver(post_save, sender=Payslip)
+@receiver(post_delete, sender=Payslip)
+def drop_payslip_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.employee_id])
+
+
+@receiver(post_save, sender=PerformanceReview)
+@receiver(post_delete, sender=PerformanceReview)
+def drop_review_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.performance_employee_id])
+
+
+@receiver(post_save, sender=Training)
+@receiver(pre_delete, sender=Training)
+def drop_training_dashboards(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_dashboards(instance.training_attendees.values_list('employee_ID', flat=True))
+
+
+@receiver(m2m_changed, sender=Training.training_attendees.through)
+def drop_attendee_dashboards(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # employee.training_set.add(...), only that employee's trainings changed
+        if action in ('post_add', 'post_remove', 'pre_clear'):
+            invalidate_dashboards([instance.employee_ID])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_dashboards(pk_set)
+    elif action == 'pre_clear':
+        invalidate_dashboards(instance.training_attendees.values_list('employee_ID', flat=True))
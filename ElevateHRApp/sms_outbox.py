@@ -0,0 +1,151 @@
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from datetime import timedelta
+import africastalking
+import os
+import threading
+
+from .delivery_reports import log_sent_messages
+from .models import OutboundSms
+from .phone import normalise_phone
+
+
+# Set your shortCode or senderId
+SMS_SENDER = os.getenv("AT_SENDER_ID", "20880")
+
+SMS_PRIORITY = {
+    'OTP': 0,
+    'Notification': 5,
+    'Welcome': 9,
+}
+
+MAX_SMS_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 15
+SENDING_TIMEOUT = timedelta(minutes=5)
+DISPATCH_BATCH_SIZE = 50
+DISPATCH_POLL_SECONDS = 30
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_sms_service():
+    if africastalking.SMS is None:
+        africastalking.initialize(username="EMID", api_key=os.getenv("AT_API_KEY"))
+    return africastalking.SMS
+
+
+def provider_message_id(recipient):
+    # Africa's Talking sends the string "None" as the messageId of a recipient it didn't accept
+    message_id = recipient.get('messageId')
+    return message_id if message_id and message_id != 'None' else None
+
+
+def queue_sms(phone_number, message, kind='Notification'):
+    """
+    Writes the message to the outbox, the dispatcher sends it once the row commits
+    """
+    sms = OutboundSms.objects.create(
+        recipient=normalise_phone(phone_number),
+        message=message,
+        sender=SMS_SENDER,
+        kind=kind,
+        priority=SMS_PRIORITY.get(kind, SMS_PRIORITY['Notification']),
+    )
+    transaction.on_commit(wake_dispatcher)
+    return sms
+
+
+def claim_due_messages(limit=DISPATCH_BATCH_SIZE):
+    now = timezone.now()
+    due = Q(status='Queued', next_attempt_at__lte=now) | Q(status='Sending', claimed_at__lt=now - SENDING_TIMEOUT)
+    candidates = OutboundSms.objects.filter(due).order_by('priority', 'created_at').values_list('pk', flat=True)[:limit]
+
+    claimed = []
+    for pk in candidates:
+        # Conditional update, so two dispatchers never send the same row
+        won = OutboundSms.objects.filter(due, pk=pk).update(
+            status='Sending', claimed_at=now, attempts=F('attempts') + 1
+        )
+        if won:
+            claimed.append(pk)
+    return list(OutboundSms.objects.filter(pk__in=claimed).order_by('priority', 'created_at'))
+
+
+def deliver(sms):
+    try:
+        response = get_sms_service().send(sms.message, [sms.recipient], sms.sender or None)
+        recipient = response['SMSMessageData']['Recipients'][0]
+    except Exception as e:
+        print(f'Houston, we have a problem: {e}')
+        return _schedule_retry(sms, str(e))
+
+    if recipient.get('status') != 'Success':
+        return _schedule_retry(sms, f"{recipient.get('statusCode')} {recipient.get('status')}", recipient)
+
+    OutboundSms.objects.filter(pk=sms.pk).update(
+        status='Sent',
+        sent_at=timezone.now(),
+        provider_message_id=provider_message_id(recipient),
+        provider_status=recipient.get('status'),
+        last_error=None,
+    )
+    log_sent_messages([(provider_message_id(recipient), sms.recipient)], 'Outbox')
+    return True
+
+
+def _schedule_retry(sms, error, recipient=None):
+    attempts = sms.attempts
+    update = {
+        'last_error': error,
+        'provider_status': (recipient or {}).get('status'),
+    }
+
+    if attempts >= MAX_SMS_ATTEMPTS:
+        update['status'] = 'Failed'
+    else:
+        update['status'] = 'Queued'
+        update['next_attempt_at'] = timezone.now() + timedelta(seconds=RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+    OutboundSms.objects.filter(pk=sms.pk).update(**update)
+    return False
+
+
+def dispatch_pending(limit=DISPATCH_BATCH_SIZE):
+    sent = 0
+    for sms in claim_due_messages(limit):
+        sent += deliver(sms)
+    return sent
+
+
+class SmsDispatcher(threading.Thread):
+    """
+    Drains the outbox in the background, woken by queue_sms and on a poll interval for retries
+    """
+
+    def __init__(self, poll_seconds=DISPATCH_POLL_SECONDS):
+        super().__init__(name="sms-dispatcher", daemon=True)
+        self.poll_seconds = poll_seconds
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.poll_seconds)
+            self.wakeup.clear()
+            try:
+                while dispatch_pending():
+                    pass
+            except Exception as e:
+                print(f'SMS dispatcher error: {e}')
+            finally:
+                close_old_connections()
+
+
+def wake_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or not _dispatcher.is_alive():
+            _dispatcher = SmsDispatcher()
+            _dispatcher.start()
+    _dispatcher.wakeup.set()
@@ -0,0 +1,192 @@
+from bisect import bisect_right
+from datetime import date
+import numpy as np
+
+
+# Kenyan statutory deductions on monthly pay. Every schedule is a list of
+# versions in effective date order, a payslip uses the version in force on
+# the last day of its pay period. Amounts are in shillings here and in cents
+# (int64) everywhere else, as in payroll.py.
+
+
+class TaxBands:
+    """
+    Marginal rates over bands of pay, [(upper limit or None for the top band, rate), ...]
+    """
+
+    def __init__(self, bands):
+        self.bands = bands
+        self.lower = np.array([0] + [round(limit * 100) for limit, _ in bands[:-1]], dtype=np.int64)
+        self.rates = np.array([rate for _, rate in bands], dtype=np.float64)
+        # Tax on everything below each band, so a salary only needs its own band looked up
+        self.base = np.concatenate(([0.0], np.cumsum(np.diff(self.lower) * self.rates[:-1])))
+
+    def apply(self, cents):
+        cents = np.maximum(cents, 0)
+        band = np.searchsorted(self.lower, cents, side='right') - 1
+        return np.rint(self.base[band] + (cents - self.lower[band]) * self.rates[band]).astype(np.int64)
+
+
+class FlatBands:
+    """
+    A fixed amount per band of pay, [(lower limit, amount), ...] starting from 0
+    """
+
+    def __init__(self, bands):
+        self.bands = bands
+        self.lower = np.array([round(limit * 100) for limit, _ in bands], dtype=np.int64)
+        self.amounts = np.array([round(amount * 100) for _, amount in bands], dtype=np.int64)
+
+    def apply(self, cents):
+        band = np.searchsorted(self.lower, np.maximum(cents, 0), side='right') - 1
+        return self.amounts[band]
+
+
+class PAYERates:
+    """
+    One version of the PAYE rules. health_deductible: health insurance contributions come off
+    taxable pay, otherwise they earn insurance relief at insurance_relief_rate.
+    """
+
+    def __init__(self, version, effective, bands, personal_relief, insurance_relief_rate=0.15,
+                 insurance_relief_cap=5000, health_relief=False, health_deductible=False):
+        self.version = version
+        self.effective = effective
+        self.bands = TaxBands(bands)
+        self.personal_relief = round(personal_relief * 100)
+        self.insurance_relief_rate = insurance_relief_rate
+        self.insurance_relief_cap = round(insurance_relief_cap * 100)
+        self.health_relief = health_relief
+        self.health_deductible = health_deductible
+
+    def income_tax(self, taxable, health):
+        relief = np.full_like(taxable, self.personal_relief)
+        if self.health_relief:
+            relief += np.minimum(np.rint(health * self.insurance_relief_rate).astype(np.int64), self.insurance_relief_cap)
+        # Reliefs are not refundable
+        return np.maximum(self.bands.apply(taxable) - relief, 0)
+
+
+class NSSFRates:
+    """
+    Employee share of NSSF, rate on pay up to the lower earnings limit (Tier I) and
+    between the lower and upper limits (Tier II)
+    """
+
+    def __init__(self, version, effective, rate, lower_limit, upper_limit):
+        self.version = version
+        self.effective = effective
+        self.rate = rate
+        self.lower_limit = round(lower_limit * 100)
+        self.upper_limit = round(upper_limit * 100)
+
+    def contribution(self, gross):
+        tier_one = np.minimum(gross, self.lower_limit)
+        tier_two = np.clip(gross, self.lower_limit, self.upper_limit) - self.lower_limit
+        return np.rint(tier_one * self.rate).astype(np.int64) + np.rint(tier_two * self.rate).astype(np.int64)
+
+
+class HealthRates:
+    """
+    NHIF by band of gross pay, or SHIF as a rate of gross pay with a minimum
+    """
+
+    def __init__(self, version, effective, bands=None, rate=None, minimum=0):
+        self.version = version
+        self.effective = effective
+        self.bands = FlatBands(bands) if bands else None
+        self.rate = rate
+        self.minimum = round(minimum * 100)
+
+    def contribution(self, gross):
+        if self.bands is not None:
+            return self.bands.apply(gross)
+        return np.maximum(np.rint(gross * self.rate).astype(np.int64), self.minimum)
+
+
+PAYE_BANDS_2021 = [(24000, 0.10), (32333, 0.25), (None, 0.30)]
+PAYE_BANDS_2023 = [(24000, 0.10), (32333, 0.25), (500000, 0.30), (800000, 0.325), (None, 0.35)]
+
+PAYE_RATES = [
+    PAYERates('Finance Act 2020', date(2021, 1, 1), PAYE_BANDS_2021, personal_relief=2400),
+    PAYERates('Finance Act 2023', date(2023, 7, 1), PAYE_BANDS_2023, personal_relief=2400, health_relief=True),
+    # SHIF comes off taxable pay instead of earning insurance relief
+    PAYERates('Tax Laws (Amendment) Act 2024', date(2024, 12, 27), PAYE_BANDS_2023, personal_relief=2400,
+              health_deductible=True),
+]
+
+NSSF_RATES = [
+    # The old scheme's 5% capped at KES 200
+    NSSFRates('NSSF Act 1965', date(2021, 1, 1), 0.05, lower_limit=4000, upper_limit=4000),
+    NSSFRates('NSSF Act 2013, year 1', date(2023, 2, 1), 0.06, lower_limit=6000, upper_limit=18000),
+    NSSFRates('NSSF Act 2013, year 2', date(2024, 2, 1), 0.06, lower_limit=7000, upper_limit=36000),
+    NSSFRates('NSSF Act 2013, year 3', date(2025, 2, 1), 0.06, lower_limit=8000, upper_limit=72000),
+]
+
+HEALTH_RATES = [
+    HealthRates('NHIF 2015', date(2015, 4, 1), bands=[
+        (0, 150), (6000, 300), (8000, 400), (12000, 500), (15000, 600), (20000, 750), (25000, 850),
+        (30000, 900), (35000, 950), (40000, 1000), (45000, 1100), (50000, 1200), (60000, 1300),
+        (70000, 1400), (80000, 1500), (90000, 1600), (100000, 1700),
+    ]),
+    HealthRates('SHIF', date(2024, 10, 1), rate=0.0275, minimum=300),
+]
+
+
+def in_force(versions, on):
+    """
+    The version of a schedule that applies on a date
+    """
+    index = bisect_right([version.effective for version in versions], on) - 1
+    if index < 0:
+        raise ValueError(f"No {type(versions[0]).__name__} in force on {on}, the first is from {versions[0].effective}")
+    return versions[index]
+
+
+def rates_in_force(on):
+    return {
+        'paye': in_force(PAYE_RATES, on),
+        'nssf': in_force(NSSF_RATES, on),
+        'health': in_force(HEALTH_RATES, on),
+    }
+
+
+def statutory_deductions(gross, on, paye=None, nssf=None, health=None):
+    """
+    income_tax, nssf_deduction and nhif_deduction (NHIF or SHIF) in cents for an
+    array of monthly gross pay in cents, under the rates in force on the date.
+    Any of the three schedules can be swapped for another version to try it out.
+    """
+    gross = np.maximum(np.asarray(gross, dtype=np.int64), 0)
+    paye = paye or in_force(PAYE_RATES, on)
+    nssf_deduction = (nssf or in_force(NSSF_RATES, on)).contribution(gross)
+    nhif_deduction = (health or in_force(HEALTH_RATES, on)).contribution(gross)
+
+    # NSSF contributions are always allowable, well below the KES 30,000 a month cap
+    taxable = gross - nssf_deduction
+    if paye.health_deductible:
+        taxable -= nhif_deduction
+    return {
+        'income_tax': paye.income_tax(taxable, nhif_deduction),
+        'nssf_deduction': nssf_deduction,
+        'nhif_deduction': nhif_deduction,
+    }
+
+
+def compare(gross, on, against, **versions):
+    """
+    What-if totals: the deductions on gross pay (cents) under the rates in force on
+    `on` next to those on `against`, or under the versions passed in
+    """
+    before = statutory_deductions(gross, on)
+    after = statutory_deductions(gross, against, **versions)
+    before['total_deductions'] = sum(before.values())
+    after['total_deductions'] = sum(after.values())
+    return {
+        name: {
+            'current': int(before[name].sum()),
+            'proposed': int(after[name].sum()),
+            'change': int(after[name].sum() - before[name].sum()),
+        }
+        for name in before
+    }
@@ -1,3 +1,1204 @@
-from django.test import TestCase
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Sum
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date, time, timedelta
+from decimal import Decimal
+from PIL import Image
+from pypdf import PdfReader
+from unittest import mock
+import gzip
+import io
+import json
+import numpy as np
+import shutil
+import tempfile
+import zipfile
+
+from .admin import EstimatedCountPaginator
+from .bulk_sms import RateLimiter, send_batch
+from .campaign_jobs import MAX_POSTER_VARIANTS, STALE_JOB_AFTER, enqueue_poster_job, run_poster_job
+from .dashboard import DASHBOARD_CACHE, build_dashboard, dashboard_key, get_dashboard
+from .delivery_reports import log_sent_messages, report_buffer
+from .directory import employee_page
+from .employee_import import REQUIRED_COLUMNS, import_employees
+from .exports import buffered
+from . import image_generation
+from .disbursements import apply_results, create_batch, fill_batch, issue_bank_file, streaming_bank_file
+from .ledger import rebuild_payroll_ledger
+from .models import (
+    Attendance, Department, Disbursement, DisbursementBatch, Employee, EmployeeHierarchy, LeaveRequest, OutboundSms,
+    Payslip, PayrollLedgerEntry, PayrollRun, PendingRegistration, PerformanceReview, PosterJob, SmsDeliveryStats,
+    SmsMessageLog, Training,
+)
+from .org_chart import add_employees, ancestors, closure_rows, move_subtree, rebuild_hierarchy
+from .otp_store import DatabaseOTPStore, SQLiteOTPStore, hash_otp
+from .payroll import STALE_RUN_AFTER, run_payroll, start_payroll_run
+from .payslip_documents import document_name, payslip_document, render_payslips, zip_documents
+from .reconciliation import MATCH_WINDOW_DAYS, reconcile_statement
+from .search import ranked_search, search_filter
+from .sms_outbox import (
+    MAX_SMS_ATTEMPTS, RETRY_BACKOFF_SECONDS, SENDING_TIMEOUT, claim_due_messages, dispatch_pending, queue_sms,
+)
+from .statutory import statutory_deductions
+
+
+def create_employee(number=1, **fields):
+    """
+    An Employee with every required field filled in, unique by number, fields override any of them
+    """
+    values = {
+        'fname': f"First{number}", 'lname': f"Last{number}", 'sname': "Test", 'employee_profession': 'Accountant',
+        'gender': 'Female', 'marital_status': 'Single', 'nationality': 'Kenya',
+        'email': f"employee{number}@example.com", 'phone_number': f"07{number:08d}", 'address': "Nairobi",
+        'city': "Nairobi", 'country': "Kenya", 'job_title': f"Title {number}", 'employment_type': 'Full-time',
+        'date_joined': date(2024, 1, 1), 'salary': 50000, 'bank_name': "Bank", 'bank_account_number': str(number),
+        'emergency_contact_name': "Contact", 'emergency_contact_relation': "Sibling",
+        'emergency_contact_phone': "0700000000", 'id_number': str(number),
+    }
+    values.update(fields)
+    return Employee.objects.create(**values)
+
 
 # Create your tests here.
+class AdminChangelistQueryTests(TestCase):
+    """
+    Every changelist runs a fixed number of queries however many rows the page
+    shows, so a list_display across a foreign key without list_select_related,
+    or a filter that reads the whole table, shows up here
+    """
+
+    # Session and user, the size estimate and (on these small tables) the exact count, the page,
+    # the sidebar's two permission lookups, the date hierarchy's range and entries,
+    # plus the department list for employees and the distinct ratings for reviews
+    EXPECTED_QUERIES = {
+        'employee': 10,
+        'attendance': 9,
+        'leaverequest': 9,
+        'performancereview': 10,
+        'payslip': 9,
+        'disbursement': 9,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.department = Department.objects.create(dpt_name='Finance', code='FIN')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.created = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.created += 1
+            number = self.created
+            employee = create_employee(number, department=self.department)
+            day = date(2024, 1, 1) + timedelta(days=number)
+            Attendance.objects.create(
+                attendance_employee=employee, attendance_date=day, attendance_check_in=time(8),
+                attendance_check_out=time(17), attendance_status='Present',
+            )
+            LeaveRequest.objects.create(
+                leave_employee=employee, leave_type='Annual', leave_start_date=day, leave_end_date=day,
+                leave_reason="Rest", leave_status='Pending',
+            )
+            PerformanceReview.objects.create(
+                performance_employee=employee, performance_review_date=day, performance_reviewer="HR",
+                performance_rating=4, performance_comments="",
+            )
+            payslip = Payslip.objects.create(
+                employee=employee, pay_period_start=day.replace(day=1), pay_period_end=day, basic_salary=50000,
+            )
+            Disbursement.objects.create(payslip=payslip, amount=payslip.net_salary)
+
+    def changelist_queries(self, model_name, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:ElevateHRApp_{model_name}_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_run_a_fixed_number_of_queries(self):
+        self.add_rows(2)
+        few = {model_name: self.changelist_queries(model_name) for model_name in self.EXPECTED_QUERIES}
+        self.add_rows(20)
+        for model_name, expected in self.EXPECTED_QUERIES.items():
+            with self.subTest(changelist=model_name):
+                self.assertEqual(few[model_name], expected)
+                self.assertEqual(self.changelist_queries(model_name), expected)
+
+    def test_employee_filter_does_not_list_employees(self):
+        self.add_rows(20)
+        employee = Employee.objects.first()
+        for model_name, field in [('attendance', 'attendance_employee'), ('leaverequest', 'leave_employee'),
+                                  ('performancereview', 'performance_employee'), ('payslip', 'employee')]:
+            with self.subTest(changelist=model_name):
+                url = reverse(f'admin:ElevateHRApp_{model_name}_changelist')
+                response = self.client.get(url)
+                self.assertContains(response, 'admin-autocomplete')
+                self.assertNotContains(response, f'>{employee}</option>')
+
+                response = self.client.get(url, {f'{field}__employee_ID__exact': employee.pk})
+                self.assertEqual(response.context['cl'].result_count, 1)
+                # The selected employee is the only one rendered into the filter
+                self.assertContains(response, f'<option value="{employee.pk}" selected>{employee}</option>', html=True)
+
+                # A cleared filter submits an empty value
+                response = self.client.get(url, {f'{field}__employee_ID__exact': ''})
+                self.assertEqual(response.context['cl'].result_count, 20)
+
+                # The options come from the autocomplete view, through the employee search index
+                response = self.client.get(reverse('admin:autocomplete'), {
+                    'app_label': 'ElevateHRApp', 'model_name': model_name, 'field_name': field, 'term': employee.fname,
+                })
+                self.assertEqual([result['id'] for result in response.json()['results']], [str(employee.pk)])
+
+    def test_employee_filters_skip_free_text_columns(self):
+        self.add_rows(3)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:ElevateHRApp_employee_changelist'))
+        self.assertFalse([query for query in queries if 'job_title' in query['sql'] and 'DISTINCT' in query['sql']])
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        caches[DASHBOARD_CACHE].clear()
+        self.addCleanup(caches[DASHBOARD_CACHE].clear)
+        self.manager = create_employee(1)
+        self.employee = create_employee(2, supervisor=self.manager)
+        self.other = create_employee(3)
+        for employee in (self.manager, self.employee, self.other):
+            get_dashboard(employee.pk)
+
+    def cached(self):
+        return {
+            employee.pk for employee in (self.manager, self.employee, self.other)
+            if caches[DASHBOARD_CACHE].get(dashboard_key(employee.pk)) is not None
+        }
+
+    def test_dashboard_is_built_once(self):
+        with mock.patch('ElevateHRApp.dashboard.build_dashboard', wraps=build_dashboard) as build:
+            self.assertEqual(get_dashboard(self.employee.pk)['employee'], self.employee)
+            build.assert_not_called()
+            # Yesterday's dashboard has the wrong week and month
+            tomorrow = timezone.localdate() + timedelta(days=1)
+            with mock.patch('ElevateHRApp.dashboard.timezone.localdate', return_value=tomorrow):
+                get_dashboard(self.employee.pk)
+            build.assert_called_once_with(self.employee.pk)
+
+    def test_a_change_drops_only_its_employee_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            LeaveRequest.objects.create(
+                leave_employee=self.employee, leave_type='Annual', leave_start_date=date.today(),
+                leave_end_date=date.today(), leave_reason="Rest", leave_status='Pending',
+            )
+            # A request before the commit still reads the old dashboard
+            self.assertEqual(self.cached(), {self.manager.pk, self.employee.pk, self.other.pk})
+        self.assertTrue(callbacks)
+        self.assertEqual(self.cached(), {self.manager.pk, self.other.pk})
+        self.assertEqual(get_dashboard(self.employee.pk)['leave']['pending'], 1)
+
+    def test_manager_changes_reach_their_reports(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manager.fname = "Renamed"
+            self.manager.save()
+        self.assertEqual(self.cached(), {self.other.pk})
+        self.assertEqual(get_dashboard(self.employee.pk)['employee'].supervisor.fname, "Renamed")
+
+    def test_trainings_drop_their_attendees(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            training = Training.objects.create(
+                training_title="Safety", training_description="", training_trainer="HR", training_date=date.today(),
+            )
+        self.assertEqual(len(self.cached()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            training.training_attendees.add(self.employee)
+        self.assertEqual(self.cached(), {self.manager.pk, self.other.pk})
+
+        get_dashboard(self.employee.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.training_set.add(training)
+        self.assertEqual(self.cached(), {self.manager.pk, self.employee.pk})
+
+
+class DirectoryPagingTests(TestCase):
+    def setUp(self):
+        self.employees = [
+            create_employee(number, employment_status='Active' if number % 3 else 'On Leave') for number in range(1, 11)
+        ]
+        # Half of them joined the table in the same instant, the employee_ID breaks the tie
+        Employee.objects.filter(employee_ID__in=[employee.pk for employee in self.employees[:5]]).update(
+            created_at=timezone.now() - timedelta(days=1),
+        )
+
+    def read_all(self, **filters):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = employee_page(cursor, limit=3, **filters)
+            seen += [row['employee_ID'] for row in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return seen
+
+    def test_pages_cover_everyone_once_newest_first(self):
+        expected = list(Employee.objects.order_by('-created_at', '-employee_ID').values_list('employee_ID', flat=True))
+        self.assertEqual(self.read_all(), expected)
+        self.assertEqual(
+            self.read_all(status='On Leave'),
+            [pk for pk in expected if Employee.objects.get(pk=pk).employment_status == 'On Leave'],
+        )
+
+    def test_cursor_is_unaffected_by_new_hires(self):
+        first = employee_page(limit=4)
+        create_employee(11)
+        rest = employee_page(first['next_cursor'], limit=100)
+        shown = [row['employee_ID'] for row in first['results'] + rest['results']]
+        self.assertEqual(sorted(shown), sorted(employee.pk for employee in self.employees))
+        self.assertNotIn('address', rest['results'][0])
+
+    def test_bad_cursor_is_a_bad_request(self):
+        response = self.client.get(reverse('employees_data'), {'cursor': "not-a-cursor"})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': "Invalid cursor"}))
+
+
+class EmployeeSearchTests(TestCase):
+    def setUp(self):
+        self.finance = Department.objects.create(dpt_name='Finance', code='FIN')
+        self.employees = [
+            create_employee(number, fname="Wanjiru", department=self.finance if number % 2 else None)
+            for number in range(1, 8)
+        ]
+        create_employee(8, fname="Otieno")
+
+    def test_every_match_is_found(self):
+        self.assertEqual(Employee.objects.filter(search_filter("wanj")).count(), 7)
+        self.assertFalse(Employee.objects.filter(search_filter("!!!")).exists())
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:ElevateHRApp_employee_changelist'), {'q': "Wanjiru"})
+        self.assertEqual(response.context['cl'].result_count, 7)
+
+    def test_search_pages_in_rank_order(self):
+        ranked = ranked_search("wanjiru", 100)
+        in_finance = [pk for _, pk in ranked if pk in {employee.pk for employee in self.employees[::2]}]
+        self.assertEqual(sorted(pk for _, pk in ranked), [employee.pk for employee in self.employees])
+        self.assertEqual(ranked_search("wanjiru", 100, after=ranked[2]), ranked[3:])
+        self.assertEqual(
+            [pk for _, pk in ranked_search("wanjiru", 100, within=Employee.objects.filter(department=self.finance))],
+            in_finance,
+        )
+
+        seen, cursor = [], None
+        while True:
+            page = employee_page(cursor, limit=3, q="wanjiru", department=self.finance.pk)
+            seen += [row['employee_ID'] for row in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, in_finance)
+
+
+class OrgChartTests(TestCase):
+    def links(self):
+        return set(EmployeeHierarchy.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_closure_rows_cut_loops(self):
+        rows, broken = closure_rows({1: None, 2: 1, 3: 2, 4: 5, 5: 4})
+        self.assertEqual(set(rows), {
+            (1, 1, 0), (2, 2, 0), (1, 2, 1), (3, 3, 0), (2, 3, 1), (1, 3, 2),
+            (4, 4, 0), (5, 5, 0), (4, 5, 1),
+        })
+        self.assertEqual(broken, [4])
+
+    def test_moving_a_manager_moves_their_reports(self):
+        top, other = create_employee(1), create_employee(2)
+        manager = create_employee(3, supervisor=top)
+        report = create_employee(4, supervisor=manager)
+
+        manager.supervisor = other
+        manager.save()
+        self.assertEqual(list(ancestors(report.pk)), [manager, other])
+        self.assertFalse(EmployeeHierarchy.objects.filter(ancestor=top, depth__gt=0).exists())
+
+        with self.assertRaises(ValueError):
+            move_subtree(other.pk, report.pk)
+        # Forms get a field error instead of a failed save
+        other.supervisor = report
+        with self.assertRaises(ValidationError) as error:
+            other.full_clean()
+        self.assertIn('supervisor', error.exception.message_dict)
+
+    def test_add_employees_links_new_and_existing_supervisors(self):
+        top = create_employee(1)
+        manager, report, loner = create_employee(2), create_employee(3), create_employee(4)
+        EmployeeHierarchy.objects.exclude(descendant=top).delete()
+
+        broken = add_employees({manager.pk: top.pk, report.pk: manager.pk, loner.pk: None})
+        self.assertEqual(broken, [])
+        self.assertEqual(self.links(), {
+            (top.pk, top.pk, 0), (manager.pk, manager.pk, 0), (report.pk, report.pk, 0), (loner.pk, loner.pk, 0),
+            (top.pk, manager.pk, 1), (manager.pk, report.pk, 1), (top.pk, report.pk, 2),
+        })
+
+
+class EmployeeSaveTests(TestCase):
+    def test_a_save_only_refreshes_what_it_changed(self):
+        manager = create_employee(1)
+        create_employee(2, supervisor=manager)
+        manager = Employee.objects.get(pk=manager.pk)
+        # Reading the stored values and the UPDATE, nothing to index, move or rebuild
+        with self.assertNumQueries(2):
+            manager.save()
+        with self.assertNumQueries(1):
+            manager.save(update_fields=['salary'])
+
+        manager.job_title = "Head of Finance"
+        with self.captureOnCommitCallbacks() as callbacks:
+            manager.save()
+        self.assertEqual(list(Employee.objects.filter(search_filter("finance")).values_list('pk', flat=True)),
+                         [manager.pk])
+        # The report's dashboard shows the new title too
+        with mock.patch.object(caches[DASHBOARD_CACHE], 'delete_many') as delete_many:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(set(delete_many.call_args.args[0]), {dashboard_key(1), dashboard_key(2)})
+
+
+class EmployeeImportTests(TestCase):
+    def upload(self, *rows):
+        """
+        CSV of (number, supervisor email) rows, the other columns as create_employee fills them
+        """
+        lines = [",".join((*REQUIRED_COLUMNS, 'supervisor'))]
+        for number, supervisor in rows:
+            values = {
+                'fname': f"First{number}", 'lname': f"Last{number}", 'sname': "Test", 'email': f"import{number}@example.com",
+                'phone_number': f"07{number:08d}", 'gender': 'Female', 'marital_status': 'Single', 'nationality': 'Kenya',
+                'address': "Nairobi", 'city': "Nairobi", 'country': "Kenya", 'job_title': "Chef",
+                'employee_profession': 'Chef', 'employment_type': 'Full-time', 'date_joined': "2024-01-01",
+                'salary': "50000", 'bank_name': "Bank", 'bank_account_number': str(number),
+                'emergency_contact_name': "Contact", 'emergency_contact_relation': "Sibling",
+                'emergency_contact_phone': "0700000000", 'id_number': str(number),
+            }
+            lines.append(",".join((*(values[column] for column in REQUIRED_COLUMNS), supervisor)))
+        return io.BytesIO("\n".join(lines).encode())
+
+    def links(self):
+        return set(EmployeeHierarchy.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_org_chart_matches_a_rebuild(self):
+        top = create_employee(1)
+        # 2 under the existing employee, 3 under 2 from an earlier batch, 4 under 5 further down the file
+        result = import_employees(self.upload(
+            (2, top.email), (3, "import2@example.com"), (4, "import5@example.com"), (5, "import3@example.com"),
+        ), batch_size=2)
+        self.assertEqual((result['created'], result['errors']), (4, []))
+
+        imported = self.links()
+        rebuild_hierarchy()
+        self.assertEqual(imported, self.links())
+        fourth = Employee.objects.get(email="import4@example.com")
+        self.assertEqual([employee.email for employee in ancestors(fourth.pk)], [
+            "import5@example.com", "import3@example.com", "import2@example.com", top.email,
+        ])
+
+    def test_batch_and_its_links_commit_together(self):
+        top = create_employee(1)
+        batches = []
+
+        def add_then_fail(parents):
+            batches.append(parents)
+            if len(batches) > 1:
+                raise RuntimeError("lost connection")
+            return add_employees(parents)
+
+        with mock.patch('ElevateHRApp.org_chart.add_employees', side_effect=add_then_fail), \
+                self.assertRaises(RuntimeError):
+            import_employees(self.upload((2, top.email), (3, top.email)), batch_size=1)
+        # The first batch is in with its links, the second is not in at all
+        second = Employee.objects.get(email="import2@example.com")
+        self.assertTrue(EmployeeHierarchy.objects.filter(ancestor=top, descendant=second, depth=1).exists())
+        self.assertFalse(Employee.objects.filter(email="import3@example.com").exists())
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_small_or_filtered_tables_count_exactly(self):
+        Department.objects.create(dpt_name='Finance', code='FIN')
+        Department.objects.create(dpt_name='Legal', code='LEG')
+        self.assertEqual(EstimatedCountPaginator(Department.objects.all(), 10).count, 2)
+        self.assertEqual(EstimatedCountPaginator(Department.objects.filter(code='FIN'), 10).count, 1)
+
+    def test_large_unfiltered_tables_use_the_estimate(self):
+        Department.objects.create(id=50000, dpt_name='Finance', code='FIN')
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(Department.objects.all(), 10).count, 50000)
+        self.assertEqual(EstimatedCountPaginator(Department.objects.filter(code='FIN'), 10).count, 1)
+
+
+class StatutoryDeductionTests(TestCase):
+    def deductions(self, gross, on):
+        amounts = statutory_deductions(np.array(gross) * 100, on)
+        return {name: (values / 100).tolist() for name, values in amounts.items()}
+
+    def test_rates_follow_the_pay_period(self):
+        # NHIF with insurance relief and the second year of NSSF
+        self.assertEqual(self.deductions([50000, 20000], date(2024, 6, 30)), {
+            'income_tax': [6555.35, 0.0], 'nssf_deduction': [2160.0, 1200.0], 'nhif_deduction': [1200.0, 750.0],
+        })
+        # SHIF off taxable pay and the third year of NSSF
+        self.assertEqual(self.deductions([50000, 1000], date(2025, 3, 31)), {
+            'income_tax': [6070.85, 0.0], 'nssf_deduction': [3000.0, 60.0], 'nhif_deduction': [1375.0, 300.0],
+        })
+
+    def test_top_band(self):
+        self.assertEqual(self.deductions([1000000], date(2025, 3, 31))['income_tax'], [298746.35])
+
+    def test_periods_before_the_tables(self):
+        with self.assertRaises(ValueError):
+            statutory_deductions(np.array([5000000]), date(2019, 1, 31))
+
+
+class PayrollRunTests(TestCase):
+    def test_run_pays_everyone_once(self):
+        create_employee(1, salary=30000)
+        # Joined on the 16th, paid for 15 of June's 30 days
+        create_employee(2, salary=30000, date_joined=date(2025, 6, 16))
+        create_employee(3, salary=30000, employment_status='Resigned')
+
+        run = start_payroll_run(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual((run.status, run.payslips_created, run.payslips_skipped), ('Completed', 2, 0))
+        full, half = Payslip.objects.order_by('employee_id')
+        self.assertEqual((full.gross_salary, full.net_salary), (30000, Decimal('26531.25')))
+        self.assertEqual(half.basic_salary, 15000)
+        self.assertEqual(run.total_net, full.net_salary + half.net_salary)
+
+        # A repeat after a new hire only pays the new hire
+        create_employee(4, salary=30000)
+        run = run_payroll(run)
+        self.assertEqual((run.payslips_created, run.payslips_skipped), (1, 2))
+        self.assertEqual(Payslip.objects.count(), 3)
+        self.assertEqual(run.total_net, Payslip.objects.aggregate(net=Sum('net_salary'))['net'])
+
+    def test_runs_cover_one_calendar_month(self):
+        create_employee(1, salary=30000)
+        # Monthly salary and monthly tax bands would be applied to a fortnight or a quarter
+        for start, end in [(date(2025, 6, 1), date(2025, 6, 15)), (date(2025, 4, 1), date(2025, 6, 30)),
+                           (date(2025, 6, 15), date(2025, 7, 14))]:
+            with self.assertRaises(ValueError):
+                start_payroll_run(start, end)
+        self.assertFalse(PayrollRun.objects.exists())
+
+        run = PayrollRun.objects.create(pay_period_start=date(2025, 6, 1), pay_period_end=date(2025, 6, 15))
+        with self.assertRaises(ValueError):
+            run_payroll(run)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'Draft')
+        self.assertFalse(Payslip.objects.exists())
+
+    def test_a_run_is_claimed_once(self):
+        create_employee(1)
+        run = PayrollRun.objects.create(
+            pay_period_start=date(2025, 6, 1), pay_period_end=date(2025, 6, 30), status='Running',
+            started_at=timezone.now(),
+        )
+        with self.assertRaises(ValueError):
+            run_payroll(run)
+        self.assertFalse(Payslip.objects.exists())
+
+        # The worker died, the run can be picked up again
+        PayrollRun.objects.filter(pk=run.pk).update(started_at=timezone.now() - STALE_RUN_AFTER - timedelta(minutes=1))
+        self.assertEqual(run_payroll(run).status, 'Completed')
+        self.assertEqual(Payslip.objects.count(), 1)
+
+
+class PayrollLedgerTests(TestCase):
+    """
+    The ledger posted change by change ends up where a rebuild from the payslips does
+    """
+
+    def assertMatchesRebuild(self):
+        def entries():
+            return sorted(PayrollLedgerEntry.objects.values_list(
+                'pay_period_start', 'pay_period_end', 'department_id', 'component', 'amount', 'payslips',
+            ), key=repr)
+        posted = entries()
+        rebuild_payroll_ledger()
+        self.assertEqual(entries(), posted)
+
+    def test_changes_are_posted(self):
+        finance = Department.objects.create(dpt_name='Finance', code='FIN')
+        legal = Department.objects.create(dpt_name='Legal', code='LEG')
+        first, second, third = (
+            create_employee(1, department=finance, salary=50000), create_employee(2, department=finance, salary=60000),
+            create_employee(3, salary=70000),
+        )
+        start_payroll_run(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertEqual(PayrollLedgerEntry.objects.filter(department=finance, component='net_salary').get().payslips, 2)
+        self.assertMatchesRebuild()
+
+        payslip = Payslip.objects.get(employee=first)
+        payslip.bonuses = 5000
+        payslip.save()
+        Payslip.objects.get(employee=third).delete()
+        second.department = legal
+        second.save()
+        self.assertMatchesRebuild()
+
+        legal.delete()
+        self.assertMatchesRebuild()
+
+    def test_reports_show_payroll_to_staff_only(self):
+        create_employee(1)
+        start_payroll_run(date(2025, 6, 1), date(2025, 6, 30))
+        self.assertNotContains(self.client.get(reverse('reporting-analytics')), 'payrollDepartments')
+        self.assertEqual(self.client.get(reverse('payroll_ledger')).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True))
+        self.assertContains(self.client.get(reverse('reporting-analytics')), 'payrollDepartments')
+        self.assertEqual(self.client.get(reverse('payroll_ledger')).json()['total']['payslips'], 1)
+
+
+class FakeSmsService:
+    """
+    Answers a send the way Africa's Talking does, failing the numbers in `failing`
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def send(self, message, recipients, sender=None):
+        self.sent.append((message, recipients))
+        return {'SMSMessageData': {'Recipients': [
+            {'number': number, 'status': 'InvalidPhoneNumber', 'messageId': 'None', 'cost': '0'}
+            if number in self.failing else
+            {'number': number, 'status': 'Success', 'messageId': f'ATXid_{number}', 'cost': 'KES 0.8000'}
+            for number in recipients
+        ]}}
+
+
+class SmsOutboxTests(TestCase):
+    def dispatch(self, service):
+        with mock.patch('ElevateHRApp.sms_outbox.get_sms_service', return_value=service):
+            return dispatch_pending()
+
+    def test_urgent_messages_go_first(self):
+        for number, kind in enumerate(('Welcome', 'Notification', 'OTP'), 1):
+            queue_sms(f'+25470000000{number}', kind, kind=kind)
+        service = FakeSmsService()
+        self.assertEqual(self.dispatch(service), 3)
+        self.assertEqual([message for message, _ in service.sent], ['OTP', 'Notification', 'Welcome'])
+        self.assertEqual(
+            set(OutboundSms.objects.values_list('status', 'provider_message_id')),
+            {('Sent', f'ATXid_+25470000000{number}') for number in (1, 2, 3)},
+        )
+
+    def test_failed_sends_back_off_then_give_up(self):
+        sms = queue_sms('+254700000001', "Hello")
+        service = FakeSmsService(failing=['+254700000001'])
+        for attempt in range(1, MAX_SMS_ATTEMPTS + 1):
+            started = timezone.now()
+            self.assertEqual(self.dispatch(service), 0)
+            sms.refresh_from_db()
+            self.assertEqual(sms.attempts, attempt)
+            if attempt < MAX_SMS_ATTEMPTS:
+                self.assertEqual(sms.status, 'Queued')
+                self.assertGreaterEqual(
+                    sms.next_attempt_at, started + timedelta(seconds=RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)),
+                )
+                # Not due again until the backoff is over
+                self.assertEqual(claim_due_messages(), [])
+                OutboundSms.objects.filter(pk=sms.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual((sms.status, sms.provider_status), ('Failed', 'InvalidPhoneNumber'))
+        self.assertEqual(len(service.sent), MAX_SMS_ATTEMPTS)
+
+    def test_messages_are_claimed_once(self):
+        sms = queue_sms('+254700000001', "Hello")
+        self.assertEqual(claim_due_messages(), [sms])
+        self.assertEqual(claim_due_messages(), [])
+        # A dispatcher that died mid-send gives the message up after SENDING_TIMEOUT
+        OutboundSms.objects.filter(pk=sms.pk).update(claimed_at=timezone.now() - SENDING_TIMEOUT - timedelta(seconds=1))
+        [reclaimed] = claim_due_messages()
+        self.assertEqual(reclaimed.attempts, 2)
+
+
+# The stores hash the password with make_password, the default hasher is slow on purpose
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class OTPStoreChecks:
+    """
+    The same behaviour from every OTP store backend, the subclasses say how to
+    make one and how to move its clock
+    """
+
+    def test_codes_are_stored_hashed(self):
+        store = self.store()
+        store.put('+254700000001', '123456', first_name="Amina", password="secret")
+        stored = self.stored_hash('+254700000001')
+        self.assertNotIn('123456', stored)
+        self.assertEqual(stored, hash_otp('+254700000001', '123456'))
+        # The same code for another number hashes differently
+        self.assertNotEqual(stored, hash_otp('+254700000002', '123456'))
+
+        self.assertIsNone(store.verify('+254700000002', '123456'))
+        profile = store.verify('+254700000001', ' 123456 ')
+        self.assertEqual(profile['first_name'], "Amina")
+        self.assertTrue(check_password("secret", profile['password']))
+        # Consumed by the successful check
+        self.assertIsNone(store.verify('+254700000001', '123456'))
+
+    def test_codes_expire(self):
+        store = self.store(ttl=60)
+        store.put('+254700000001', '123456')
+        with self.later(59):
+            self.assertIsNotNone(store.verify('+254700000001', '123456'))
+        store.put('+254700000001', '123456')
+        with self.later(61):
+            self.assertIsNone(store.verify('+254700000001', '123456'))
+        self.assertIsNone(store.verify('+254700000001', '123456'))
+
+    def test_wrong_codes_use_up_the_entry(self):
+        store = self.store(max_attempts=3)
+        store.put('+254700000001', '123456')
+        for _ in range(3):
+            self.assertIsNone(store.verify('+254700000001', '000000'))
+        self.assertIsNone(store.verify('+254700000001', '123456'))
+
+    def test_oldest_entries_make_room(self):
+        store = self.store(max_entries=2)
+        for number in (1, 2, 3):
+            with self.later(number):
+                store.put(f'+25470000000{number}', '123456')
+        self.assertIsNone(store.verify('+254700000001', '123456'))
+        self.assertIsNotNone(store.verify('+254700000003', '123456'))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class DatabaseOTPStoreTests(OTPStoreChecks, TestCase):
+    def store(self, **options):
+        return DatabaseOTPStore(**options)
+
+    def stored_hash(self, phone):
+        return PendingRegistration.objects.get(phone=phone).otp_hash
+
+    def later(self, seconds):
+        return mock.patch('ElevateHRApp.otp_store.timezone.now', return_value=timezone.now() + timedelta(seconds=seconds))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SQLiteOTPStoreTests(OTPStoreChecks, TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = f"{directory}/otp.sqlite3"
+
+    def store(self, **options):
+        self.current = SQLiteOTPStore(PATH=self.path, **options)
+        self.addCleanup(self.current._connection().conn.close)
+        return self.current
+
+    def stored_hash(self, phone):
+        with self.current._connection() as conn:
+            return conn.execute("SELECT otp_hash FROM pending_registration WHERE phone = ?", (phone,)).fetchone()[0]
+
+    def later(self, seconds):
+        return mock.patch('ElevateHRApp.otp_store.time.time', return_value=timezone.now().timestamp() + seconds)
+
+
+class SmsCampaignTests(TestCase):
+    def test_failed_recipients_have_no_message_id(self):
+        service = FakeSmsService(failing=['+254700000002'])
+        with mock.patch('ElevateHRApp.bulk_sms.get_sms_service', return_value=service):
+            rows = send_batch(1, "Hello", [(None, '+254700000001'), (None, '+254700000002')], RateLimiter(100))
+        self.assertEqual([(row.status, row.provider_message_id) for row in rows], [
+            ('Sent', 'ATXid_+254700000001'), ('Failed', None),
+        ])
+        self.assertEqual(rows[1].error, 'InvalidPhoneNumber')
+
+    def test_campaigns_are_staff_only(self):
+        response = self.client.post(reverse('sms_campaign_create'), {'message': "Hello"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(reverse('sms_campaign_status', args=[1])).status_code, 302)
+
+        staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.post(reverse('sms_campaign_create'), {'message': ""}).status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True))
+        self.finance = Department.objects.create(dpt_name='Finance', code='FIN')
+        self.employees = [
+            create_employee(number, department=self.finance if number % 2 else None, date_joined=date(2024, number, 1))
+            for number in range(1, 6)
+        ]
+
+    def export(self, name, **params):
+        response = self.client.get(reverse('export', args=[name]), params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_export_filters_by_period_and_department(self):
+        response, content = self.export('employees', start='2024-02-01', end='2024-05-01', department=self.finance.pk)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('employees-2024-02-01-2024-05-01.csv', response['Content-Disposition'])
+        header, *rows = content.decode().splitlines()
+        self.assertTrue(header.startswith("employee_id,first_name,last_name"))
+        self.assertEqual([row.split(",")[0] for row in rows], [str(self.employees[2].pk), str(self.employees[4].pk)])
+
+    def test_gzip_holds_the_same_rows(self):
+        _, plain = self.export('employees', format='ndjson')
+        response, compressed = self.export('employees', format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('employees.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+        rows = [json.loads(line) for line in plain.decode().splitlines()]
+        self.assertEqual([row['employee_id'] for row in rows], [employee.pk for employee in self.employees])
+        self.assertEqual(rows[0]['salary'], "50000.00")
+
+    def test_rows_stream_in_bounded_chunks(self):
+        lines = (f"{number:09d}\n" for number in range(1000))
+        with mock.patch('ElevateHRApp.exports.STREAM_BUFFER_BYTES', 100):
+            chunks = list(buffered(lines))
+            compressed = list(buffered((f"{number:09d}\n" for number in range(1000)), compress=True))
+        self.assertEqual(len(chunks), 100)
+        self.assertTrue(all(len(chunk) == 100 for chunk in chunks))
+        self.assertGreater(len(compressed), 1)
+        self.assertEqual(gzip.decompress(b"".join(compressed)), b"".join(chunks))
+
+    def test_bad_requests(self):
+        for name, params in [('salaries', {}), ('employees', {'format': 'xml'}), ('employees', {'start': 'May'})]:
+            with self.subTest(name=name, params=params):
+                self.assertEqual(self.client.get(reverse('export', args=[name]), params).status_code, 400)
+
+
+class PosterJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # The job runs inline: its connection handling would end the test's transaction,
+        # and the variant upload calls out to the image service
+        for target in ('close_old_connections', 'submit_poster_variants'):
+            patcher = mock.patch(f'ElevateHRApp.campaign_jobs.{target}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_job(self, results):
+        job = PosterJob.objects.create(job_title="Chef", prompt="A poster", variants_requested=len(results))
+        with mock.patch('ElevateHRApp.campaign_jobs.generate_image_bytes', side_effect=results):
+            run_poster_job(job.pk)
+        return PosterJob.objects.get(pk=job.pk)
+
+    def test_campaign_queues_a_job(self):
+        with mock.patch('ElevateHRApp.campaign_jobs._job_pool') as pool, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('campaign'), {'jobTitle': "Chef", 'variants': 99}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertEqual(response.status_code, 202)
+        job = PosterJob.objects.get()
+        self.assertEqual((job.status, job.variants_requested), ('Queued', MAX_POSTER_VARIANTS))
+        pool.submit.assert_called_once_with(run_poster_job, job.pk)
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['status'], status['progress'], status['posters']), ('Queued', 0, []))
+
+    def test_job_keeps_the_variants_that_worked(self):
+        with mock.patch('builtins.print'):
+            job = self.run_job([(b"png", 'image/png'), RuntimeError("quota")])
+        self.assertEqual((job.status, job.variants_completed, job.progress), ('Completed', 2, 100))
+        [poster] = job.posters
+        with default_storage.open(poster, 'rb') as stored:
+            self.assertEqual(stored.read(), b"png")
+
+    def test_job_without_posters_fails(self):
+        job = self.run_job([(None, None)])
+        self.assertEqual((job.status, job.error), ('Failed', "The model did not return any image"))
+        self.assertEqual(self.client.get(reverse('campaign_job_status', args=[job.pk])).json()['error'], job.error)
+
+    def test_enqueue_waits_for_the_commit(self):
+        with mock.patch('ElevateHRApp.campaign_jobs._job_pool') as pool:
+            with self.captureOnCommitCallbacks() as callbacks:
+                enqueue_poster_job("Chef", "A poster", 0)
+            pool.submit.assert_not_called()
+            callbacks[0]()
+        pool.submit.assert_called_once()
+        self.assertEqual(PosterJob.objects.get().variants_requested, 1)
+
+    def test_abandoned_job_fails_when_polled(self):
+        running = PosterJob.objects.create(job_title="Chef", prompt="A poster", status='Running')
+        abandoned = PosterJob.objects.create(job_title="Chef", prompt="A poster", status='Running')
+        PosterJob.objects.filter(pk=abandoned.pk).update(updated_at=timezone.now() - STALE_JOB_AFTER)
+
+        status = self.client.get(reverse('campaign_job_status', args=[abandoned.pk])).json()
+        self.assertEqual(status['status'], 'Failed')
+        self.assertIn("stopped before it finished", status['error'])
+        self.assertEqual(self.client.get(reverse('campaign_job_status', args=[running.pk])).json()['status'], 'Running')
+
+
+class PosterVariantTests(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        poster = io.BytesIO()
+        Image.new("RGB", (800, 600), (200, 40, 40)).save(poster, format="PNG")
+        self.poster = poster.getvalue()
+
+    def assertVariants(self, paths):
+        self.assertEqual(set(paths), set(image_generation.POSTER_VARIANTS))
+        for name, (width, height, image_format, _) in image_generation.POSTER_VARIANTS.items():
+            with self.subTest(name=name), Image.open(paths[name]) as variant:
+                self.assertEqual((variant.size, variant.format), ((width, height), image_format))
+
+    def test_every_social_format_is_rendered(self):
+        paths = image_generation.render_poster_variants(self.poster, self.output_dir)
+        self.assertVariants(paths)
+
+        # The same poster again reuses the files
+        with mock.patch('ElevateHRApp.image_generation._render_variant') as render:
+            self.assertEqual(image_generation.render_poster_variants(self.poster, self.output_dir), paths)
+        render.assert_not_called()
+
+    def test_variants_render_in_the_process_pool(self):
+        self.addCleanup(setattr, image_generation, '_variant_pool', None)
+        future = image_generation.submit_poster_variants(self.poster, self.output_dir)
+        self.addCleanup(image_generation._variant_pool.shutdown)
+        self.assertVariants(future.result(timeout=60))
+
+
+@override_settings(SMS_DELIVERY_REPORTS={'CALLBACK_TOKEN': "secret", 'ALLOWED_IPS': []})
+class SmsDeliveryReportTests(TestCase):
+    def setUp(self):
+        self.addCleanup(report_buffer.items.clear)
+        # No flusher thread, the tests flush when they mean to
+        patcher = mock.patch.object(report_buffer, 'interval', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def report(self, message_id, token="secret"):
+        return self.client.post(f"{reverse('sms_delivery_report')}?token={token}", {
+            'id': message_id, 'status': 'Success', 'phoneNumber': '+254700000001',
+        })
+
+    def test_reports_are_written_when_flushed(self):
+        log_sent_messages([('ATXid_1', '+254700000001')], 'Outbox')
+        self.assertEqual(self.report('ATXid_1').status_code, 200)
+        self.assertEqual(SmsMessageLog.objects.get().status, 'Sent')
+        report_buffer.flush()
+        self.assertEqual(SmsMessageLog.objects.get().status, 'Success')
+        self.assertEqual(SmsDeliveryStats.objects.get().delivered, 1)
+
+    def test_unsent_message_ids_are_only_counted(self):
+        self.report('ATXid_forged')
+        self.assertEqual(report_buffer.flush(), 0)
+        self.assertFalse(SmsMessageLog.objects.exists())
+        stats = SmsDeliveryStats.objects.get()
+        self.assertEqual((stats.reports, stats.unmatched), (0, 1))
+
+    def test_callers_need_the_token_and_an_allowed_address(self):
+        self.assertEqual(self.report('ATXid_1', token="").status_code, 403)
+        self.assertEqual(self.report('ATXid_1', token="guess").status_code, 403)
+        with self.settings(SMS_DELIVERY_REPORTS={'CALLBACK_TOKEN': "secret", 'ALLOWED_IPS': ['52.48.80.0']}):
+            self.assertEqual(self.report('ATXid_1').status_code, 403)
+        with self.settings(SMS_DELIVERY_REPORTS={'CALLBACK_TOKEN': "secret", 'ALLOWED_IPS': ['127.0.0.1']}):
+            self.assertEqual(self.report('ATXid_1').status_code, 200)
+        # No token configured, nobody gets in
+        with self.settings(SMS_DELIVERY_REPORTS={'CALLBACK_TOKEN': "", 'ALLOWED_IPS': []}):
+            self.assertEqual(self.report('ATXid_1', token="").status_code, 403)
+        self.assertEqual(len(report_buffer.items), 1)
+
+    def test_reports_die_with_the_worker(self):
+        # Answered 200 and only held in memory, a worker killed before the flush loses them
+        log_sent_messages([('ATXid_1', '+254700000001')], 'Outbox')
+        self.report('ATXid_1')
+        report_buffer.items.clear()
+        report_buffer.flush()
+        self.assertEqual(SmsMessageLog.objects.get().status, 'Sent')
+
+    def test_stats_are_for_staff(self):
+        url = reverse('sms_delivery_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True))
+        self.assertEqual(self.client.get(url, {'days': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'days': '0'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'days': '3'}).json(), {'days': []})
+
+
+class PayslipDocumentTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        department = Department.objects.create(dpt_name='Finance', code='FIN')
+        self.payslips = [
+            Payslip.objects.create(
+                employee=create_employee(number, department=department), pay_period_start=date(2025, 6, 1),
+                pay_period_end=date(2025, 6, 30), basic_salary=50000 + number, income_tax=5000,
+            )
+            for number in (1, 2)
+        ]
+
+    def test_documents_are_stored_by_hash(self):
+        self.assertEqual(render_payslips(Payslip.objects.all()), {'rendered': 2, 'changed': 2, 'seconds': mock.ANY})
+        # Nothing changed, nothing to record
+        self.assertEqual(render_payslips(Payslip.objects.all())['changed'], 0)
+
+        payslip = Payslip.objects.get(pk=self.payslips[0].pk)
+        name = payslip_document(payslip)
+        self.assertEqual(name, document_name(payslip.document_hash))
+        with default_storage.open(name, 'rb') as document:
+            text = PdfReader(document).pages[0].extract_text()
+        self.assertIn("50,001.00", text)
+        self.assertIn("First1", text)
+
+        # An edit clears the hash, the next request renders the new figures
+        payslip.bonuses = 1000
+        payslip.save()
+        self.assertEqual(payslip.document_hash, '')
+        self.assertNotEqual(payslip_document(payslip), name)
+
+    def test_zip_holds_every_payslip(self):
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(zip_documents(Payslip.objects.all()))))
+        self.assertEqual(archive.namelist(), [
+            f"2025-06-01_2025-06-30/Finance/{payslip.employee_id}-First{number}-Last{number}.pdf"
+            for number, payslip in enumerate(self.payslips, 1)
+        ])
+        # Documents rendered for the archive are stored and recorded on the way
+        for payslip, member in zip(Payslip.objects.order_by('employee_id'), archive.namelist()):
+            with default_storage.open(document_name(payslip.document_hash), 'rb') as document:
+                self.assertEqual(archive.read(member), document.read())
+
+
+class DisbursementTests(TestCase):
+    def setUp(self):
+        self.payslips = [self.add_payslip(number) for number in (1, 2)]
+        self.batch, self.result = create_batch(date(2025, 6, 1), date(2025, 6, 30))
+
+    def add_payslip(self, number):
+        return Payslip.objects.create(
+            employee=create_employee(number), pay_period_start=date(2025, 6, 1), pay_period_end=date(2025, 6, 30),
+            basic_salary=1000 * number, status='Generated',
+        )
+
+    def bank_file(self, response):
+        return b"".join(response.streaming_content).decode().splitlines()[1:]
+
+    def results(self, *rows):
+        lines = ["reference,status,amount", *rows]
+        return apply_results(self.batch, io.BytesIO("\n".join(lines).encode()))
+
+    def test_fill_batch_pays_each_payslip_once(self):
+        self.assertEqual((self.result['created'], self.result['retried']), (2, 0))
+        self.assertEqual((self.batch.payments, self.batch.total_amount), (2, 3000))
+        self.assertEqual(fill_batch(self.batch)['created'], 0)
+
+        # A failed payment goes back to Pending, out of the bank file it was in
+        issue_bank_file(self.batch)
+        Disbursement.objects.filter(payslip=self.payslips[0]).update(status='Failed', failure_reason="Closed")
+        later = DisbursementBatch.objects.create(pay_period_start=date(2025, 6, 1), pay_period_end=date(2025, 6, 30))
+        self.assertEqual(fill_batch(later), {'created': 0, 'retried': 1, 'seconds': mock.ANY})
+        disbursement = Disbursement.objects.get(payslip=self.payslips[0])
+        self.assertEqual((disbursement.batch, disbursement.status, disbursement.bank_file), (later, 'Pending', None))
+        # Both batches' totals follow the payment
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.payments, self.batch.total_amount, self.batch.failed), (1, 2000, 0))
+        self.assertEqual((later.payments, later.total_amount), (1, 1000))
+
+    def test_each_payment_is_issued_once(self):
+        number = issue_bank_file(self.batch)
+        self.assertEqual((number, self.batch.status), (1, 'Sent'))
+        response = streaming_bank_file(self.batch, number)
+        self.assertIn('bank-file-%d-1.csv' % self.batch.pk, response['Content-Disposition'])
+        self.assertEqual(len(self.bank_file(response)), 2)
+        self.assertIsNone(issue_bank_file(self.batch))
+
+        # The second file only holds the payment added since the first
+        payslip = self.add_payslip(3)
+        fill_batch(self.batch)
+        self.assertEqual(issue_bank_file(self.batch), 2)
+        [row] = self.bank_file(streaming_bank_file(self.batch, 2))
+        self.assertTrue(row.startswith(f"{payslip.disbursement.pk},"))
+
+        reissue = streaming_bank_file(self.batch, 1, reissue=True)
+        self.assertIn('bank-file-%d-1-reissue.csv' % self.batch.pk, reissue['Content-Disposition'])
+        self.assertEqual(len(self.bank_file(reissue)), 2)
+
+    def test_bank_file_is_post_only(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        url = reverse('admin:ElevateHRApp_disbursementbatch_bank_file', args=[self.batch.pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertFalse(Disbursement.objects.exclude(status='Pending').exists())
+
+        self.assertEqual(len(self.bank_file(self.client.post(url))), 2)
+        # Nothing new, nothing is sent twice
+        change = reverse('admin:ElevateHRApp_disbursementbatch_change', args=[self.batch.pk])
+        self.assertRedirects(self.client.post(url), change)
+        self.assertContains(self.client.get(change), "Re-issue bank file 1")
+        reissue = reverse('admin:ElevateHRApp_disbursementbatch_reissue_bank_file', args=[self.batch.pk, 1])
+        self.assertIn('-reissue.csv', self.client.post(reissue)['Content-Disposition'])
+        missing = reverse('admin:ElevateHRApp_disbursementbatch_reissue_bank_file', args=[self.batch.pk, 2])
+        self.assertEqual(self.client.post(missing).status_code, 404)
+
+    def test_results_file_settles_payments(self):
+        issue_bank_file(self.batch)
+        first, second = Disbursement.objects.order_by('payslip__employee_id')
+        result = self.results(
+            f"{first.pk},Paid,1000.00", f"{second.pk},Rejected,", f"{second.pk},Paid,9999", "999999,Paid,1",
+        )
+        self.assertEqual((result['rows'], result['successful'], result['failed']), (4, 1, 1))
+        self.assertEqual(result['errors'], [
+            (4, "amount 9999 does not match the 2000.00 sent"), (5, "disbursement 999999 is not in this batch"),
+        ])
+        self.assertEqual(
+            list(Disbursement.objects.order_by('payslip__employee_id').values_list('status', 'payslip__status')),
+            [('Successful', 'Paid'), ('Failed', 'Generated')],
+        )
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.successful, self.batch.failed, self.batch.status), (1, 1, 'Completed'))
+
+        # Paying twice is refused, the same result again changes nothing
+        result = self.results(f"{first.pk},Paid,", f"{first.pk},Failed,")
+        self.assertEqual((result['unchanged'], result['errors']), (1, [(3, f"disbursement {first.pk} was already paid")]))
+
+    def test_results_only_settle_payments_sent_to_the_bank(self):
+        first, second = Disbursement.objects.order_by('payslip__employee_id')
+        result = self.results(f"{first.pk},Paid,")
+        self.assertEqual((result['successful'], result['errors']), (0, [
+            (2, f"disbursement {first.pk} is Pending, not waiting for a result"),
+        ]))
+
+        issue_bank_file(self.batch)
+        self.results(f"{second.pk},Failed,")
+        # A late success for a payment that failed, and may be paid again in another batch, is refused
+        result = self.results(f"{second.pk},Paid,", f"{second.pk},Failed,")
+        self.assertEqual((result['successful'], result['unchanged'], result['errors']), (0, 1, [
+            (2, f"disbursement {second.pk} is Failed, not waiting for a result"),
+        ]))
+        self.assertEqual(Payslip.objects.filter(status='Paid').count(), 0)
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        for number in (1, 2, 3):
+            Payslip.objects.create(
+                employee=create_employee(number), pay_period_start=date(2025, 6, 1), pay_period_end=date(2025, 6, 30),
+                basic_salary=1000 * number, status='Generated',
+            )
+        self.batch, _ = create_batch(date(2025, 6, 1), date(2025, 6, 30))
+        issue_bank_file(self.batch)
+        self.first, self.second, self.third = Disbursement.objects.order_by('payslip__employee_id')
+        Disbursement.objects.filter(pk=self.first.pk).update(transaction_id='TX1')
+        self.today = timezone.now().date()
+
+    def reconcile(self, *rows):
+        lines = ["Transaction Reference,Account Number,Debit,Value Date,Status,Narration", *rows]
+        return reconcile_statement(io.BytesIO("\n".join(lines).encode()), date(2025, 6, 1), date(2025, 6, 30))
+
+    def statuses(self):
+        return list(Disbursement.objects.order_by('payslip__employee_id').values_list('status', 'payslip__status'))
+
+    def test_lines_match_by_transaction_or_account(self):
+        result = self.reconcile(
+            f"TX1,1,{self.first.amount},{self.today},Completed,",
+            # Banks pad and punctuate account numbers, and sign debits
+            f",00-02,\"(-{self.second.amount:,})\",{self.today:%d/%m/%Y},,",
+            f"TX1,1,{self.first.amount},{self.today},,",
+            # Paid once already, and no other payment fits
+            f",2,{self.second.amount},{self.today},,",
+            f",2,lots,{self.today},,",
+        )
+        self.assertEqual(
+            [result[key] for key in ('lines', 'matched', 'by_transaction', 'by_account', 'updated')], [5, 2, 2, 1, 2],
+        )
+        self.assertEqual([(line, disbursement, problem) for line, _, disbursement, problem in result['exceptions']], [
+            (4, self.first.pk, "disbursement already matched to another line"),
+            (5, None, "no matching disbursement"),
+            (6, None, "unreadable amount or date"),
+            (None, self.third.pk, "sent to the bank but not on the statement"),
+        ])
+        self.assertEqual(self.statuses(), [('Successful', 'Paid'), ('Successful', 'Paid'), ('Processing', 'Generated')])
+        report = result['exceptions_report'].splitlines()
+        self.assertEqual(report[0], "line,transaction_id,account,amount,date,disbursement,problem")
+        self.assertEqual(report[-1], f",,3,{self.third.amount},,{self.third.pk},sent to the bank but not on the statement")
+        self.batch.refresh_from_db()
+        self.assertEqual((self.batch.successful, self.batch.failed), (2, 0))
+
+        # The same statement again changes nothing
+        result = self.reconcile(f"TX1,1,{self.first.amount},{self.today},Completed,")
+        self.assertEqual((result['matched'], result['unchanged'], result['updated']), (1, 1, 0))
+
+    def test_returned_payment_is_paid_again(self):
+        result = self.reconcile(
+            f",2,{self.second.amount},{self.today},,",
+            f",2,{self.second.amount},{self.today},Returned,Account closed",
+        )
+        self.assertEqual((result['matched'], result['returned']), (2, 1))
+        self.assertEqual(self.statuses()[1], ('Failed', 'Generated'))
+        self.assertEqual(
+            Disbursement.objects.get(pk=self.second.pk).failure_reason,
+            f"Returned by the bank on {self.today}: Account closed",
+        )
+
+    def test_account_matches_only_take_payments_sent_to_the_bank(self):
+        # Pending was never in a bank file, Failed is waiting to be paid again
+        payslip = Payslip.objects.create(
+            employee=create_employee(4), pay_period_start=date(2025, 6, 1), pay_period_end=date(2025, 6, 30),
+            basic_salary=1000, status='Generated',
+        )
+        fill_batch(self.batch)
+        Disbursement.objects.filter(pk=self.second.pk).update(status='Failed')
+        result = self.reconcile(f",4,{payslip.net_salary},{self.today},,", f",2,{self.second.amount},{self.today},,")
+        self.assertEqual((result['matched'], result['updated']), (0, 0))
+        self.assertEqual([problem for line, _, _, problem in result['exceptions'] if line], ["no matching disbursement"] * 2)
+        self.assertEqual(Disbursement.objects.get(payslip=payslip).status, 'Pending')
+
+    def test_lines_that_do_not_fit_are_exceptions(self):
+        result = self.reconcile(
+            f"TX1,1,1.00,{self.today},,",
+            # Paid before the disbursement was made, or to an account no one has
+            f",3,{self.third.amount},{self.today - timedelta(days=1)},,",
+            f",99,{self.second.amount},{self.today},,",
+            # Another transaction id can't take a disbursement the bank already named
+            f"TX9,1,{self.first.amount},{self.today},,",
+            f",3,{self.third.amount},{self.today},Bounced,",
+        )
+        self.assertEqual([problem for *_, problem in result['exceptions']][:5], [
+            f"amount 1.00 does not match {self.first.amount}",
+            "no matching disbursement",
+            "no matching disbursement",
+            "no matching disbursement",
+            "unknown status 'Bounced'",
+        ])
+        self.assertEqual(result['updated'], 0)
+        self.assertEqual(self.statuses(), [('Processing', 'Generated')] * 3)
+
+    def test_match_window(self):
+        Disbursement.objects.filter(pk=self.second.pk).update(
+            disbursement_date=timezone.now() - timedelta(days=MATCH_WINDOW_DAYS + 1),
+        )
+        result = self.reconcile(f",2,{self.second.amount},{self.today},,")
+        self.assertEqual(result['exceptions'][0][3], "no matching disbursement")
+        result = self.reconcile(f",2,{self.second.amount},{self.today - timedelta(days=1)},,")
+        self.assertEqual((result['matched'], result['by_account']), (1, 1))
+
+    def test_period_must_not_end_before_it_starts(self):
+        with self.assertRaises(ValueError):
+            reconcile_statement(io.BytesIO(b""), date(2025, 7, 1), date(2025, 6, 30))
@@ -12,20 +12,34 @@ urlpatterns = [
     path('send-otp/', views.send_otp_view, name='send_otp'),
     # path('welcome-message/', views.welcome_message_view, name='welcome_message'),
     path('verify-otp/', views.verify_otp_view, name='verify_otp'),
+    path('sms/campaigns/', views.sms_campaign_create, name='sms_campaign_create'),
+    path('sms/campaigns/<int:campaign_id>/', views.sms_campaign_status, name='sms_campaign_status'),
+    path('sms/delivery-reports/', views.sms_delivery_report, name='sms_delivery_report'),
+    path('sms/delivery-stats/', views.sms_delivery_stats, name='sms_delivery_stats'),
     path('login/', views.login, name='login'),
     path('employees/', views.employees, name='employees'),
+    path('employees/data/', views.employees_data, name='employees_data'),
+    path('org-chart/', views.org_chart, name='org_chart'),
+    path('exports/<str:name>/', views.export, name='export'),
     # path('employee-dasboard', views.employee_dashboard, name='employee_dashboard'),
     path('employee_dashboard/<int:employee_ID>/', views.employee_dashboard, name='employee_dashboard'),
 
     path('recruitment/', views.recruitment, name='recruitment'),
     path('job-posting/', views.job_posting, name='job-posting'),
     path('campaign/', views.campaign, name='campaign'),
+    path('campaign/jobs/<uuid:job_id>/', views.campaign_job_status, name='campaign_job_status'),
     path('time-attendance/', views.time_attendance, name='time-attendance'),
     path('leave-management/', views.leave_management, name='leave-management'),
     path('reporting-analytics/', views.reporting_analytics, name='reporting-analytics'),
+    path('reporting-analytics/payroll/', views.payroll_ledger, name='payroll_ledger'),
     path('payslips/', views.payslip_list, name='payslip-list'),
     path('payslips/generate/', views.generate_payslip, name='generate_payslip'),
+    path('payslips/<int:payslip_id>/pdf/', views.payslip_pdf, name='payslip_pdf'),
+    path('payslips/documents/', views.payslip_documents, name='payslip_documents'),
     path('chatbot-response/', views.chatbot_response, name='chatbot_response'),
     path('performance/', views.performance, name='performance'),
     path('process-candidates/', views.process_candidates, name='process_candidates'),
 ]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
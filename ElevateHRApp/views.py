@@ -2,13 +2,19 @@
 from .forms import PayslipForm
 from .models import *
 from uuid import UUID
+from django.conf import settings
 from django.core.files.storage import FileSystemStorage
-from django.http import JsonResponse, HttpResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
 from django.views.decorators.http import require_POST
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 import africastalking
+import hmac
 import os
 import sys
 import secrets
@@ -24,7 +30,17 @@ load_dotenv()
 sys.path.insert(1, './ElevateHRApp')
 
 from rag_model import get_qa_chain, query_system
-from image_generation import google_image_generator
+from .campaign_jobs import enqueue_poster_job, fail_stale_job, poster_job_status
+from .otp_store import get_otp_store
+from .sms_outbox import queue_sms
+from .bulk_sms import start_sms_campaign
+from .delivery_reports import report_buffer, delivery_stats
+from .directory import employee_page, directory_counts
+from .dashboard import get_dashboard
+from .org_chart import ancestors, org_chart as build_org_chart
+from .exports import parse_period, streaming_export
+from .payslip_documents import payslip_document, streaming_documents
+from .ledger import latest_period, period_totals
 
 # Initialize Africa's Talking and Google Generative AI
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -37,7 +53,7 @@ sms = africastalking.SMS
 airtime = africastalking.Airtime
 voice = africastalking.Voice
 
-otp_storage = {}
+otp_store = get_otp_store()
 
 
 # Custom modules
@@ -48,41 +64,17 @@ def generate_otp(length=6):
 
 
 def send_otp(phone_number, otp_sms):
-
-    recipients = [f"+254{str(phone_number)}"]
-
     # Set your message
     message = f"{otp_sms}"
 
-    # Set your shortCode or senderId
-    sender = 20880
-
-    try:
-        response = sms.send(message, recipients, sender)
-
-        print(response)
-
-    except Exception as e:
-        print(f'Houston, we have a problem: {e}')
+    return queue_sms(phone_number, message, kind='OTP')
 
 
 def welcome_message(first_name, phone_number):
-
-    recipients = [f"+254{str(phone_number)}"]
-
     # Set your message
     message = f"{first_name}, Welcome to ElevateHR! Your account is now active. Lets streamline HR tasks together."
 
-    # Set your shortCode or senderId
-    sender = 20880
-
-    try:
-        response = sms.send(message, recipients, sender)
-
-        print(response)
-
-    except Exception as e:
-        print(f'Houston, we have a problem: {e}')
+    return queue_sms(phone_number, message, kind='Welcome')
 
 
 def get_gemini_response(prompt):
@@ -175,17 +167,12 @@ def send_otp_view(request):
             return JsonResponse({'error': 'Passwords do not match'}, status=400)
 
         otp_code = generate_otp()
-        otp_storage[phone] = {
-            'otp': otp_code,
-            'first_name': first_name,
-            'last_name': last_name,
-            'email': email,
-            'password': password,
-        }
-
-        welcome_message(first_name, phone)
+        otp_store.put(phone, otp_code, first_name=first_name, last_name=last_name, email=email, password=password)
 
-        send_otp(phone, otp_code)
+        # Both messages go to the outbox, the OTP is dispatched first
+        with transaction.atomic():
+            send_otp(phone, otp_code)
+            welcome_message(first_name, phone)
 
         # if get_otp_code:
         #     welcome_message(first_name, phone)
@@ -201,9 +188,9 @@ def verify_otp_view(request):
         phone = request.POST.get('phone')
         entered_otp = request.POST.get('otp')
         first_name = request.POST.get('first_name')
-        saved = otp_storage.get(phone)
+        saved = otp_store.verify(phone, entered_otp)
 
-        if saved and saved['otp'] == entered_otp:
+        if saved:
             welcome_message(first_name, phone)
             messages.success(
                 request, "Registration successful! Welcome to ElevateHR.")
@@ -214,6 +201,80 @@ def verify_otp_view(request):
     return redirect('hr_registration')
 
 
+@staff_member_required
+@require_POST
+def sms_campaign_create(request):
+    message = request.POST.get('message', '').strip()
+    if not message:
+        return JsonResponse({'error': 'A message is required'}, status=400)
+
+    department = None
+    if request.POST.get('department'):
+        department = get_object_or_404(Department, code=request.POST.get('department'))
+
+    employment_status = request.POST.get('employment_status', '')
+    if employment_status and employment_status not in dict(Employee.EMP_STATUS):
+        return JsonResponse({'error': 'Unknown employment status'}, status=400)
+
+    campaign = start_sms_campaign(
+        request.POST.get('name') or message[:50], message, department, employment_status
+    )
+    return JsonResponse({
+        'campaign_id': campaign.id,
+        'status_url': reverse('sms_campaign_status', args=[campaign.id]),
+    }, status=202)
+
+
+@staff_member_required
+def sms_campaign_status(request, campaign_id):
+    campaign = get_object_or_404(SmsCampaign, id=campaign_id)
+    return JsonResponse({
+        'campaign_id': campaign.id,
+        'name': campaign.name,
+        'status': campaign.status,
+        'total_recipients': campaign.total_recipients,
+        'sent': campaign.sent_count,
+        'failed': campaign.failed_count,
+    })
+
+
+def delivery_report_caller_allowed(request):
+    # The provider does not sign its callbacks, the URL it was given carries a shared token
+    config = settings.SMS_DELIVERY_REPORTS
+    token = config['CALLBACK_TOKEN']
+    if not token or not hmac.compare_digest(request.GET.get('token', ''), token):
+        return False
+    return not config['ALLOWED_IPS'] or request.META.get('REMOTE_ADDR') in config['ALLOWED_IPS']
+
+
+@csrf_exempt
+@require_POST
+def sms_delivery_report(request):
+    # Africa's Talking delivery callback, buffered and written in batches, settings.SMS_DELIVERY_REPORTS
+    # states what a worker that dies with reports in its buffer loses
+    if not delivery_report_caller_allowed(request):
+        return HttpResponse(status=403)
+    report_buffer.add({
+        'id': request.POST.get('id'),
+        'status': request.POST.get('status'),
+        'phoneNumber': request.POST.get('phoneNumber'),
+        'networkCode': request.POST.get('networkCode'),
+        'failureReason': request.POST.get('failureReason'),
+    })
+    return HttpResponse(status=200)
+
+
+@staff_member_required
+def sms_delivery_stats(request):
+    try:
+        days = int(request.GET.get('days', 7))
+    except ValueError:
+        return JsonResponse({'error': "days must be a whole number"}, status=400)
+    if days < 1:
+        return JsonResponse({'error': "days must be at least 1"}, status=400)
+    return JsonResponse({'days': delivery_stats(days)})
+
+
 @csrf_exempt
 def chatbot_response(request):
     if request.method == 'POST':
@@ -236,20 +297,128 @@ def index(request):
 
 
 def employees(request):
-    emp = Employee.objects.all()
+    # The cards are fetched page by page from employees_data
     context = {
-        'employees': emp,
+        'counts': directory_counts(),
+        'departments': Department.objects.values('id', 'dpt_name'),
+        'statuses': Employee.EMP_STATUS,
+        'professions': Employee.PROFESSIONS,
     }
     return render(request, 'employees.html', context)
 
 
+def employees_data(request):
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        limit = 50
+
+    try:
+        page = employee_page(
+            cursor=request.GET.get('cursor'),
+            limit=limit,
+            department=request.GET.get('department'),
+            status=request.GET.get('status'),
+            profession=request.GET.get('profession'),
+            q=request.GET.get('q', '').strip(),
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    for row in page['results']:
+        row['dashboard_url'] = reverse('employee_dashboard', args=[row['employee_ID']])
+    return JsonResponse(page)
+
+
 def employee_dashboard(request, employee_ID):
-    emp_dash = get_object_or_404(Employee, employee_ID=employee_ID)
+    dashboard = get_dashboard(employee_ID)
+    if dashboard is None:
+        raise Http404("No employee with that ID")
     context = {
-        'emp_dash': emp_dash,
+        'emp_dash': dashboard['employee'],
+        'dashboard': dashboard,
     }
     return render(request, 'employee-dashboard.html', context)
 
+def org_chart(request):
+    """
+    JSON org chart for the portal, ?root=<employee_ID> for one manager's tree and ?depth=<levels> to cut it short
+    """
+    try:
+        root = int(request.GET['root']) if request.GET.get('root') else None
+        depth = int(request.GET['depth']) if request.GET.get('depth') else None
+    except ValueError:
+        return JsonResponse({'error': "root and depth must be whole numbers"}, status=400)
+    if depth is not None and depth < 0:
+        return JsonResponse({'error': "depth cannot be negative"}, status=400)
+
+    tree = build_org_chart(root_id=root, max_depth=depth)
+    if root is not None and not tree:
+        return JsonResponse({'error': "No employee with that ID"}, status=404)
+
+    data = {'tree': tree}
+    if root is not None:
+        # Breadcrumb from the top of the organisation down to the root
+        data['reporting_line'] = [
+            {'employee_ID': row['employee_ID'], 'name': f"{row['fname']} {row['lname']}", 'job_title': row['job_title']}
+            for row in reversed(ancestors(root).values('employee_ID', 'fname', 'lname', 'job_title'))
+        ]
+    return JsonResponse(data)
+
+@staff_member_required
+def export(request, name):
+    """
+    Full extract of employees, payslips or attendance for payroll bureaus and auditors:
+    ?format=csv|ndjson, ?start= and ?end= (YYYY-MM-DD), ?department=<id>, ?gzip=1
+    """
+    try:
+        start, end = parse_period(request.GET.get('start'), request.GET.get('end'))
+        department = request.GET.get('department')
+        if department and not department.isdigit():
+            raise ValueError("department must be a department id")
+        return streaming_export(
+            name,
+            export_format=request.GET.get('format', 'csv'),
+            compress=request.GET.get('gzip') in ('1', 'true'),
+            start=start,
+            end=end,
+            department=department,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@staff_member_required
+def payslip_pdf(request, payslip_id):
+    payslip = get_object_or_404(Payslip.objects.select_related('employee'), pk=payslip_id)
+    name = payslip_document(payslip)
+    return FileResponse(
+        default_storage.open(name, 'rb'), content_type='application/pdf',
+        filename=f"payslip-{payslip.employee_id}-{payslip.pay_period_end}.pdf",
+    )
+
+@staff_member_required
+def payslip_documents(request):
+    """
+    Streamed ZIP of the payslip PDFs for a period: ?start= and ?end= (YYYY-MM-DD)
+    bound the pay period end, ?department=<id> narrows it to one department
+    """
+    try:
+        start, end = parse_period(request.GET.get('start'), request.GET.get('end'))
+        if not start or not end:
+            raise ValueError("start and end are required")
+        department = request.GET.get('department')
+        if department and not department.isdigit():
+            raise ValueError("department must be a department id")
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    payslips = Payslip.objects.filter(pay_period_end__range=(start, end))
+    filename = f"payslips-{start}-{end}"
+    if department:
+        payslips = payslips.filter(employee__department_id=department)
+        filename += f"-department-{department}"
+    return streaming_documents(payslips, f"{filename}.zip")
+
 @csrf_exempt
 def campaign(request):
     if request.method == 'POST':
@@ -272,16 +441,32 @@ def campaign(request):
         Requirements: {campaign_data['requirements']}.
         """
 
-        # Call your image generator
-        generated_image = google_image_generator(prompt)
+        try:
+            variants = int(request.POST.get("variants", 1))
+        except ValueError:
+            variants = 1
+
+        # Queue the poster generation, the page polls campaign_job_status for progress
+        job = enqueue_poster_job(campaign_data['job_title'], prompt, variants)
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({
+                'job_id': str(job.job_id),
+                'status_url': reverse('campaign_job_status', args=[job.job_id]),
+            }, status=202)
 
         return render(request, 'campaign.html', {
             "campaign": campaign_data,
-            "generated_image": generated_image,
+            "job": job,
         })
     return render(request, 'campaign.html')
 
 
+def campaign_job_status(request, job_id):
+    job = fail_stale_job(get_object_or_404(PosterJob, job_id=job_id))
+    return JsonResponse(poster_job_status(job))
+
+
 def job_posting(request):
     return render(request, 'job_posting.html')
 
@@ -299,7 +484,40 @@ def leave_management(request):
 
 
 def reporting_analytics(request):
-    return render(request, 'reporting_analytics.html')
+    context = {}
+    # Payroll totals are for staff, as on the payroll_ledger endpoint
+    period = latest_period() if request.user.is_staff else None
+    if period:
+        # Payroll figures come from the ledger, a few rows per department however many payslips there are
+        context['payroll_departments'], context['payroll_total'] = period_totals(*period)
+        context['payroll_period'] = period
+    return render(request, 'reporting_analytics.html', context)
+
+
+@staff_member_required
+def payroll_ledger(request):
+    """
+    Payroll totals by department for a pay period, ?start= and ?end= (YYYY-MM-DD),
+    the latest period in the ledger when left out
+    """
+    try:
+        start, end = parse_period(request.GET.get('start'), request.GET.get('end'))
+        if bool(start) != bool(end):
+            raise ValueError("start and end go together")
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not start:
+        period = latest_period()
+        if period is None:
+            return JsonResponse({'period': None, 'departments': [], 'total': None})
+        start, end = period
+
+    departments, total = period_totals(start, end)
+    return JsonResponse({
+        'period': {'start': start, 'end': end},
+        'departments': departments,
+        'total': total,
+    })
 
 
 def performance(request):
@@ -0,0 +1,68 @@
+from django.db import close_old_connections
+import atexit
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Collects items in memory and hands them to write() in batches, when
+    `size` of them are waiting or every `interval` seconds. An interval of
+    None leaves the flushing to whoever calls flush().
+
+    A failed write keeps its items for the next flush. An item that has been
+    in `attempts` failed writes is logged at error level, with its payload,
+    and dropped. A clean exit flushes what is left, a worker that is killed
+    or crashes loses what it holds.
+    """
+
+    def __init__(self, write, name, size=200, interval=1, attempts=3):
+        self.write = write
+        self.name = name
+        self.size = size
+        self.interval = interval
+        self.attempts = attempts
+        self.items = []  # [item, failed writes it has been in]
+        self.lock = threading.Lock()
+        self.flusher = None
+        atexit.register(self.flush)
+
+    def add(self, item):
+        with self.lock:
+            self.items.append((item, 0))
+            full = len(self.items) >= self.size
+            if self.interval and (self.flusher is None or not self.flusher.is_alive()):
+                self.flusher = threading.Thread(target=self._flush_periodically, name=f"{self.name}-flusher",
+                                                daemon=True)
+                self.flusher.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            items, self.items = self.items, []
+        if not items:
+            return 0
+        try:
+            return self.write([item for item, _ in items])
+        except Exception as e:
+            print(f'Could not write {self.name}: {e}')
+            retry = [(item, failures + 1) for item, failures in items if failures + 1 < self.attempts]
+            for item, failures in items:
+                if failures + 1 >= self.attempts:
+                    logger.error("Dropped %s after %d failed writes: %r", self.name, self.attempts, item)
+            with self.lock:
+                self.items[:0] = retry
+            return 0
+
+    def _flush_periodically(self):
+        while self.interval:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
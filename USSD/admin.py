@@ -1,3 +1,11 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import EmployeeSummary
+
+
+@admin.register(EmployeeSummary)
+class EmployeeSummaryAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'phone_number', 'latest_rating', 'latest_net_pay', 'leave_balance', 'pending_docs', 'updated_at')
+    search_fields = ('phone_number',)
+    list_select_related = ('employee',)
@@ -0,0 +1,112 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from ElevateHRApp.dashboard import invalidate_dashboards
+from ElevateHRApp.models import Attendance
+from ElevateHRApp.phone import normalise_phone
+from ElevateHRApp.write_behind import WriteBehindBuffer
+from .models import EmployeeSummary
+
+
+ATTENDANCE_BUFFER_SIZE = 200
+ATTENDANCE_FLUSH_SECONDS = 1
+# Failed writes an event is kept for before it is logged and dropped
+ATTENDANCE_WRITE_ATTEMPTS = 3
+EMPLOYEE_LOOKUP_SECONDS = 300
+WRITE_BATCH_SIZE = 500
+
+CHECK_IN = 'in'
+CHECK_OUT = 'out'
+
+
+def employee_for_phone(phone_number):
+    """
+    employee_ID for a caller, cached per worker so repeat callers skip the
+    database. None when no employee or more than one has the number.
+    """
+    phone = normalise_phone(phone_number)
+    key = f"ussd-employee:{phone}"
+    employee_id = cache.get(key)
+    if employee_id is None:
+        employee_ids = list(
+            EmployeeSummary.objects.filter(phone_number=phone).values_list('employee_id', flat=True)[:2]
+        )
+        if len(employee_ids) > 1:
+            print(f'USSD: {phone} belongs to more than one employee')
+            return None
+        employee_id = employee_ids[0] if employee_ids else None
+        if employee_id is not None:
+            cache.set(key, employee_id, EMPLOYEE_LOOKUP_SECONDS)
+    return employee_id
+
+
+def write_attendance(events):
+    """
+    Applies clock events in bulk, one Attendance row per (employee, date):
+    the earliest check-in and the latest check-out win, so replays are harmless
+    """
+    latest = {}
+    for employee_id, day, kind, at in events:
+        key = (employee_id, day)
+        check_in, check_out = latest.get(key, (None, None))
+        if kind == CHECK_IN:
+            check_in = min(check_in, at) if check_in else at
+        else:
+            check_out = max(check_out, at) if check_out else at
+        latest[key] = (check_in, check_out)
+    if not latest:
+        return 0
+
+    employee_ids = {employee_id for employee_id, _ in latest}
+    days = {day for _, day in latest}
+
+    with transaction.atomic():
+        existing = {
+            (row.attendance_employee_id, row.attendance_date): row
+            for row in Attendance.objects.select_for_update().filter(
+                attendance_employee_id__in=employee_ids, attendance_date__in=days,
+            )
+        }
+
+        created, updated = [], []
+        for (employee_id, day), (check_in, check_out) in latest.items():
+            row = existing.get((employee_id, day))
+            if row is None:
+                created.append(Attendance(
+                    attendance_employee_id=employee_id,
+                    attendance_date=day,
+                    attendance_check_in=check_in,
+                    attendance_check_out=check_out,
+                    attendance_status='Present',
+                ))
+                continue
+
+            if check_in and (row.attendance_check_in is None or check_in < row.attendance_check_in):
+                row.attendance_check_in = check_in
+            if check_out and (row.attendance_check_out is None or check_out > row.attendance_check_out):
+                row.attendance_check_out = check_out
+            row.attendance_status = 'Present'
+            updated.append(row)
+
+        Attendance.objects.bulk_create(created, batch_size=WRITE_BATCH_SIZE)
+        Attendance.objects.bulk_update(
+            updated, ['attendance_check_in', 'attendance_check_out', 'attendance_status'], batch_size=WRITE_BATCH_SIZE,
+        )
+        invalidate_dashboards(employee_ids)
+    return len(latest)
+
+
+attendance_buffer = WriteBehindBuffer(
+    write_attendance, "attendance events",
+    size=ATTENDANCE_BUFFER_SIZE, interval=ATTENDANCE_FLUSH_SECONDS, attempts=ATTENDANCE_WRITE_ATTEMPTS,
+)
+
+
+def record_clock_event(employee_id, kind, at=None):
+    """
+    Buffers a clock event, so a USSD hop only appends to a list. Returns the local time it was recorded at.
+    """
+    at = timezone.localtime(at)
+    attendance_buffer.add((employee_id, at.date(), kind, at.time().replace(microsecond=0)))
+    return at
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+import time
+
+from USSD.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-employee USSD summaries, e.g. after a bulk import or at the start of a leave year"
+
+    def add_arguments(self, parser):
+        parser.add_argument('employee_ids', nargs='*', type=int, help="Only these employees (default: everyone)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_summaries(options['employee_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {written} summaries in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+import random
+import threading
+import time
+import uuid
+
+from USSD.menu import ROUTES
+from USSD.models import EmployeeSummary
+from USSD.state_machine import INPUT, End, Prompt
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays realistic Africa's Talking USSD sessions (and optionally SMS delivery reports) "
+        "against the app and reports hop latency percentiles and error rates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help="USSD sessions to simulate")
+        parser.add_argument('--concurrency', type=int, default=20, help="Sessions in flight at once")
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000 "
+                                          "(default: call the app in-process)")
+        parser.add_argument('--service-code', default='*384*123#')
+        parser.add_argument('--paths', help="Comma separated menu paths to end on, e.g. 1*1,1*2 for a shift change "
+                                            "(default: random walks through the whole menu)")
+        parser.add_argument('--use-employees', action='store_true',
+                            help="Dial from real employee numbers, so handlers write attendance and leave "
+                                 "(default: unregistered numbers, read-only)")
+        parser.add_argument('--think-ms', type=int, default=0, help="Pause between hops of one session")
+        parser.add_argument('--timeout-ms', type=int, default=5000, help="Operator timeout a hop must beat")
+        parser.add_argument('--delivery-reports', type=int, default=0,
+                            help="SMS delivery report callbacks to send, needs --url: their message ids were "
+                                 "never sent, so each one counts as unmatched in SmsDeliveryStats")
+        parser.add_argument('--callback-token', default=settings.SMS_DELIVERY_REPORTS['CALLBACK_TOKEN'],
+                            help="Token the delivery report callback expects (default: this settings' one)")
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.local = threading.local()
+
+        if options['delivery_reports'] and not options['url']:
+            # In-process they would go into this database's real delivery stats
+            raise CommandError("--delivery-reports needs --url, a server whose database can take fake reports")
+
+        phones = self.phone_numbers()
+        targets = options['paths'].split(',') if options['paths'] else None
+        for path in targets or ():
+            if path not in ROUTES:
+                raise CommandError(f"Unknown menu path {path!r}")
+
+        sessions = [
+            (f"ATUid_{uuid.uuid4().hex}", self.random.choice(phones), self.session_hops(targets))
+            for _ in range(options['sessions'])
+        ]
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            started = time.perf_counter()
+            hop_results = [hop for hops in pool.map(self.run_session, sessions) for hop in hops]
+            self.report("USSD hops", hop_results, time.perf_counter() - started)
+
+            if options['delivery_reports']:
+                started = time.perf_counter()
+                report_results = list(pool.map(self.send_delivery_report, range(options['delivery_reports'])))
+                self.report("SMS delivery reports", report_results, time.perf_counter() - started)
+
+    # Traffic generation
+
+    def phone_numbers(self):
+        if self.options['use_employees']:
+            phones = list(EmployeeSummary.objects.exclude(phone_number='').values_list('phone_number', flat=True)[:10000])
+            connection.close()
+            if not phones:
+                raise CommandError("No employee summaries, run refresh_ussd_summaries first")
+            return phones
+        return [f"+2547{self.random.randrange(10 ** 8):08d}" for _ in range(1000)]
+
+    def sample_input(self, prompt):
+        if prompt.name == 'start':
+            return (date.today() + timedelta(days=self.random.randint(1, 30))).strftime("%d%m%Y")
+        if prompt.name == 'days':
+            return str(self.random.randint(1, 5))
+        return "1"
+
+    def session_hops(self, targets):
+        """
+        The cumulative `text` values Africa's Talking would send for one session
+        """
+        if targets:
+            path = self.random.choice(targets)
+        else:
+            path = ""
+            while not isinstance(ROUTES[path], End):
+                node = ROUTES[path]
+                step = INPUT if isinstance(node, Prompt) else self.random.choice(node.options).key
+                path = f"{path}*{step}" if path else step
+
+        hops, text, walked = [("", "")], "", ""
+        for segment in path.split("*") if path else ():
+            value = self.sample_input(ROUTES[walked]) if segment == INPUT else segment
+            text = f"{text}*{value}" if text else value
+            walked = f"{walked}*{segment}" if walked else segment
+            hops.append((text, walked))
+        return hops
+
+    # Transport
+
+    def post(self, path, data):
+        started = time.perf_counter()
+        try:
+            if self.options['url']:
+                request = Request(self.options['url'].rstrip('/') + path, data=urlencode(data).encode(), method='POST')
+                with urlopen(request, timeout=self.options['timeout_ms'] / 1000 * 2) as response:
+                    status, body = response.status, response.read().decode()
+            else:
+                client = getattr(self.local, 'client', None)
+                if client is None:
+                    client = self.local.client = Client(SERVER_NAME='localhost')
+                response = client.post(path, data)
+                status, body = response.status_code, response.content.decode()
+        except Exception as e:
+            status, body = None, str(e)
+        return (time.perf_counter() - started) * 1000, status, body
+
+    def run_session(self, session):
+        session_id, phone_number, hops = session
+        results = []
+        try:
+            for text, path in hops:
+                latency, status, body = self.post('/ussd/', {
+                    'sessionId': session_id,
+                    'serviceCode': self.options['service_code'],
+                    'phoneNumber': phone_number,
+                    'text': text,
+                })
+                ok = status == 200 and body.startswith(("CON ", "END "))
+                results.append((path or "(root)", latency, ok))
+                if not ok or body.startswith("END "):
+                    break
+                if self.options['think_ms']:
+                    time.sleep(self.options['think_ms'] / 1000)
+        finally:
+            connection.close()
+        return results
+
+    def send_delivery_report(self, index):
+        try:
+            token = urlencode({'token': self.options['callback_token']})
+            latency, status, _ = self.post(f'/sms/delivery-reports/?{token}', {
+                'id': f"ATXid_sim_{uuid.uuid4().hex}",
+                'status': self.random.choices(['Success', 'Failed', 'Buffered'], weights=[90, 5, 5])[0],
+                'phoneNumber': f"+2547{self.random.randrange(10 ** 8):08d}",
+                'networkCode': '63902',
+                'retryCount': '0',
+            })
+        finally:
+            connection.close()
+        return ('delivery-report', latency, status == 200)
+
+    # Reporting
+
+    def report(self, title, results, elapsed):
+        latencies = sorted(latency for _, latency, _ in results)
+        errors = sum(1 for _, _, ok in results if not ok)
+        timeouts = sum(1 for latency in latencies if latency > self.options['timeout_ms'])
+
+        def percentile(values, p):
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{title}: {len(results)} requests in {elapsed:.2f}s "
+                                                     f"({len(results) / elapsed if elapsed else 0:.1f}/s)"))
+        self.stdout.write(
+            f"  p50 {percentile(latencies, 50):.1f}ms  p95 {percentile(latencies, 95):.1f}ms  "
+            f"p99 {percentile(latencies, 99):.1f}ms  max {percentile(latencies, 100):.1f}ms"
+        )
+        error_line = f"  errors {errors} ({errors / len(results) if results else 0:.2%})  " \
+                     f"over {self.options['timeout_ms']}ms {timeouts} ({timeouts / len(results) if results else 0:.2%})"
+        self.stdout.write(self.style.ERROR(error_line) if errors or timeouts else self.style.SUCCESS(error_line))
+
+        by_path = defaultdict(list)
+        for path, latency, _ in results:
+            by_path[path].append(latency)
+        if len(by_path) > 1:
+            self.stdout.write("  slowest paths (p95):")
+            slowest = sorted(by_path.items(), key=lambda item: percentile(sorted(item[1]), 95), reverse=True)[:5]
+            for path, values in slowest:
+                self.stdout.write(f"    {path:<16} p95 {percentile(sorted(values), 95):.1f}ms  ({len(values)} hops)")
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from django.utils import timezone
+
+from ElevateHRApp.models import LeaveRequest
+from .attendance import employee_for_phone, record_clock_event, CHECK_IN, CHECK_OUT
+from .state_machine import Menu, Option, Prompt, End, compile_menu
+from .summaries import get_summary
+
+
+# Also what a number shared by several employees gets, HR has to sort that out
+NOT_REGISTERED = "We could not find your employee profile from this number. Please contact HR"
+MAX_LEAVE_DAYS = 90
+
+
+def clock_in(ussd):
+    employee_id = employee_for_phone(ussd.phone_number)
+    if employee_id is None:
+        return NOT_REGISTERED
+    at = record_clock_event(employee_id, CHECK_IN)
+    return f"You have successfully clocked in at {at:%H:%M}. Have a good day ahead"
+
+
+def clock_out(ussd):
+    employee_id = employee_for_phone(ussd.phone_number)
+    if employee_id is None:
+        return NOT_REGISTERED
+    at = record_clock_event(employee_id, CHECK_OUT)
+    return f"You have successfully clocked out at {at:%H:%M}. Kwaheri!"
+
+
+def report_status(ussd):
+    summary = get_summary(ussd.phone_number)
+    if summary is None:
+        return NOT_REGISTERED
+    return (
+        f"Leave balance: {summary.leave_balance} days \n"
+        f"Pending documents: {summary.pending_docs} \n"
+        "Log in to your profile for a detailed report"
+    )
+
+
+def performance_summary(ussd):
+    summary = get_summary(ussd.phone_number)
+    if summary is None:
+        return NOT_REGISTERED
+    if summary.latest_rating is None:
+        return "You have no performance reviews yet. \nFor the full report, find it on your profile"
+    return (
+        f"Your latest rating is {summary.latest_rating} "
+        f"({summary.latest_review_date:%d %b %Y}). \n"
+        "For the full report, find it on your profile"
+    )
+
+
+def payment_summary(ussd):
+    summary = get_summary(ussd.phone_number)
+    if summary is None:
+        return NOT_REGISTERED
+    if summary.latest_net_pay is None:
+        return "You have no payslips yet. \nLogin to your profile to read the full summary"
+    return (
+        f"Net pay: KES {summary.latest_net_pay:,.2f} for the period ending "
+        f"{summary.latest_pay_period_end:%d %b %Y}.\n"
+        "Login to your profile to read the full summary"
+    )
+
+
+def documents_summary(ussd):
+    summary = get_summary(ussd.phone_number)
+    if summary is not None and summary.pending_docs:
+        return f"You have {summary.pending_docs} document(s) pending upload. \nVisit your profile to upload them"
+    return "The Documents are ready. \nVisit your profile to download"
+
+
+def parse_start_date(text):
+    try:
+        start = datetime.strptime(text, "%d%m%Y").date()
+    except ValueError:
+        raise ValueError("Invalid date.")
+    if start < timezone.localdate():
+        raise ValueError("That date has already passed.")
+    return start
+
+
+def parse_leave_days(text):
+    if not text.isdigit() or not 1 <= int(text) <= MAX_LEAVE_DAYS:
+        raise ValueError(f"Enter a number from 1 to {MAX_LEAVE_DAYS}.")
+    return int(text)
+
+
+def leave_flow(leave_type):
+    def confirm_title(ussd):
+        start = ussd.inputs['start']
+        end = start + timedelta(days=ussd.inputs['days'] - 1)
+        return f"Confirm {leave_type} leave from {start:%d %b %Y} to {end:%d %b %Y}"
+
+    def submit(ussd):
+        summary = get_summary(ussd.phone_number)
+        if summary is None:
+            return NOT_REGISTERED
+
+        start = ussd.inputs['start']
+        # The whole flow ends in this single write
+        LeaveRequest.objects.create(
+            leave_employee_id=summary.employee_id,
+            leave_type=leave_type,
+            leave_start_date=start,
+            leave_end_date=start + timedelta(days=ussd.inputs['days'] - 1),
+            leave_reason="Requested via USSD",
+        )
+        return f"Your {leave_type} leave request has been submitted and is pending review"
+
+    return Prompt('start', "Enter the start date (DDMMYYYY)", parse=parse_start_date, node=Prompt(
+        'days', "Enter the number of days", parse=parse_leave_days, node=Menu(confirm_title, [
+            Option("1", "Confirm", End(submit)),
+            Option("2", "Cancel", End("Your leave request has been cancelled")),
+        ]),
+    ))
+
+
+MENU = Menu("Welcome to ElevateHR", [
+    Option("1", "Clock In/Out", Menu("Select an option:", [
+        Option("1", "Clock In", End(clock_in)),
+        Option("2", "Clock Out", End(clock_out)),
+    ])),
+    Option("2", "Report Status", End(report_status)),
+    Option("3", "Request Leave", Menu("Select leave type:", [
+        Option(str(index), leave_type, leave_flow(leave_type))
+        for index, (leave_type, _) in enumerate(LeaveRequest.LEAVE_TYPES, start=1)
+    ])),
+    Option("4", "Performance Summary", End(performance_summary)),
+    Option("5", "Payment Summary", End(payment_summary)),
+    Option("6", "Download Docs", End(documents_summary)),
+])
+
+# Compiled once at import, every hop is a single lookup in here
+ROUTES = compile_menu(MENU)
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("ElevateHRApp", "0010_smsmessagelog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmployeeSummary",
+            fields=[
+                (
+                    "employee",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="ussd_summary",
+                        serialize=False,
+                        to="ElevateHRApp.employee",
+                    ),
+                ),
+                (
+                    "phone_number",
+                    models.CharField(
+                        db_index=True,
+                        help_text="Normalised, e.g. +254712345678",
+                        max_length=20,
+                    ),
+                ),
+                ("latest_rating", models.IntegerField(blank=True, null=True)),
+                ("latest_review_date", models.DateField(blank=True, null=True)),
+                (
+                    "latest_net_pay",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                ("latest_pay_period_end", models.DateField(blank=True, null=True)),
+                (
+                    "leave_balance",
+                    models.IntegerField(
+                        default=0, help_text="Annual leave days left this year"
+                    ),
+                ),
+                ("pending_docs", models.PositiveSmallIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Employee Summary",
+                "verbose_name_plural": "Employee Summaries",
+            },
+        ),
+    ]
@@ -1,3 +1,25 @@
 from django.db import models
 
 # Create your models here.
+class EmployeeSummary(models.Model):
+    """
+    Everything the USSD menus show for one employee, kept up to date by signals
+    so a hop is a single indexed read by phone number
+    """
+    employee = models.OneToOneField('ElevateHRApp.Employee', on_delete=models.CASCADE, primary_key=True,
+                                    related_name='ussd_summary')
+    phone_number = models.CharField(max_length=20, db_index=True, help_text="Normalised, e.g. +254712345678")
+    latest_rating = models.IntegerField(blank=True, null=True)
+    latest_review_date = models.DateField(blank=True, null=True)
+    latest_net_pay = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    latest_pay_period_end = models.DateField(blank=True, null=True)
+    leave_balance = models.IntegerField(default=0, help_text="Annual leave days left this year")
+    pending_docs = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Employee Summary"
+        verbose_name_plural = "Employee Summaries"
+
+    def __str__(self):
+        return f"Summary for {self.employee_id} ({self.phone_number})"
@@ -0,0 +1,26 @@
+from django.core.cache import caches
+
+
+# The 'ussd' cache is shared by every worker (database cache by default),
+# its TIMEOUT and MAX_ENTRIES give each session a TTL and bound the store
+SESSION_CACHE = 'ussd'
+
+
+def _key(session_id):
+    return f"ussd-session:{session_id}"
+
+
+def load_session(session_id):
+    if not session_id:
+        return None
+    return caches[SESSION_CACHE].get(_key(session_id))
+
+
+def save_session(session_id, state):
+    if session_id:
+        caches[SESSION_CACHE].set(_key(session_id), state)
+
+
+def end_session(session_id):
+    if session_id:
+        caches[SESSION_CACHE].delete(_key(session_id))
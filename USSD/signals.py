@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ElevateHRApp.models import Employee, LeaveRequest, Payslip, PerformanceReview
+from ElevateHRApp.signals import employee_changed
+from . import summaries
+
+
+@receiver(post_save, sender=Employee)
+def refresh_employee_summary(sender, instance, created, **kwargs):
+    if employee_changed(instance, created, ('phone_number', *summaries.REQUIRED_DOCUMENTS)):
+        summaries.employee_saved(instance)
+
+
+@receiver(post_save, sender=PerformanceReview)
+def refresh_review_summary(sender, instance, created, **kwargs):
+    summaries.review_saved(instance, created)
+
+
+@receiver(post_delete, sender=PerformanceReview)
+def rebuild_review_summary(sender, instance, **kwargs):
+    summaries.record_deleted(instance.performance_employee_id)
+
+
+@receiver(post_save, sender=Payslip)
+def refresh_payslip_summary(sender, instance, created, **kwargs):
+    summaries.payslip_saved(instance, created)
+
+
+@receiver(post_delete, sender=Payslip)
+def rebuild_payslip_summary(sender, instance, **kwargs):
+    summaries.record_deleted(instance.employee_id)
+
+
+@receiver(post_save, sender=LeaveRequest)
+def refresh_leave_summary(sender, instance, **kwargs):
+    summaries.leave_changed(instance.leave_employee_id)
+
+
+@receiver(post_delete, sender=LeaveRequest)
+def refresh_leave_summary_after_delete(sender, instance, **kwargs):
+    summaries.leave_changed(instance.leave_employee_id, deleted=True)
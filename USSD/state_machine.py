@@ -0,0 +1,156 @@
+from collections import namedtuple
+
+
+# What Africa's Talking sends on every hop of a session, plus the values collected by prompts so far
+UssdRequest = namedtuple(
+    'UssdRequest', ['session_id', 'service_code', 'phone_number', 'text', 'inputs'], defaults=(None,)
+)
+
+# Path segment standing for any value typed at a Prompt
+INPUT = "#"
+
+
+class Menu:
+    """
+    A CON screen listing its options, the title can be a handler
+    """
+
+    def __init__(self, title, options):
+        self.title = title
+        self.options = options
+
+    def __call__(self, ussd):
+        title = self.title(ussd) if callable(self.title) else self.title
+        response = f"CON {title} \n"
+        for option in self.options:
+            response += f"{option.key}. {option.label} \n"
+        return response
+
+
+class Option:
+    def __init__(self, key, label, node):
+        self.key = key
+        self.label = label
+        self.node = node
+
+
+class Prompt:
+    """
+    A CON screen asking for free text, parse turns the text into the value
+    stored under name or raises ValueError with the message to show
+    """
+
+    def __init__(self, name, prompt, node, parse=str):
+        self.name = name
+        self.prompt = prompt
+        self.node = node
+        self.parse = parse
+
+    def __call__(self, ussd, error=None):
+        if error:
+            return f"CON {error} \n{self.prompt}"
+        return f"CON {self.prompt}"
+
+
+class End:
+    """
+    A final screen, either fixed text or a handler returning the text to show
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+    def __call__(self, ussd):
+        message = self.message(ussd) if callable(self.message) else self.message
+        return f"END {message}"
+
+
+def _child_path(path, key):
+    return f"{path}*{key}" if path else key
+
+
+def compile_menu(root):
+    """
+    Flattens the menu tree into {path: node}, where path is the cumulative
+    input Africa's Talking sends (e.g. "1*2") with INPUT in place of typed
+    values, so dispatch is one dict lookup per hop
+    """
+    routes = {}
+    stack = [("", root)]
+    while stack:
+        path, node = stack.pop()
+        if path in routes:
+            raise ValueError(f"Duplicate USSD path {path!r}")
+        routes[path] = node
+
+        if isinstance(node, Prompt):
+            stack.append((_child_path(path, INPUT), node.node))
+        for option in getattr(node, 'options', ()):
+            stack.append((_child_path(path, option.key), option.node))
+    return routes
+
+
+def advance(routes, path, segment, inputs):
+    """
+    Moves one hop from path, returns (path, error); path is None for an unknown option
+    """
+    node = routes[path]
+    if isinstance(node, Prompt):
+        try:
+            inputs[node.name] = node.parse(segment)
+        except ValueError as e:
+            # Stay on the prompt, the next segment is another attempt at it
+            return path, str(e)
+        return _child_path(path, INPUT), None
+
+    child = _child_path(path, segment)
+    return (child, None) if child in routes else (None, None)
+
+
+def resolve(routes, text, session=None):
+    """
+    Finds the node for text, returns (path, inputs, error).
+    With the previous hop's session state only the newest segment is looked at,
+    without it the whole text is replayed from the root.
+    """
+    if session is not None:
+        previous = session['text']
+        if previous and text.startswith(f"{previous}*"):
+            segment = text[len(previous) + 1:]
+        elif not previous and text:
+            segment = text
+        else:
+            segment = None
+
+        if segment is not None and "*" not in segment:
+            inputs = dict(session['inputs'])
+            path, error = advance(routes, session['path'], segment, inputs)
+            return path, inputs, error
+
+    if INPUT not in text and text in routes:
+        return text, {}, None
+
+    path, inputs, error = "", {}, None
+    for segment in text.split("*") if text else ():
+        path, error = advance(routes, path, segment, inputs)
+        if path is None:
+            break
+    return path, inputs, error
+
+
+def dispatch(routes, ussd, session=None):
+    """
+    Returns (response, session state to keep for the next hop or None when the session ends)
+    """
+    text = ussd.text or ""
+    path, inputs, error = resolve(routes, text, session)
+    if path is None:
+        return "END Invalid option. Please try again", None
+
+    node = routes[path]
+    ussd = ussd._replace(text=text, inputs=inputs)
+    response = node(ussd, error) if isinstance(node, Prompt) else node(ussd)
+
+    if response.startswith("CON"):
+        return response, {'path': path, 'text': text, 'inputs': inputs}
+    return response, None
@@ -0,0 +1,174 @@
+from collections import defaultdict
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from ElevateHRApp.models import Employee, LeaveRequest, Payslip, PerformanceReview
+from ElevateHRApp.phone import normalise_phone
+from .models import EmployeeSummary
+
+
+ANNUAL_LEAVE_DAYS = LeaveRequest.ANNUAL_LEAVE_DAYS
+REQUIRED_DOCUMENTS = ('resume', 'contract_file', 'profile_picture')
+REBUILD_BATCH_SIZE = 2000
+
+SUMMARY_FIELDS = [
+    'phone_number', 'latest_rating', 'latest_review_date', 'latest_net_pay',
+    'latest_pay_period_end', 'leave_balance', 'pending_docs', 'updated_at',
+]
+
+
+def get_summary(phone_number):
+    """
+    The caller's summary, None for an unknown number and for one that more
+    than one employee has, which can't say whose pay or leave to show
+    """
+    phone = normalise_phone(phone_number)
+    summaries = list(EmployeeSummary.objects.filter(phone_number=phone)[:2])
+    if len(summaries) > 1:
+        print(f'USSD: {phone} belongs to more than one employee')
+        return None
+    return summaries[0] if summaries else None
+
+
+def pending_documents(values):
+    return sum(1 for field in REQUIRED_DOCUMENTS if not values.get(field))
+
+
+def annual_leave_taken(employee_ids, year=None):
+    """
+    {employee_ID: approved annual leave days} for the year, in one query
+    """
+    year = year or timezone.localdate().year
+    taken = defaultdict(int)
+    leaves = LeaveRequest.objects.filter(
+        leave_employee_id__in=employee_ids,
+        leave_type='Annual',
+        leave_status='Approved',
+        leave_start_date__year=year,
+    ).values_list('leave_employee_id', 'leave_start_date', 'leave_end_date')
+
+    for employee_id, start, end in leaves:
+        taken[employee_id] += max((end - start).days + 1, 0)
+    return taken
+
+
+def rebuild_summaries(employee_ids=None):
+    """
+    Recomputes summary rows from scratch, for the given employees or everyone
+    """
+    latest_review = PerformanceReview.objects.filter(
+        performance_employee=OuterRef('pk')
+    ).order_by('-performance_review_date', '-id')
+    latest_payslip = Payslip.objects.filter(employee=OuterRef('pk')).order_by('-pay_period_end', '-id')
+
+    employees = Employee.objects.order_by('pk')
+    if employee_ids is not None:
+        employees = employees.filter(pk__in=list(employee_ids))
+
+    rows = employees.annotate(
+        latest_rating=Subquery(latest_review.values('performance_rating')[:1]),
+        latest_review_date=Subquery(latest_review.values('performance_review_date')[:1]),
+        latest_net_pay=Subquery(latest_payslip.values('net_salary')[:1]),
+        latest_pay_period_end=Subquery(latest_payslip.values('pay_period_end')[:1]),
+    ).values(
+        'pk', 'phone_number', 'latest_rating', 'latest_review_date',
+        'latest_net_pay', 'latest_pay_period_end', *REQUIRED_DOCUMENTS,
+    )
+
+    written = 0
+    batch = []
+    for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+        batch.append(row)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            written += _write_batch(batch)
+            batch = []
+    if batch:
+        written += _write_batch(batch)
+    return written
+
+
+def _write_batch(rows):
+    taken = annual_leave_taken([row['pk'] for row in rows])
+    now = timezone.now()
+    summaries = [
+        EmployeeSummary(
+            employee_id=row['pk'],
+            phone_number=normalise_phone(row['phone_number']),
+            latest_rating=row['latest_rating'],
+            latest_review_date=row['latest_review_date'],
+            latest_net_pay=row['latest_net_pay'],
+            latest_pay_period_end=row['latest_pay_period_end'],
+            leave_balance=ANNUAL_LEAVE_DAYS - taken[row['pk']],
+            pending_docs=pending_documents(row),
+            updated_at=now,
+        )
+        for row in rows
+    ]
+    EmployeeSummary.objects.bulk_create(
+        summaries, update_conflicts=True, unique_fields=['employee'], update_fields=SUMMARY_FIELDS,
+    )
+    return len(summaries)
+
+
+# Incremental refreshes, each touching only the columns the saved row can change
+
+def employee_saved(employee):
+    values = {field: getattr(employee, field) for field in REQUIRED_DOCUMENTS}
+    updated = EmployeeSummary.objects.filter(employee_id=employee.pk).update(
+        phone_number=normalise_phone(employee.phone_number),
+        pending_docs=pending_documents(values),
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        rebuild_summaries([employee.pk])
+
+
+def review_saved(review, created):
+    if not created:
+        # An edit can move the latest review backwards, recompute it
+        return rebuild_summaries([review.performance_employee_id])
+
+    updated = EmployeeSummary.objects.filter(employee_id=review.performance_employee_id).filter(
+        Q(latest_review_date__isnull=True) | Q(latest_review_date__lte=review.performance_review_date)
+    ).update(
+        latest_rating=review.performance_rating,
+        latest_review_date=review.performance_review_date,
+        updated_at=timezone.now(),
+    )
+    if not updated and not EmployeeSummary.objects.filter(employee_id=review.performance_employee_id).exists():
+        rebuild_summaries([review.performance_employee_id])
+
+
+def payslip_saved(payslip, created):
+    if not created:
+        return rebuild_summaries([payslip.employee_id])
+
+    updated = EmployeeSummary.objects.filter(employee_id=payslip.employee_id).filter(
+        Q(latest_pay_period_end__isnull=True) | Q(latest_pay_period_end__lte=payslip.pay_period_end)
+    ).update(
+        latest_net_pay=payslip.net_salary,
+        latest_pay_period_end=payslip.pay_period_end,
+        updated_at=timezone.now(),
+    )
+    if not updated and not EmployeeSummary.objects.filter(employee_id=payslip.employee_id).exists():
+        rebuild_summaries([payslip.employee_id])
+
+
+def leave_changed(employee_id, deleted=False):
+    taken = annual_leave_taken([employee_id])
+    updated = EmployeeSummary.objects.filter(employee_id=employee_id).update(
+        leave_balance=ANNUAL_LEAVE_DAYS - taken[employee_id],
+        updated_at=timezone.now(),
+    )
+    if not updated and not deleted:
+        rebuild_summaries([employee_id])
+
+
+def record_deleted(employee_id):
+    """
+    Recomputes the summary after a review or payslip is deleted, only if it
+    still exists: deleting the employee cascades to both, and a summary
+    written back then would point at an employee about to be gone
+    """
+    if EmployeeSummary.objects.filter(employee_id=employee_id).exists():
+        rebuild_summaries([employee_id])
@@ -1,3 +1,225 @@
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
 from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock
+
+from ElevateHRApp.models import Attendance, Employee, LeaveRequest, Payslip, PerformanceReview, SmsMessageLog
+from ElevateHRApp.tests import create_employee
+from .attendance import attendance_buffer, employee_for_phone, record_clock_event
+from .menu import MENU, NOT_REGISTERED, ROUTES
+from .models import EmployeeSummary
+from .summaries import ANNUAL_LEAVE_DAYS, get_summary, rebuild_summaries
+from .state_machine import INPUT, Menu, Prompt, End
+
 
 # Create your tests here.
+class UssdTestCase(TestCase):
+    def setUp(self):
+        # The phone lookup cache and the attendance buffer outlive each test's database rollback
+        cache.clear()
+        self.addCleanup(attendance_buffer.items.clear)
+        # No flusher thread, the tests flush when they mean to
+        patcher = mock.patch.object(attendance_buffer, 'interval', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class UssdReplayTests(UssdTestCase):
+    """
+    Replays every compiled menu path through the view, the way Africa's Talking sends them
+    """
+
+    # Values typed at each Prompt while replaying
+    SAMPLE_INPUTS = {
+        'start': (date.today() + timedelta(days=7)).strftime("%d%m%Y"),
+        'days': "3",
+    }
+
+    def concrete_text(self, path):
+        # Swap every INPUT segment for a sample value for the prompt it answers
+        walked, segments = "", []
+        for segment in path.split("*") if path else ():
+            if segment == INPUT:
+                prompt = ROUTES[walked]
+                self.assertIsInstance(prompt, Prompt)
+                segments.append(self.SAMPLE_INPUTS[prompt.name])
+            else:
+                segments.append(segment)
+            walked = f"{walked}*{segment}" if walked else segment
+        return "*".join(segments)
+
+    def replay(self, text, phone_number="+254712345678", session_id="ATUid_test"):
+        return self.client.post('/ussd/', {
+            'sessionId': session_id,
+            'serviceCode': '*384*123#',
+            'phoneNumber': phone_number,
+            'text': text,
+        })
+
+    def test_every_path_responds(self):
+        for path, node in ROUTES.items():
+            with self.subTest(path=path):
+                # A fresh session id per path, so the text is replayed from the root
+                response = self.replay(self.concrete_text(path), session_id=f"replay-{path}")
+                self.assertEqual(response.status_code, 200)
+
+                body = response.content.decode()
+                if isinstance(node, Menu):
+                    self.assertTrue(body.startswith("CON "))
+                    for option in node.options:
+                        self.assertIn(f"{option.key}. {option.label}", body)
+                        self.assertIn(f"{path}*{option.key}" if path else option.key, ROUTES)
+                elif isinstance(node, Prompt):
+                    self.assertEqual(body, node(None))
+                    self.assertIn(f"{path}*{INPUT}", ROUTES)
+                else:
+                    self.assertIsInstance(node, End)
+                    self.assertTrue(body.startswith("END "))
+
+    def test_root_menu_lists_all_options(self):
+        body = self.replay("").content.decode()
+        for option in MENU.options:
+            self.assertIn(f"{option.key}. {option.label}", body)
+
+    def test_unknown_path_ends_session(self):
+        for text in ("9", "1*9", "2*1", "1*1*1"):
+            with self.subTest(text=text):
+                self.assertTrue(self.replay(text).content.decode().startswith("END "))
+
+    def test_simulated_reports_need_a_server(self):
+        with self.assertRaises(CommandError):
+            call_command('simulate_ussd', sessions=1, delivery_reports=5)
+        self.assertFalse(SmsMessageLog.objects.exists())
+
+
+class EmployeeSummaryTests(UssdTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employee = create_employee(phone_number='0712345678')
+
+    def test_summary_follows_saved_records(self):
+        PerformanceReview.objects.create(
+            performance_employee=self.employee, performance_review_date=date(2026, 3, 1),
+            performance_reviewer='HR', performance_rating=3, performance_comments='',
+        )
+        PerformanceReview.objects.create(
+            performance_employee=self.employee, performance_review_date=date(2026, 6, 1),
+            performance_reviewer='HR', performance_rating=4, performance_comments='',
+        )
+        Payslip.objects.create(
+            employee=self.employee, pay_period_start=date(2026, 9, 1), pay_period_end=date(2026, 9, 30),
+            basic_salary=85000, income_tax=15000,
+        )
+        today = date.today()
+        LeaveRequest.objects.create(
+            leave_employee=self.employee, leave_type='Annual', leave_start_date=today, leave_end_date=today,
+            leave_reason='', leave_status='Approved',
+        )
+
+        summary = get_summary('+254 712 345 678')
+        self.assertEqual(summary.latest_rating, 4)
+        self.assertEqual(summary.latest_net_pay, 70000)
+        self.assertEqual(summary.leave_balance, ANNUAL_LEAVE_DAYS - 1)
+        self.assertEqual(summary.pending_docs, 3)
+
+        incremental = EmployeeSummary.objects.values().get()
+        EmployeeSummary.objects.all().delete()
+        rebuild_summaries()
+        rebuilt = EmployeeSummary.objects.values().get()
+        incremental.pop('updated_at'), rebuilt.pop('updated_at')
+        self.assertEqual(incremental, rebuilt)
+
+    def test_summary_follows_a_new_phone_number(self):
+        self.employee.phone_number = '0799999999'
+        self.employee.save()
+        self.assertIsNone(get_summary('0712345678'))
+        self.assertEqual(get_summary('0799999999').employee_id, self.employee.pk)
+
+    def test_shared_phone_numbers_are_refused(self):
+        self.assertEqual(employee_for_phone('0712345678'), self.employee.pk)
+        cache.clear()
+        create_employee(2, phone_number='+254712345678')
+        # Neither employee's pay, leave or attendance is given to the caller
+        with mock.patch('builtins.print'):
+            self.assertIsNone(get_summary('0712345678'))
+            self.assertIsNone(employee_for_phone('0712345678'))
+            self.assertContains(self.client.post('/ussd/', {
+                'sessionId': "ATUid_shared", 'serviceCode': '*384*123#', 'phoneNumber': '+254712345678', 'text': "1*1",
+            }), NOT_REGISTERED)
+        self.assertFalse(attendance_buffer.items)
+
+    def test_deleting_records_and_the_employee(self):
+        PerformanceReview.objects.create(
+            performance_employee=self.employee, performance_review_date=date(2026, 3, 1),
+            performance_reviewer='HR', performance_rating=3, performance_comments='',
+        )
+        payslip = Payslip.objects.create(
+            employee=self.employee, pay_period_start=date(2026, 9, 1), pay_period_end=date(2026, 9, 30),
+            basic_salary=85000,
+        )
+        LeaveRequest.objects.create(
+            leave_employee=self.employee, leave_type='Annual', leave_start_date=date.today(),
+            leave_end_date=date.today(), leave_reason='', leave_status='Approved',
+        )
+        payslip.delete()
+        self.assertIsNone(get_summary('0712345678').latest_net_pay)
+
+        # The cascade deletes the summary along with the records, none is written back
+        self.employee.delete()
+        self.assertFalse(Employee.objects.exists())
+        self.assertFalse(EmployeeSummary.objects.exists())
+
+    def test_leave_request_flow(self):
+        start = date.today() + timedelta(days=7)
+        hops = ["3", "3*2", "3*2*31022020", f"3*2*31022020*{start:%d%m%Y}", f"3*2*31022020*{start:%d%m%Y}*5"]
+        for text in hops:
+            body = self.client.post('/ussd/', {'sessionId': 'leave', 'phoneNumber': '0712345678', 'text': text}).content
+            self.assertTrue(body.startswith(b"CON "), body)
+            self.assertFalse(LeaveRequest.objects.exists())
+        self.assertIn(b"Invalid date", self.client.post('/ussd/', {
+            'sessionId': 'other', 'phoneNumber': '0712345678', 'text': hops[2],
+        }).content)
+
+        response = self.client.post('/ussd/', {'sessionId': 'leave', 'phoneNumber': '0712345678', 'text': f"{hops[-1]}*1"})
+        self.assertContains(response, "pending review")
+
+        leave = LeaveRequest.objects.get()
+        self.assertEqual((leave.leave_employee, leave.leave_type), (self.employee, 'Annual'))
+        self.assertEqual((leave.leave_start_date, leave.leave_end_date), (start, start + timedelta(days=4)))
+
+    def test_clock_in_and_out_are_buffered(self):
+        for text in ("1*1", "1*1", "1*2"):
+            response = self.client.post('/ussd/', {'sessionId': text, 'phoneNumber': '0712345678', 'text': text})
+            self.assertContains(response, "successfully clocked")
+        self.assertFalse(Attendance.objects.exists())
+
+        attendance_buffer.flush()
+        record_clock_event(self.employee.pk, 'in')
+        attendance_buffer.flush()
+
+        attendance = Attendance.objects.get()
+        self.assertEqual((attendance.attendance_employee, attendance.attendance_status), (self.employee, 'Present'))
+        self.assertIsNotNone(attendance.attendance_check_in)
+        self.assertIsNotNone(attendance.attendance_check_out)
+
+    def test_unwritable_attendance_is_dropped(self):
+        record_clock_event(self.employee.pk, 'in')
+        with mock.patch.object(attendance_buffer, 'write', side_effect=DatabaseError("locked")), \
+                mock.patch('builtins.print'):
+            for _ in range(attendance_buffer.attempts - 1):
+                attendance_buffer.flush()
+                self.assertEqual(len(attendance_buffer.items), 1)
+            with self.assertLogs('ElevateHRApp.write_behind', level='ERROR') as logs:
+                attendance_buffer.flush()
+        self.assertEqual(attendance_buffer.items, [])
+        [message] = logs.output
+        self.assertIn(f"Dropped attendance events after 3 failed writes: ({self.employee.pk}, ", message)
+        self.assertIsNone(attendance_buffer.flusher)
+
+    def test_menu_lookup_is_one_read(self):
+        # One session lookup, one summary lookup
+        with self.assertNumQueries(2):
+            response = self.client.post('/ussd/', {'sessionId': 's', 'phoneNumber': '+254712345678', 'text': '5'})
+        self.assertContains(response, "no payslips yet")